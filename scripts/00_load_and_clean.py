@@ -5,13 +5,36 @@ Created on Sun Apr  6 10:36:54 2025
 @author: Diak
 """
 
+import os
 import pandas as pd
 import numpy as np
+from storage import write_table
+from profiling import PipelineProfiler
+from validation import check_tables, summary, RESULT_DIR
+from keys import KeyDictionary, in_dictionary
+from cleaning import (
+    normalize_column_names, drop_unnamed_columns, clean_author, clean_data_2019,
+    clean_ranking, normalize_institution_doi, fix_known_institutions
+)
 
 # Set display options
 pd.set_option("display.max_columns", 50)    
 
+# Interactive inspection (head / info / null counts / samples of every frame).
+# Production runs skip it with PIPELINE_FAST=1; the checks of validation.py
+# (section 8) run either way
+INSPECT = os.environ.get('PIPELINE_FAST') != '1'
+
+# For dumps that do not fit in memory, run the same cleaning in chunks instead:
+#     python scripts/cleaning.py --chunk-size 200000
+
+# Time, memory and row counts of every section, reported in results/profiling/
+# (trace_memory=True for allocation peaks, profile_dir='results/profiling/prof'
+# for a cProfile dump of every section)
+profiler = PipelineProfiler('00_load_and_clean', globals())
+
 # === 1. Load raw data ===
+profiler.stage('1. Load raw data')
 df_author = pd.read_csv('data/merged_author_data.csv', encoding='utf-8', )
 df_data_2019 = pd.read_csv('data/data_2019.csv', encoding='utf-8')
 df_ranking = pd.read_csv('data/2019_rankings.csv', encoding='utf-8')
@@ -20,228 +43,187 @@ df_institution = pd.read_csv('data/merged_institutions_data.csv', encoding='utf-
 
 
 # === 2. Normalize column names ===
+profiler.stage('2. Normalize column names')
 for df in [df_author, df_institution, df_ranking, df_data_2019]:
-    df.columns = (
-        df.columns
-        .str.strip()
-        .str.lower()
-        .str.replace(' ', '_')
-        .str.replace(r'[^\w\d_]', '', regex=True)
-    )
+    normalize_column_names(df)
     
-print(df_data_2019.filter(like='unnamed').head())
+if INSPECT:
+    print(df_data_2019.filter(like='unnamed').head())
 
 # === 3. Drop unnamed columns if they exist ===
+profiler.stage('3. Drop unnamed columns if they exist')
 for df in [df_author, df_institution, df_ranking, df_data_2019]:
-    unnamed_cols = [col for col in df.columns if col.startswith('unnamed')]
-    df.drop(columns=unnamed_cols, inplace=True)
+    drop_unnamed_columns(df)
     
     
 # === 4. Inspect df_author structure ===    
-# Check the first few rows and general info
-print(df_author.head())
-print(df_author.info())
-print(df_author.columns)
+profiler.stage('4. Inspect df_author structure')
+if INSPECT:
+    # Check the first few rows and general info
+    print(df_author.head())
+    print(df_author.info())
+    print(df_author.columns)
 
-# Check nulls
-print(df_author.isnull().sum())
+    # Check nulls
+    print(df_author.isnull().sum())
 
 # Drop completely empty 'last_known_institution' column
-df_author.drop(columns=['last_known_institution'], inplace=True)
+df_author = clean_author(df_author)
 
-# Check duplicated authors
-print(df_author[df_author.duplicated(subset='author', keep=False)])
+if INSPECT:
+    # Check duplicated authors
+    print(df_author[df_author.duplicated(subset='author', keep=False)])
 
 
 
 # === 5. Inspect df_data_2019 structure ===    
-# Check the first few rows and general info
-print(df_data_2019.head())
-print(df_data_2019.info())
-print(df_data_2019.columns)
-
-# Count missing values in each column
-missing_counts = df_data_2019.isnull().sum()
-print(missing_counts[missing_counts > 0].sort_values(ascending=False))
+profiler.stage('5. Inspect df_data_2019 structure')
+if INSPECT:
+    # Check the first few rows and general info
+    print(df_data_2019.head())
+    print(df_data_2019.info())
+    print(df_data_2019.columns)
 
-# Essential columns *required* to be present
-essential_cols = ['altmetric_id', 'doi', 'pubdate', 'code']
-non_essential_cols = [col for col in df_data_2019.columns if col not in essential_cols]
+    # Count missing values in each column
+    missing_counts = df_data_2019.isnull().sum()
+    print(missing_counts[missing_counts > 0].sort_values(ascending=False))
 
-# Check if there are rows where all other fields are empty
-only_essential = df_data_2019[non_essential_cols].isnull().all(axis=1)
-print(f"Rows wich are empty except altmetric_id, doi, pubdate): {only_essential.sum()} / {len(df_data_2019)}")
+    # Essential columns *required* to be present (checked in section 8)
+    essential_cols = ['altmetric_id', 'doi', 'pubdate', 'code']
+    non_essential_cols = [col for col in df_data_2019.columns if col not in essential_cols]
 
-# Fill missing codes with a placeholder
-df_data_2019['code'] = df_data_2019['code'].fillna('unknown')
+    # Check if there are rows where all other fields are empty
+    only_essential = df_data_2019[non_essential_cols].isnull().all(axis=1)
+    print(f"Rows wich are empty except altmetric_id, doi, pubdate): {only_essential.sum()} / {len(df_data_2019)}")
 
-# Fill NaN values in altmetric-type columns with 0 (assuming missing means "no mention")
-altmetric_cols = [
-    'linkedin', 'misc', 'facebook', 'googleplus', 'video', 'weibo', 'twitter', 'wikipedia',
-    'blogs', 'news', 'reddit', 'policy', 'patent', 'qa', 'pinterest', 'syllabi', 'f1000',
-    'book_reviews', 'peer_reviews', 'stot', 'stot_log', 'stot_log_stand', 'stot_log_jb_stand'
-]
+# Fill missing codes with a placeholder, fill NaN values in altmetric-type
+# columns with 0 (assuming missing means "no mention"), convert publication
+# date to datetime format and normalize DOIs (strip, lowercase)
+df_data_2019 = clean_data_2019(df_data_2019)
 
-df_data_2019[altmetric_cols] = df_data_2019[altmetric_cols].fillna(0)
-
-# Convert publication date to datetime format
-df_data_2019['pubdate'] = pd.to_datetime(df_data_2019['pubdate'], errors='coerce')
-
-# Check
-print(df_data_2019['pubdate'].dtype)
-print(df_data_2019['pubdate'].min(), '→', df_data_2019['pubdate'].max())
+if INSPECT:
+    print(df_data_2019['pubdate'].dtype)
+    print(df_data_2019['pubdate'].min(), '→', df_data_2019['pubdate'].max())
 
 
 
 # === 6. Inspect df_ranking structure === 
-print(df_ranking.head())
-print(df_ranking.info())
-print(df_ranking.columns)
-
-# Remove commas and convert to numeric
-df_ranking['stats_number_students'] = (
-    df_ranking['stats_number_students']
-    .str.replace(',', '')
-    .astype(float)
-)
+profiler.stage('6. Inspect df_ranking structure')
+if INSPECT:
+    print(df_ranking.head())
+    print(df_ranking.info())
+    print(df_ranking.columns)
 
-# Clean and convert 'stats_pc_intl_students' safely
-df_ranking['stats_pc_intl_students'] = (
-    df_ranking['stats_pc_intl_students']
-    .astype(str)                          # Ensure string type
-    .str.strip()                          # Remove leading/trailing spaces
-    .replace('', np.nan)                  # Replace truly empty strings with NaN
-    .str.replace('%', '', regex=False)    # Remove percentage symbol
-    .replace('', np.nan)                  # In case removing '%' left an empty string
-    .astype(float)                        # Finally convert to float
-)
+# Numeric students / international share, split stats_female_male_ratio
+# into numeric columns and clean rank column to numeric format (rank_clean)
+df_ranking = clean_ranking(df_ranking)
 
-# Split stats_female_male_ratio into numeric columns
-def split_gender_ratio(ratio):
-    try:
-        female, male = ratio.split(':')
-        total = int(female.strip()) + int(male.strip())
-        return int(female.strip()) / total * 100, int(male.strip()) / total * 100
-    except:
-        return np.nan, np.nan
-
-# Apply the function and create two new numeric columns
-df_ranking[['female_pct', 'male_pct']] = df_ranking['stats_female_male_ratio'].apply(
-    lambda x: pd.Series(split_gender_ratio(x))
-)
+if INSPECT:
+    print(df_ranking[['stats_female_male_ratio', 'female_pct', 'male_pct']].dropna().head())
 
-print(df_ranking[['stats_female_male_ratio', 'female_pct', 'male_pct']].dropna().head())
-
-# Clean rank column to numeric format (rank_clean) 
-# Function to convert rank values to numeric
-def clean_rank(value):
-    if pd.isnull(value):
-        return np.nan
-    value = str(value).strip()
-    if value.startswith('='):
-        return int(value[1:])
-    if '–' in value or '-' in value:
-        parts = value.replace('–', '-').split('-')
-        try:
-            nums = list(map(int, parts))
-            return sum(nums) / len(nums)
-        except:
-            return np.nan
-    if value.endswith('+'):
-        try:
-            return float(value.replace('+', ''))
-        except:
-            return np.nan
-    if '>' in value:
-        try:
-            return float(value.replace('>', ''))
-        except:
-            return np.nan
-    try:
-        return float(value)
-    except:
-        return np.nan
-
-# Apply updated function
-df_ranking['rank_clean'] = df_ranking['rank'].apply(clean_rank)
-
-print(df_ranking[['rank', 'rank_clean']].head(10))
-print(df_ranking['rank_clean'].isnull().sum(), 'missing values in rank_clean')
+    print(df_ranking[['rank', 'rank_clean']].head(10))
+    print(df_ranking['rank_clean'].isnull().sum(), 'missing values in rank_clean')
 
 
 
 
 # === 7. Inspect df_institution structure === 
-# Check the first few rows and general info
-print(df_institution.head())
-print(df_institution.info())
-print(df_institution.columns)
-
-# Filter institutional data to only include 2019 publications
-print(df_data_2019['pub_year'].unique())
-print(df_data_2019['pubdate'].dt.year.unique())
-df_data_2019['all_citaitons'].describe()
-
-# Normalize DOI formats in both datasets
-print(df_data_2019['doi'].dropna().sample(5))
-print(df_institution['doi'].dropna().sample(5))
-
-df_data_2019['doi'] = df_data_2019['doi'].str.strip().str.lower()
-df_institution['doi'] = df_institution['doi'].str.strip().str.lower()
-
-# Remove 'https://doi.org/' prefix from institution DOIs
-df_institution['doi'] = df_institution['doi'].str.replace('https://doi.org/', '', regex=False)
-
+profiler.stage('7. Inspect df_institution structure')
+if INSPECT:
+    # Check the first few rows and general info
+    print(df_institution.head())
+    print(df_institution.info())
+    print(df_institution.columns)
+
+    # Filter institutional data to only include 2019 publications
+    print(df_data_2019['pub_year'].unique())
+    print(df_data_2019['pubdate'].dt.year.unique())
+    df_data_2019['all_citaitons'].describe()
+
+    # Normalize DOI formats in both datasets
+    print(df_data_2019['doi'].dropna().sample(5))
+    print(df_institution['doi'].dropna().sample(5))
+
+# Lowercase institution DOIs and remove 'https://doi.org/' prefix
+# (publication DOIs were normalized in section 5)
+df_institution = normalize_institution_doi(df_institution)
+
+
+# Dense integer keys of DOIs and authors (keys.py), used for the joins from here on
+doi_keys = KeyDictionary.build('doi', df_data_2019['doi'])
+author_keys = KeyDictionary.build('author', df_author['author'], df_institution['author'])
+df_data_2019['doi_key'] = doi_keys.lookup(df_data_2019['doi'])
+df_author['author_key'] = author_keys.lookup(df_author['author'])
+df_institution['doi_key'] = doi_keys.lookup(df_institution['doi'])
+df_institution['author_key'] = author_keys.lookup(df_institution['author'])
+print(len(doi_keys), 'distinct DOIs,', len(author_keys), 'distinct authors')
 
 # Keep only rows where the DOI exists in the 2019 dataset
-df_institution_2019 = df_institution[df_institution['doi'].isin(df_data_2019['doi'])]
-print(len(df_institution_2019))
+in_2019 = in_dictionary(df_institution['doi_key'], df_data_2019['doi'].isna().any())
+df_institution_2019 = df_institution[in_2019]
+if INSPECT:
+    print(len(df_institution_2019))
 
-
-# Show a few non-null values if any
-print(df_institution_2019['raw_affiliation_string'].dropna().count())
+    # Show a few non-null values if any
+    print(df_institution_2019['raw_affiliation_string'].dropna().count())
 
 # Drop the 'raw_affiliation_string' column because it contains only missing values
 df_institution_2019.drop(columns=['raw_affiliation_string'], inplace=True)
 
 # Check how many rows are exact duplicates and if they are drop them
-print("Exact duplicates:", df_institution_2019.duplicated().sum())
-duplicates = df_institution_2019[df_institution_2019.duplicated(keep=False)]
+if INSPECT:
+    print("Exact duplicates:", df_institution_2019.duplicated().sum())
+    duplicates = df_institution_2019[df_institution_2019.duplicated(keep=False)]
 
-df_institution_2019 = df_institution[df_institution['doi'].isin(df_data_2019['doi'])].copy()
+df_institution_2019 = df_institution[in_2019].copy()
 df_institution_2019.drop_duplicates(inplace=True)
 
 
-# Check missing values in key columns
-print(df_institution_2019[['author', 'institutions', 'display_name', 'country_code']].isnull().sum())
-
+if INSPECT:
+    # Check missing values in key columns
+    print(df_institution_2019[['author', 'institutions', 'display_name', 'country_code']].isnull().sum())
 
-missing_display = df_institution_2019[df_institution_2019['display_name'].isnull()]
-print(missing_display[['doi', 'author', 'institutions', 'country_code']].head(10))
+    missing_display = df_institution_2019[df_institution_2019['display_name'].isnull()]
+    print(missing_display[['doi', 'author', 'institutions', 'country_code']].head(10))
 
 
 # Fill missing display_name and country_code for that specific institution
-df_institution_2019.loc[
-    df_institution_2019['institutions'] == 'https://openalex.org/I4210154534',
-    'display_name'
-] = 'Instituto de Investigacións Mariñas'
+df_institution_2019 = fix_known_institutions(df_institution_2019)
+
 
-df_institution_2019.loc[
-    df_institution_2019['institutions'] == 'https://openalex.org/I4210154534',
-    'country_code'
-] = 'ES'
+# === 8. Validate cleaned tables ===
+profiler.stage('8. Validate cleaned tables')
+# Dtypes, essential non-null columns, DOI format, rank ranges and gender
+# ratio sums (validation.py); one row per check in results/validation/
+validation_report = check_tables({
+    'author_clean': df_author,
+    'data_2019_clean': df_data_2019,
+    'institution_2019_clean': df_institution_2019,
+    'ranking_clean': df_ranking,
+})
+os.makedirs(RESULT_DIR, exist_ok=True)
+validation_report.to_csv(os.path.join(RESULT_DIR, 'cleaned_tables.csv'), index=False)
+print(summary(validation_report))
 
 
-# === 8. Save cleaned dataframes to CSV ===
+# === 9. Save cleaned dataframes as typed Parquet ===
+profiler.stage('9. Save cleaned dataframes as typed Parquet')
+# Schemas (categoricals, datetime pubdate, float32 counts) are in storage.py
 
 # Save cleaned author data
-df_author.to_csv('cleaned_data/author_clean.csv', index=False, encoding='utf-8', sep = '|')
+write_table(df_author, 'author_clean')
 
 # Save cleaned institution data (2019 only)
-df_institution_2019.to_csv('cleaned_data/institution_2019_clean.csv', index=False, encoding='utf-8', sep = '|' )
+write_table(df_institution_2019, 'institution_2019_clean')
 
 # Save cleaned data_2019
-df_data_2019.to_csv('cleaned_data/data_2019_clean.csv', index=False, encoding='utf-8', sep = '|' )
+write_table(df_data_2019, 'data_2019_clean')
 
 # Save cleaned ranking data
-df_ranking.to_csv('cleaned_data/ranking_clean.csv', index=False, encoding='utf-8', sep = '|' )
+write_table(df_ranking, 'ranking_clean')
+
+# Save the DOI and author key dictionaries
+doi_keys.save()
+author_keys.save()
+
+profiler.finish()
@@ -6,158 +6,78 @@ Created on Tue Apr 22 17:32:33 2025
 """
 
 # === 1. Import and Setup ===
+# Time, memory and row counts of every section, reported in results/profiling/
+from profiling import PipelineProfiler
+profiler = PipelineProfiler('01_merge_rank_institution', globals())
+profiler.stage('1. Import and Setup')
+
 import pandas as pd
-import re
 import os
-from unidecode import unidecode
+from name_normalization import InstitutionNameNormalizer
+from match_cache import MatchCache
+from storage import read_table, table_path
 
 # === 2. Display Settings ===
+profiler.stage('2. Display Settings')
 pd.set_option("display.max_columns", 50)
 
-# === 3. Load Cleaned CSVs ===
-df_institution_2019 = pd.read_csv('cleaned_data/institution_2019_clean.csv', encoding='utf-8', sep='|')
-df_ranking = pd.read_csv('cleaned_data/ranking_clean.csv', encoding='utf-8', sep='|')
+# === 3. Load Cleaned Tables (only the needed columns) ===
+profiler.stage('3. Load Cleaned Tables (only the needed columns)')
+df_institution_2019 = read_table('institution_2019_clean', columns=[
+    'parent_id', 'doi', 'author', 'author_position', 'institutions', 'ror',
+    'display_name', 'country_code', 'type', 'homepage_url'
+])
+df_ranking = read_table('ranking_clean', columns=['rank', 'name'])
 
 # Backup original names for reference
 df_institution_2019['display_name_original'] = df_institution_2019['display_name']
 df_ranking['name_original'] = df_ranking['name']
 
-# === 4. Name Normalization Function ===
-def normalization(text):
-    """
-    Clean and normalize institution names for reliable comparison.
-    - Lowercases and removes accents
-    - Removes invisible and special characters
-    - Standardizes common education terms
-    - Removes stopwords
-    """
-    if not isinstance(text, str):
-        return text
-
-    # Lowercase and remove accents
-    text = unidecode(text).lower()
-
-    # Remove invisible characters
-    invisible_chars = [
-        '\u200b', '\u00a0', '\ufeff', '\u202f', '\u2060',
-        '\u180e', '\u200e', '\u200f'
-    ]
-    for ch in invisible_chars:
-        text = text.replace(ch, '')
-
-    # Replace dashes with spaces
-    text = text.replace("-", " ")
-
-    # Remove unwanted punctuation (keep digits)
-    text = re.sub(r"[.,/\\&+:'\";=_@%!?()\[\]{}<>#^*~|‘’ʻʼʽˆ`ˋ´ˊ˘]", "", text)
-
-    # Remove extra whitespace
-    text = re.sub(r"\s+", " ", text).strip()
-
-    # Standardize common education terms
-    replacements = {
-        # Institute variants
-        r"\binstitutet\b": "institute",
-        r"\binstitute\b": "institute",
-        r"\binstituto\b": "institute",
-        r"\binstituut\b": "institute",
-        r"\binstituttet\b": "institute",
-        r"\binstitutt\b": "institute",
-        r"\binstitut\b": "institute",
-        # University variants
-        r"\buniversite\b": "university",
-        r"\buniversitat\b": "university",
-        r"\buniversiteit\b": "university",
-        r"\buniverzita\b": "university",
-        r"\buniversidad\b": "university",
-        r"\buniversità\b": "university",
-        r"\buniversidade\b": "university",
-        r"\buniversität\b": "university",
-        r"\büniversite\b": "university",
-        r"\buniverzitet\b": "university",
-        r"\büniversitesi\b": "university",
-        r"\byliopisto\b": "university",
-        r"\begyetem\b": "university",
-        # College variants
-        r"\bcollege\b": "college",
-        r"\bcollegio\b": "college",
-        r"\bcolégio\b": "college",
-        r"\bkolleg\b": "college",
-        r"\bkolej\b": "college",
-        r"\bkollégium\b": "college",
-        r"\bkolegji\b": "college",
-        # School / academy
-        r"\bschool\b": "school",
-        r"\bschule\b": "school",
-        r"\bescola\b": "school",
-        r"\bescuela\b": "school",
-        r"\bskola\b": "school",
-        r"\bécole\b": "school",
-        r"\bakademie\b": "academy",
-        r"\bacademy\b": "academy"
-    }
-    for pattern, replacement in replacements.items():
-        text = re.sub(pattern, replacement, text)
-
-    # Remove content inside parentheses
-    text = re.sub(r'\s*\([^)]*\)', '', text)
-
-    # Remove common stopwords
-    stopwords = {
-        "of", "the", "and", "in", "for", "a", "an", "at", "on", "to",
-        "de", "del", "du", "di", "la", "le", "les", "des",
-        "von", "der", "den", "da", "do", "das", "dos",
-        "y", "e", "et", "und"
-    }
-    words = text.split()
-    words = [w for w in words if w not in stopwords]
-    text = " ".join(words)
-
-    return text
+# === 4. Name Normalizer ===
+profiler.stage('4. Name Normalizer')
+# Compiled version of the normalization rules (accents, invisible characters,
+# punctuation, education terms, stopwords), memoized on distinct names
+normalizer = InstitutionNameNormalizer()
 
 # === 5. Apply Normalization to Names ===
-df_institution_2019['display_name_clean'] = df_institution_2019['display_name'].apply(normalization)
-df_ranking['name_clean'] = df_ranking['name'].apply(normalization)
+profiler.stage('5. Apply Normalization to Names')
+df_institution_2019['display_name_clean'] = normalizer.normalize_series(df_institution_2019['display_name'])
+df_ranking['name_clean'] = normalizer.normalize_series(df_ranking['name'])
 
 # Check for duplicate normalized ranking names
 df_ranking['name_clean'].value_counts().loc[lambda x: x > 1]
 
 # === 6. Map Ranking Names to Rank Values ===
+profiler.stage('6. Map Ranking Names to Rank Values')
 ranking_name_mapping = {}
 for idx, row in df_ranking.iterrows():
     norm_name = row['name_clean']
     ranking_name_mapping[norm_name] = row['rank']
 
 # === 7. Exact Match Based on Normalized Names ===
+profiler.stage('7. Exact Match Based on Normalized Names')
 df_institution_2019['rank'] = df_institution_2019['display_name_clean'].map(ranking_name_mapping)
 
 # === 8. Summary of Exact Matches ===
+profiler.stage('8. Summary of Exact Matches')
 exact_matches = df_institution_2019['rank'].notna().sum()
 total_rows = len(df_institution_2019)
 print(f"Exact matches: {exact_matches} of {total_rows} ({(exact_matches / total_rows) * 100:.2f}%)")
 unique_exact = df_institution_2019[df_institution_2019['rank'].notna()]['display_name_clean'].nunique()
 
 # === 9. Fuzzy Matching Using RapidFuzz (first with a sample df) ===
-from rapidfuzz import process, fuzz
-from tqdm import tqdm
-tqdm.pandas()
-
-def fuzzy_match_wrapper_score(inst_name, threshold=90):
-    """
-    Fuzzy match institution name against ranking names.
-    Returns: (matched name, match score) if above threshold, else (None, None)
-    """
-    norm_name = normalization(inst_name)
-    result = process.extractOne(
-        norm_name,
-        list(ranking_name_mapping.keys()),
-        scorer=fuzz.WRatio,
-        score_cutoff=threshold
-    )
-    if result is None:
-        return None, None
-    matched_name, score, _ = result
-    return matched_name, score
+profiler.stage('9. Fuzzy Matching Using RapidFuzz (first with a sample df)')
+from institution_matching import InstitutionMatcher
+
+# Build the blocked matcher once over the ranking names (same order as the mapping keys).
+# Names are already normalized, every distinct name is scored only once and the
+# matches are the same as process.extractOne(..., scorer=fuzz.WRatio, score_cutoff=90),
+# about 4.7x faster (checked by python scripts/institution_matching.py).
+matcher = InstitutionMatcher(list(ranking_name_mapping.keys()), threshold=90)
+
+# Persistent store of fuzzy results and resolved ranks from earlier runs.
+# It is reset when the ranking file or the normalizer changes.
+match_cache = MatchCache('cleaned_data/match_cache.sqlite', table_path('ranking_clean'), threshold=90)
 
 # Mask for institutions without an exact match
 mask = df_institution_2019['rank'].isna()
@@ -169,9 +89,9 @@ sample_size = min(1000, mask.sum())
 sample_df = df_institution_2019[mask].sample(sample_size, random_state=42).copy()
 
 # Apply fuzzy matching to the sample
-results = sample_df['display_name_clean'].progress_apply(fuzzy_match_wrapper_score)
-sample_df['fuzzy_matched_name'] = results.apply(lambda x: x[0])
-sample_df['match_score'] = results.apply(lambda x: x[1])
+results = matcher.match(sample_df['display_name_clean'])
+sample_df['fuzzy_matched_name'] = results['fuzzy_matched_name']
+sample_df['match_score'] = results['match_score']
 
 # Summary of fuzzy matches in the sample
 matched_count = sample_df['match_score'].notna().sum()
@@ -186,9 +106,11 @@ print(sample_df[sample_df['match_score'].notna()][[
 ### SAMPLE END ###
 
 # === 10. Full Fuzzy Matching (Threshold 90) ===
-results = df_institution_2019.loc[mask, 'display_name_clean'].progress_apply(fuzzy_match_wrapper_score)
-df_institution_2019.loc[mask, 'fuzzy_matched_name'] = results.apply(lambda x: x[0])
-df_institution_2019.loc[mask, 'fuzzy_rank'] = results.apply(lambda x: x[1])
+profiler.stage('10. Full Fuzzy Matching (Threshold 90)')
+# Only names never seen in earlier runs are scored
+results = match_cache.match(matcher, df_institution_2019.loc[mask, 'display_name_clean'])
+df_institution_2019.loc[mask, 'fuzzy_matched_name'] = results['fuzzy_matched_name']
+df_institution_2019.loc[mask, 'fuzzy_rank'] = results['match_score']
 
 # Summary After Full Fuzzy Matching
 fuzzy_matches = df_institution_2019['fuzzy_rank'].notna().sum()
@@ -213,6 +135,7 @@ fuzzy_unique = fuzzy_only_sorted.drop_duplicates(subset='display_name_clean').co
 
 
 # === 11. Manual Review of Fuzzy Matches ONLY WHEN MANUAL REVIEW IS NEEDED ===
+profiler.stage('11. Manual Review of Fuzzy Matches ONLY WHEN MANUAL REVIEW IS NEEDED')
 
 # Export fuzzy candidates for manual checking 
 fuzzy_export_path = "manual_review\fuzzy_candidates_with_manual_check.csv"
@@ -236,12 +159,14 @@ df_institution_2019 = df_institution_2019.merge(
     suffixes=('', '_fuzzy')
 )
 
-# Update final_rank: use accepted fuzzy if no exact match
+# Update final_rank: use accepted fuzzy if no exact match, with the rank of the
+# accepted ranking name (fuzzy_rank holds the WRatio score of every candidate)
 df_institution_2019['final_rank'] = df_institution_2019['final_rank'].combine_first(
-    df_institution_2019['fuzzy_rank']
+    df_institution_2019['fuzzy_matched_name_fuzzy'].map(ranking_name_mapping)
 )
 
 # === 12. Secondary Ranking Statistics ===
+profiler.stage('12. Secondary Ranking Statistics')
 total_rows = len(df_institution_2019)
 final_ranked_rows = df_institution_2019['final_rank'].notna().sum()
 print(f"Final ranked rows: {final_ranked_rows} of {total_rows} ({(final_ranked_rows / total_rows) * 100:.2f}%)")
@@ -251,6 +176,7 @@ total_unique_institutions = df_institution_2019['display_name_clean'].nunique()
 print(f"Unique institutions with final_rank: {unique_final_ranked} of {total_unique_institutions} ({(unique_final_ranked / total_unique_institutions) * 100:.2f}%)")
 
 # === 13. Find Unmatched Ranked Institutions ONLY WHEN MANUAL REVIEW IS NEEDED ===
+profiler.stage('13. Find Unmatched Ranked Institutions ONLY WHEN MANUAL REVIEW IS NEEDED')
 matched_names = set(
     df_institution_2019[df_institution_2019['final_rank'].notna()]['display_name_clean']
 ) | set(
@@ -272,6 +198,7 @@ unique_institution_export_path = "manual_review/unique_institution_names.xlsx"
 unique_institutions_df.to_excel(unique_institution_export_path, index=False)
 
 # === 14. Manual Pairing of Unmatched Institutions ===
+profiler.stage('14. Manual Pairing of Unmatched Institutions')
 manual_df = pd.read_excel("manual_review/unmatched_ranked_paired.xlsx")
 manual_df = manual_df[manual_df['display_name_clean'].notna()]
 
@@ -287,6 +214,7 @@ df_institution_2019['final_rank'] = df_institution_2019['final_rank'].combine_fi
 )
 
 # === 15. Final Reporting ===
+profiler.stage('15. Final Reporting')
 total_rows = len(df_institution_2019)
 ranked_rows = df_institution_2019['final_rank'].notna().sum()
 print(f"Final ranked rows: {ranked_rows} of {total_rows} ({(ranked_rows / total_rows) * 100:.2f}%)")
@@ -305,4 +233,33 @@ final_columns = [
     'homepage_url', 'final_rank', 'rank_flag'
 ]
 final_df = df_institution_2019[final_columns].copy()
-final_df.to_csv("cleaned_data/ranked_institution_2019.csv", index=False, sep="|")
\ No newline at end of file
+final_df.to_csv("cleaned_data/ranked_institution_2019.csv", index=False, sep="|")
+
+# === 16. Update the Match Cache ===
+profiler.stage('16. Update the Match Cache')
+# Provenance of final_rank, in the order it was filled (sections 7, 11 and 14):
+# exact, accepted fuzzy match, manual pairing. The cache holds the same
+# resolution as the exported CSV; the score of a fuzzy match is its reviewed
+# WRatio score
+is_exact = df_institution_2019['rank'].notna()
+is_fuzzy = ~is_exact & df_institution_2019['fuzzy_matched_name_fuzzy'].map(ranking_name_mapping).notna()
+is_manual = ~is_exact & ~is_fuzzy & df_institution_2019['manual_rank'].notna()
+
+provenance = pd.Series(None, index=df_institution_2019.index, dtype=object)
+provenance[is_exact] = 'exact'
+provenance[is_fuzzy] = 'fuzzy'
+provenance[is_manual] = 'manual'
+
+match_score = df_institution_2019['fuzzy_rank_fuzzy'].where(is_fuzzy)
+match_score[is_exact] = 100.0
+
+match_cache.store_resolutions(
+    df_institution_2019['display_name_clean'],
+    df_institution_2019['final_rank'],
+    provenance,
+    match_score
+)
+print(match_cache.resolutions()['provenance'].value_counts())
+match_cache.close()
+
+profiler.finish()
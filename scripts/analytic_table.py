@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Builder of the analytic table of the 02 notebook (df_merged_all).
+
+The table is materialized once and saved as a Parquet artifact
+(cleaned_data/analytic_table_2019.parquet); the notebook only loads it.
+It is rebuilt when one of its input files changed.
+
+The table holds
+- the merge of ranked_institution_2019.csv with the publication metrics
+  (many_to_many on doi) and the author aggregates (on author), both joined
+  on the integer keys doi_key / author_key (keys.py),
+- the derived columns of the notebook: stot_log1p, cited_by_log1p,
+  gender_majority, <platform>_binary, final_rank_numeric and rank_group,
+- compact dtypes: categoricals for repeated labels, downcast integers.
+  Continuous measures keep their float precision, and columns that the
+  notebook groups by or plots (doi, gender_majority, ethnicity_majority)
+  stay plain strings, so no unobserved categories show up there.
+
+Subsets of the notebook (ranked rows, male/female majority, ...) are boolean
+masks over this table, see ``subset_masks``. A subset frame only copies the
+columns the notebook reads from it (``subset_frame``, SUBSET_COLUMNS), not
+the whole table.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from demographics import demographic_majorities
+from keys import KeyDictionary
+from storage import read_table, table_path
+
+ANALYTIC_PATH = os.path.join('cleaned_data', 'analytic_table_2019.parquet')
+RANKED_PATH = os.path.join('cleaned_data', 'ranked_institution_2019.csv')
+
+# Altmetric platforms of the notebook
+PLATFORM_COLS = [
+    'blogs', 'book_reviews', 'f1000', 'facebook', 'googleplus', 'linkedin',
+    'misc', 'news', 'patent', 'peer_reviews', 'pinterest', 'policy',
+    'qa', 'reddit', 'syllabi', 'twitter', 'video', 'weibo', 'wikipedia'
+]
+
+# Publication metrics used in the notebook
+DATA_COLUMNS = [
+    'doi_key', 'pubdate', 'all_citaitons', 'cit_log',
+    'female', 'male', 'unisex', 'ethnicity_majority'
+] + PLATFORM_COLS + ['stot']
+
+AUTHOR_COLUMNS = ['author_key', 'works_count', 'cited_by_count']
+
+RANK_ORDER = ['top50', '51–100', '101–200', '201–500', '500+', '>1000']
+
+# Columns the notebook reads from its subsets (df_ranked_only, ...)
+SUBSET_COLUMNS = [
+    'doi', 'doi_key', 'country_code', 'final_rank', 'final_rank_numeric', 'rank_group',
+    'gender_majority', 'ethnicity_majority', 'stot', 'stot_log1p',
+    'all_citaitons', 'cit_log', 'cited_by_count', 'cited_by_log1p'
+] + PLATFORM_COLS + [f'{platform}_binary' for platform in PLATFORM_COLS]
+
+CATEGORICAL_COLS = [
+    'author', 'institutions', 'ror', 'display_name_original', 'display_name_clean',
+    'country_code', 'type', 'homepage_url'
+]
+
+
+# === Derived columns ===
+def parse_final_rank(rank):
+    """Numeric estimate of a rank label (e.g. "=74" -> 74, "301–400" -> 350), as in the notebook."""
+    if pd.isna(rank):
+        return np.nan
+    if isinstance(rank, str):
+        if "–" in rank:
+            parts = rank.replace('–', '-').split('-')
+            try:
+                return (int(parts[0]) + int(parts[1])) / 2
+            except:
+                return np.nan
+        if rank.startswith("="):
+            try:
+                return int(rank[1:])
+            except:
+                return np.nan
+    try:
+        return float(rank)
+    except:
+        return np.nan
+
+
+def rank_group(final_rank, ranked):
+    """
+    Rank group of the ranked rows: bins of final_rank_numeric (up to its
+    maximum among ranked rows), '>1000' for '1001+'; NaN for other rows.
+    """
+    numeric = final_rank.where(ranked).map(parse_final_rank, na_action='ignore').astype(float)
+    groups = pd.cut(
+        numeric,
+        bins=[0, 50, 100, 200, 500, numeric.max()],
+        labels=RANK_ORDER[:-1],
+        include_lowest=True
+    )
+    groups = groups.cat.add_categories('>1000')
+    groups[ranked & (final_rank == '1001+')] = '>1000'
+    return numeric, groups.cat.set_categories(RANK_ORDER, ordered=True)
+
+
+def add_derived_columns(df):
+    """Add the derived columns of the notebook (in place) and return df."""
+    df['stot_log1p'] = (df['stot'] + 1).apply(np.log)
+    df['cited_by_log1p'] = np.log1p(df['cited_by_count'])
+    # Per-article label (the source ethnicity_majority is already per article)
+    df['gender_majority'] = demographic_majorities(df)['gender_majority']
+    for platform in PLATFORM_COLS:
+        df[f'{platform}_binary'] = (df[platform] > 0).astype(np.int8)
+    df['final_rank_numeric'], df['rank_group'] = rank_group(df['final_rank'], df['rank_flag'] == 1)
+    return df
+
+
+def compact_dtypes(df):
+    """Categoricals for repeated labels and the smallest integer types (in place)."""
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in df.select_dtypes(include='integer').columns:
+        if not col.endswith('_key'):   # surrogate keys stay int32
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+# === Build / load ===
+def _input_paths(ranked_path, directory):
+    return {
+        'ranked': ranked_path,
+        'data': table_path('data_2019_clean', directory),
+        'author': table_path('author_clean', directory),
+        'doi_keys': table_path('doi_keys', directory),
+        'author_keys': table_path('author_keys', directory),
+    }
+
+
+def _inputs_state(paths):
+    """Size and modification time of every input file."""
+    state = {}
+    for key, path in paths.items():
+        stat = os.stat(path)
+        state[key] = [path, stat.st_size, stat.st_mtime_ns]
+    return state
+
+
+def build_analytic_table(ranked_path=RANKED_PATH, directory='cleaned_data'):
+    """Merge the ranked rows with publication metrics and author aggregates and add derived columns."""
+    df_ranked = pd.read_csv(ranked_path, sep='|', low_memory=False)
+    df_data = read_table('data_2019_clean', columns=DATA_COLUMNS, directory=directory)
+    df_author = read_table('author_clean', columns=AUTHOR_COLUMNS, directory=directory)
+    # Nullable author aggregates as read_csv types them: int64, or float64 with NaN
+    for col in ['works_count', 'cited_by_count']:
+        df_author[col] = df_author[col].astype('float64' if df_author[col].isna().any() else 'int64')
+
+    # The joins run on the integer DOI / author keys (keys.py)
+    df_ranked['doi_key'] = KeyDictionary.load('doi', directory).lookup(df_ranked['doi'])
+    df_ranked['author_key'] = KeyDictionary.load('author', directory).lookup(df_ranked['author'])
+
+    df = pd.merge(
+        df_ranked,
+        df_data,
+        how='left',
+        on='doi_key',
+        validate='many_to_many'   # many ranked rows per one publication is expected
+    ).merge(
+        df_author,
+        how='left',
+        on='author_key'
+    )
+    return compact_dtypes(add_derived_columns(df))
+
+
+def load_analytic_table(path=ANALYTIC_PATH, ranked_path=RANKED_PATH, directory='cleaned_data',
+                        rebuild=False):
+    """
+    Load the cached analytic table, (re)building it first if it is missing,
+    if an input changed or if ``rebuild`` is True.
+    """
+    state = _inputs_state(_input_paths(ranked_path, directory))
+    if not rebuild and os.path.exists(path):
+        metadata = pq.read_schema(path).metadata or {}
+        if json.loads(metadata.get(b'analytic_inputs', b'null')) == state:
+            return pd.read_parquet(path)
+
+    df = build_analytic_table(ranked_path, directory)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **table.schema.metadata,
+        b'analytic_inputs': json.dumps(state).encode(),
+    })
+    pq.write_table(table, path)
+    print(f"Analytic table built: {df.shape[0]} rows, "
+          f"{df.memory_usage(deep=True).sum() / 2**20:.1f} MiB")
+    return df
+
+
+# === Subsets ===
+def subset_masks(df):
+    """
+    Boolean masks of the notebook subsets:
+    - 'ranked': rows of ranked institutions (df_ranked_only),
+    - 'gender_filtered': male or female majority articles (df_gender_filtered),
+    - 'ranked_gender_filtered': ranked rows without undetermined gender majority.
+    """
+    ranked = (df['rank_flag'] == 1).to_numpy()
+    gender = df['gender_majority']
+    return {
+        'ranked': ranked,
+        'gender_filtered': gender.isin(['gender_male_majority', 'gender_female_majority']).to_numpy(),
+        'ranked_gender_filtered': ranked & (gender != 'gender_undetermined_majority').to_numpy(),
+    }
+
+
+def subset_frame(df, mask, columns=SUBSET_COLUMNS):
+    """Rows of ``mask`` with only ``columns`` (copies those columns, not the whole table)."""
+    return df.loc[mask, list(columns)]
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Batch driver: run the pipeline for many (publication year, ranking file) jobs
+in parallel.
+
+Every job runs
+1. load / clean: the year's publication file and the institution file are
+   cleaned in chunks (cleaning.py), keeping the institutions of that year,
+2. rank match: exact -> fuzzy -> manual (rank_matching.py),
+3. merge: ranked institution rows + publication metrics + author aggregates.
+Jobs run in a ProcessPoolExecutor. Every distinct ranking file is cleaned and
+indexed once in the parent process, and the author keys (keys.py) are built
+once; these read-only structures are handed to the workers once, when they
+start, not with every job. DOI keys are built per year.
+
+Outputs go to <output-dir>/<year>_<ranking file name>/ (Parquet tables), and
+the per-job timings to <output-dir>/batch_timings.csv.
+
+Usage (from the repository root):
+    python scripts/batch_driver.py --job 2019:data/2019_rankings.csv \\
+        --job 2020:data/2020_rankings.csv --workers 8
+
+Optional manual review files of a year are read from
+manual_review/<year>/fuzzy_manual_checked.xlsx (accepted fuzzy matches,
+column keep == 1) and manual_review/<year>/unmatched_ranked_paired.xlsx.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from cleaning import (
+    build_author_keys, clean_author, clean_ranking, drop_unnamed_columns,
+    normalize_column_names, stream_institutions, stream_publications
+)
+from name_normalization import InstitutionNameNormalizer
+from rank_matching import RANKED_COLUMNS, RankingIndex, match_ranks
+from storage import read_table, write_table
+
+# Ranking indexes and author keys of the worker process, set by _init_worker
+_RANKING_INDEXES = None
+_AUTHOR_KEYS = None
+
+
+# === Jobs ===
+def parse_job(text):
+    """'2019:data/2019_rankings.csv' -> (2019, 'data/2019_rankings.csv')"""
+    year, _, ranking_path = text.partition(':')
+    if not ranking_path:
+        raise argparse.ArgumentTypeError(f"Job must be YEAR:RANKING_FILE, got '{text}'")
+    return int(year), ranking_path
+
+
+def job_directory(output_dir, year, ranking_path):
+    stem = os.path.splitext(os.path.basename(ranking_path))[0]
+    return os.path.join(output_dir, f'{year}_{stem}')
+
+
+def _read_manual(manual_dir, year):
+    """Accepted fuzzy names and manual pairings of a year, if reviewed."""
+    year_dir = os.path.join(manual_dir, str(year))
+    accepted_names = manual_df = None
+    checked_path = os.path.join(year_dir, 'fuzzy_manual_checked.xlsx')
+    if os.path.exists(checked_path):
+        checked = pd.read_excel(checked_path)
+        accepted_names = checked.loc[checked['keep'] == 1, 'display_name_clean']
+    paired_path = os.path.join(year_dir, 'unmatched_ranked_paired.xlsx')
+    if os.path.exists(paired_path):
+        manual_df = pd.read_excel(paired_path)
+    return accepted_names, manual_df
+
+
+# === Workers ===
+def _init_worker(ranking_indexes, author_keys):
+    global _RANKING_INDEXES, _AUTHOR_KEYS
+    _RANKING_INDEXES = ranking_indexes
+    _AUTHOR_KEYS = author_keys
+
+
+def run_job(year, ranking_path, config):
+    """Run the three stages of one job; returns its row counts and timings (s)."""
+    out_dir = job_directory(config['output_dir'], year, ranking_path)
+    os.makedirs(out_dir, exist_ok=True)
+    timings = {'year': year, 'ranking': ranking_path}
+    start = time.perf_counter()
+
+    # 1. Load / clean
+    doi_keys, has_missing_doi = stream_publications(
+        config['publications'].format(year=year), config['chunk_size'],
+        out_dir, name=f'data_{year}_clean'
+    )
+    stream_institutions(
+        config['institutions'], doi_keys, has_missing_doi, _AUTHOR_KEYS, config['chunk_size'],
+        out_dir, name=f'institution_{year}_clean'
+    )
+    timings['clean_s'] = time.perf_counter() - start
+
+    # 2. Rank match
+    step = time.perf_counter()
+    accepted_names, manual_df = _read_manual(config['manual_dir'], year)
+    df_ranked = match_ranks(
+        read_table(f'institution_{year}_clean', directory=out_dir),
+        _RANKING_INDEXES[ranking_path],
+        InstitutionNameNormalizer(),
+        accepted_names=accepted_names,
+        manual_df=manual_df,
+    )[RANKED_COLUMNS]
+    write_table(df_ranked, f'ranked_institution_{year}', out_dir, schema='ranked_institution')
+    timings['match_s'] = time.perf_counter() - step
+
+    # 3. Merged analytic table (as in the 02 notebook), joined on the integer keys
+    step = time.perf_counter()
+    df_merged = pd.merge(
+        df_ranked,
+        read_table(f'data_{year}_clean', directory=out_dir).drop(columns='doi'),
+        how='left',
+        on='doi_key',
+        validate='many_to_many'
+    ).merge(
+        read_table('author_clean', columns=['author_key', 'works_count', 'cited_by_count'],
+                   directory=config['output_dir']),
+        how='left',
+        on='author_key'
+    )
+    df_merged.to_parquet(os.path.join(out_dir, f'merged_{year}.parquet'), index=False)
+    timings['merge_s'] = time.perf_counter() - step
+
+    timings['total_s'] = time.perf_counter() - start
+    timings['ranked_rows'] = int(df_ranked['rank_flag'].sum())
+    timings['rows'] = len(df_ranked)
+    return timings
+
+
+# === Driver ===
+def build_ranking_indexes(ranking_paths, output_dir, threshold=90, candidates=None):
+    """Clean every distinct ranking file once and index its names."""
+    normalizer = InstitutionNameNormalizer()
+    indexes = {}
+    for path in dict.fromkeys(ranking_paths):
+        df_ranking = pd.read_csv(path, encoding='utf-8')
+        df_ranking = clean_ranking(drop_unnamed_columns(normalize_column_names(df_ranking)))
+        stem = os.path.splitext(os.path.basename(path))[0]
+        write_table(df_ranking, f'ranking_{stem}_clean', output_dir, schema='ranking_clean')
+        indexes[path] = RankingIndex(df_ranking, normalizer, threshold=threshold, candidates=candidates)
+    return indexes
+
+
+def run_batch(jobs, config, workers=None, threshold=90, candidates=None):
+    """Run all jobs on a process pool and return the per-job timings."""
+    os.makedirs(config['output_dir'], exist_ok=True)
+
+    # Shared inputs are prepared once
+    step = time.perf_counter()
+    df_author = pd.read_csv(config['authors'], encoding='utf-8')
+    df_author = clean_author(drop_unnamed_columns(normalize_column_names(df_author)))
+    author_keys = build_author_keys(
+        df_author, config['institutions'], config['chunk_size'], config['output_dir']
+    )
+    df_author['author_key'] = author_keys.lookup(df_author['author'])
+    write_table(df_author, 'author_clean', config['output_dir'])
+    ranking_indexes = build_ranking_indexes(
+        [path for _, path in jobs], config['output_dir'], threshold=threshold, candidates=candidates
+    )
+    print(f"Shared inputs prepared in {time.perf_counter() - step:.1f} s")
+
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(ranking_indexes, author_keys)
+    ) as pool:
+        futures = {pool.submit(run_job, year, path, config): (year, path) for year, path in jobs}
+        for future in as_completed(futures):
+            year, path = futures[future]
+            try:
+                timings = future.result()
+            except Exception as error:
+                print(f"Job {year} / {path} failed: {error!r}")
+                timings = {'year': year, 'ranking': path, 'error': repr(error)}
+            else:
+                print(f"Job {year} / {path} done in {timings['total_s']:.1f} s")
+            results.append(timings)
+
+    report = pd.DataFrame(results).sort_values(['year', 'ranking']).reset_index(drop=True)
+    report.to_csv(os.path.join(config['output_dir'], 'batch_timings.csv'), index=False)
+    print(report)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--job', dest='jobs', type=parse_job, action='append', required=True,
+                        help='YEAR:RANKING_FILE, can be repeated')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=200_000)
+    parser.add_argument('--threshold', type=float, default=90)
+    parser.add_argument('--candidates', type=int, default=None,
+                        help='Fuzzy match only the top K TF-IDF candidates (candidate_index.py)')
+    parser.add_argument('--publications', default='data/data_{year}.csv')
+    parser.add_argument('--institutions', default='data/merged_institutions_data.csv')
+    parser.add_argument('--authors', default='data/merged_author_data.csv')
+    parser.add_argument('--manual-dir', default='manual_review')
+    parser.add_argument('--output-dir', default='cleaned_data/panel')
+    args = parser.parse_args()
+
+    run_batch(
+        args.jobs,
+        {
+            'publications': args.publications,
+            'institutions': args.institutions,
+            'authors': args.authors,
+            'manual_dir': args.manual_dir,
+            'output_dir': args.output_dir,
+            'chunk_size': args.chunk_size,
+        },
+        workers=args.workers,
+        threshold=args.threshold,
+        candidates=args.candidates,
+    )
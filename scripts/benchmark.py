@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark of the cleaning and matching stages on synthetic data.
+
+Every size is a synthetic dataset of that many affiliation rows
+(synthetic_data.py, same seed for every run). The stages are timed as the
+pipeline runs them:
+- 'cleaning': column names, clean_author / clean_data_2019 / clean_ranking,
+  institution DOIs and fix_known_institutions (00_load_and_clean.py),
+- 'normalization': InstitutionNameNormalizer on the display and ranking names
+  (a new normalizer every repeat, so nothing is memoized between repeats),
+- 'exact_map': normalized ranking name -> rank mapping of the display names,
+- 'fuzzy_match': building the InstitutionMatcher and matching the names
+  without an exact match,
+- 'merge': DOI / author keys, the 2019 filter and the analytic-table joins.
+The inputs of a stage are the outputs of the earlier stages; preparing them
+is not timed. Every stage is repeated (``--repeat``, one run from 1M rows on)
+and the fastest run is reported.
+
+The results (seconds, rows per second) go to
+results/benchmarks/benchmark_<timestamp>.csv, with the scaling exponent of
+every stage (slope of log time over log rows; 1 is linear). With
+``--baseline`` an earlier results file is compared and the run fails if a
+stage got slower than ``--tolerance`` times its baseline.
+
+Usage (from the repository root):
+    python scripts/benchmark.py --sizes 10000 100000 1000000
+    python scripts/benchmark.py --baseline results/benchmarks/benchmark_<timestamp>.csv
+10M rows need several GB of memory for the synthetic tables alone.
+"""
+
+import argparse
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cleaning import (
+    normalize_column_names, drop_unnamed_columns, clean_author, clean_data_2019,
+    clean_ranking, normalize_institution_doi, fix_known_institutions
+)
+from institution_matching import InstitutionMatcher
+from keys import KeyDictionary, in_dictionary
+from name_normalization import InstitutionNameNormalizer
+from synthetic_data import synthetic_dataset
+
+SIZES = [10_000, 100_000, 1_000_000]
+RESULT_DIR = 'results/benchmarks'
+
+RESULT_COLUMNS = [
+    'stage', 'rows', 'items', 'min_s', 'median_s', 'repeats', 'rows_per_s',
+    'seed', 'python', 'pandas', 'numpy', 'started'
+]
+
+
+# === Stages ===
+# A stage prepares its (untimed) inputs from the context and returns the
+# function that is timed; its result is stored in the context under the stage name.
+def stage_cleaning(ctx):
+    raw = {name: df.copy() for name, df in ctx['raw'].items()}
+
+    def run():
+        for df in raw.values():
+            normalize_column_names(df)
+            drop_unnamed_columns(df)
+        return {
+            'author': clean_author(raw['author']),
+            'data': clean_data_2019(raw['data']),
+            'ranking': clean_ranking(raw['ranking']),
+            'institution': fix_known_institutions(normalize_institution_doi(raw['institution'])),
+        }
+    return run, len(raw['institution'])
+
+
+def stage_normalization(ctx):
+    cleaned = ctx['cleaning']
+
+    def run():
+        normalizer = InstitutionNameNormalizer()
+        return (normalizer.normalize_series(cleaned['institution']['display_name']),
+                normalizer.normalize_series(cleaned['ranking']['name']))
+    return run, cleaned['institution']['display_name'].nunique()
+
+
+def stage_exact_map(ctx):
+    names, ranking_names = ctx['normalization']
+    ranks = ctx['cleaning']['ranking']['rank']
+
+    def run():
+        mapping = dict(zip(ranking_names, ranks))
+        return mapping, names.map(mapping)
+    return run, len(names)
+
+
+def stage_fuzzy_match(ctx):
+    names = ctx['normalization'][0]
+    mapping, exact = ctx['exact_map']
+    unmatched = names[exact.isna()]
+
+    def run():
+        matcher = InstitutionMatcher(list(mapping.keys()), threshold=90)
+        return matcher.match(unmatched)
+    return run, unmatched.nunique()
+
+
+def stage_merge(ctx):
+    cleaned = ctx['cleaning']
+    data, author, institution = cleaned['data'], cleaned['author'], cleaned['institution']
+
+    def run():
+        doi_keys = KeyDictionary.build('doi', data['doi'])
+        author_keys = KeyDictionary.build('author', author['author'], institution['author'])
+        data_keyed = data.assign(doi_key=doi_keys.lookup(data['doi']))
+        author_keyed = author.assign(author_key=author_keys.lookup(author['author']))
+        rows = institution.assign(
+            doi_key=doi_keys.lookup(institution['doi']),
+            author_key=author_keys.lookup(institution['author'])
+        )
+        rows = rows[in_dictionary(rows['doi_key'], data['doi'].isna().any())].drop_duplicates()
+        return rows.merge(
+            data_keyed.drop(columns='doi'), how='left', on='doi_key', validate='many_to_many'
+        ).merge(
+            author_keyed[['author_key', 'works_count', 'cited_by_count']], how='left', on='author_key'
+        )
+    return run, len(institution)
+
+
+STAGES = {
+    'cleaning': stage_cleaning,
+    'normalization': stage_normalization,
+    'exact_map': stage_exact_map,
+    'fuzzy_match': stage_fuzzy_match,
+    'merge': stage_merge,
+}
+
+
+# === Runs ===
+def benchmark_size(rows, seed=0, repeat=3, stages=STAGES):
+    """Timings of every stage on one synthetic dataset (one dict per stage)."""
+    ctx = {'raw': synthetic_dataset(rows, seed)}
+    results = []
+    for name, stage in stages.items():
+        times = []
+        for _ in range(repeat):
+            run, items = stage(ctx)
+            start = time.perf_counter()
+            ctx[name] = run()
+            times.append(time.perf_counter() - start)
+        results.append({
+            'stage': name,
+            'rows': rows,
+            'items': items,
+            'min_s': min(times),
+            'median_s': float(np.median(times)),
+            'repeats': repeat,
+            'rows_per_s': rows / min(times) if min(times) > 0 else np.nan,
+        })
+        print(f'{rows:>10,} rows  {name:<14} {min(times):9.3f} s  ({items:,} items)', flush=True)
+    return results
+
+
+def run_benchmark(sizes=SIZES, seed=0, repeat=3, stages=STAGES):
+    """Results table of all sizes (RESULT_COLUMNS)."""
+    started = datetime.now().isoformat(timespec='seconds')
+    results = []
+    for rows in sizes:
+        results += benchmark_size(rows, seed, repeat if rows < 1_000_000 else 1, stages)
+    table = pd.DataFrame(results)
+    table['seed'] = seed
+    table['python'] = platform.python_version()
+    table['pandas'] = pd.__version__
+    table['numpy'] = np.__version__
+    table['started'] = started
+    return table[RESULT_COLUMNS]
+
+
+def scaling_exponents(results):
+    """Slope of log(min_s) over log(rows) of every stage (1 = linear)."""
+    def slope(group):
+        if group['rows'].nunique() < 2:
+            return np.nan
+        return np.polyfit(np.log(group['rows']), np.log(group['min_s'].clip(lower=1e-6)), 1)[0]
+    return results.groupby('stage', sort=False)[['rows', 'min_s']].apply(slope).rename('exponent')
+
+
+def compare_to_baseline(results, baseline, tolerance=1.5, min_seconds=0.05):
+    """
+    Ratio of the times to a baseline results table, per stage and size.
+    Sizes where both runs are under ``min_seconds`` are not flagged (timer noise).
+    """
+    merged = results.merge(
+        baseline[['stage', 'rows', 'min_s']], on=['stage', 'rows'], suffixes=('', '_baseline')
+    )
+    merged['ratio'] = merged['min_s'] / merged['min_s_baseline']
+    merged['regression'] = (
+        (merged['ratio'] > tolerance)
+        & (merged[['min_s', 'min_s_baseline']].max(axis=1) >= min_seconds)
+    )
+    return merged[['stage', 'rows', 'min_s_baseline', 'min_s', 'ratio', 'regression']]
+
+
+def plot_scaling(results, path):
+    """Log-log plot of the time of every stage over the rows."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(7, 5))
+    for stage, group in results.groupby('stage', sort=False):
+        ax.plot(group['rows'], group['min_s'], marker='o', label=stage)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('Affiliation rows')
+    ax.set_ylabel('Seconds (fastest run)')
+    ax.set_title('Stage scaling on synthetic data')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help='stages to time (the earlier stages always run, to prepare the inputs)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output-dir', default=RESULT_DIR)
+    parser.add_argument('--plot', action='store_true', help='also write a log-log plot (PNG)')
+    parser.add_argument('--baseline', help='earlier results CSV to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    args = parser.parse_args()
+
+    # Stages depend on the earlier ones, so they always run in order up to the last requested one
+    last = max(list(STAGES).index(stage) for stage in args.stages)
+    stages = dict(list(STAGES.items())[:last + 1])
+
+    results = run_benchmark(args.sizes, args.seed, args.repeat, stages)
+    results = results[results['stage'].isin(args.stages)]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}")
+    results.to_csv(path + '.csv', index=False)
+    if args.plot:
+        plot_scaling(results, path + '.png')
+
+    print()
+    timings = results.pivot(index='stage', columns='rows', values='min_s').reindex(results['stage'].unique())
+    print(timings.join(scaling_exponents(results)))
+    print(f'\nResults: {path}.csv')
+
+    if args.baseline:
+        comparison = compare_to_baseline(results, pd.read_csv(args.baseline), args.tolerance)
+        print()
+        print(comparison.to_string(index=False))
+        if comparison['regression'].any():
+            print(f'\nSlower than {args.tolerance}x the baseline:')
+            print(comparison[comparison['regression']].to_string(index=False))
+            sys.exit(1)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate nearest-neighbour candidate search for fuzzy matching against
+large name tables (all ranking systems combined, the ROR registry, ...).
+
+The blocked InstitutionMatcher (institution_matching.py) is exact, but every
+name still has to be compared with every choice in the blocking step, and
+with 100k+ choices the candidate blocks get large. Here the candidates come
+from a character n-gram TF-IDF index instead:
+- ``NgramTfidfIndex``: the choices as L2-normalized TF-IDF vectors of their
+  character n-grams (within words, padded with a space). N-grams that occur
+  in more than ``max_df`` of the choices ('uni', 'ity', ...) are left out:
+  they are nearly worthless for ranking and would make every pair a
+  candidate. The top-k choices of a name by cosine similarity come from a
+  sparse matrix product, a chunk of names at a time (at most ``max_pairs``
+  nonzero products per chunk).
+- ``ApproximateMatcher``: same interface as InstitutionMatcher; the top-k
+  candidates of every name are scored with ``fuzz.WRatio`` and the threshold,
+  ties going to the earlier choice as in ``process.extractOne``.
+
+Only pairs among the top k are scored, so a match can be missed. How often is
+measured by ``evaluate`` on a labelled sample: recall@k against exact
+scoring (is the exact match among the top k candidates, does the
+approximate match reach its score), recall@k of known pairs (the source
+names of synthetic queries, or hand-checked pairs such as the accepted rows
+of manual_review/fuzzy_manual_checked.xlsx), and the speedup. Matches that
+the index misses are mostly names that WRatio only scores above the
+threshold through a long common part ('... general hospital'), since the
+frequent n-grams carry no weight in the index.
+
+Usage (from the repository root):
+    python scripts/candidate_index.py --choices 100000 --queries 2000 --k 1 5 10 20 50
+    python scripts/candidate_index.py --ranking cleaned_data/ranking_clean.parquet
+The first runs on synthetic names (synthetic_data.py), the second on the
+ranking names and the institution names without an exact match.
+"""
+
+import argparse
+import math
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from scipy import sparse
+
+from institution_matching import InstitutionMatcher
+from name_normalization import InstitutionNameNormalizer
+from synthetic_data import synthetic_names
+
+RESULT_DIR = 'results/benchmarks'
+
+
+# === N-gram TF-IDF index ===
+def word_ngrams(text, ngram=3):
+    """Character n-grams of every word padded with spaces (' ab ' for short words)."""
+    grams = []
+    for token in text.split():
+        padded = f' {token} '
+        grams.extend(padded[i:i + ngram] for i in range(max(1, len(padded) - ngram + 1)))
+    return grams
+
+
+class NgramTfidfIndex:
+    """
+    TF-IDF vectors of the character n-grams of a list of choices.
+
+    Parameters
+    ----------
+    choices : list of str
+    ngram : int
+        Size of the character n-grams.
+    max_df : float
+        N-grams in a larger share of the choices are not indexed.
+    max_pairs : int
+        Upper bound on the nonzero similarities computed in one chunk.
+    """
+
+    def __init__(self, choices, ngram=3, max_df=0.1, max_pairs=2**24):
+        self.choices = list(choices)
+        self.ngram = ngram
+        self.max_pairs = max_pairs
+
+        self.vocab = {}
+        rows, cols = [], []
+        for row, name in enumerate(self.choices):
+            for gram in word_ngrams(name, ngram):
+                col = self.vocab.setdefault(gram, len(self.vocab))
+                rows.append(row)
+                cols.append(col)
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(len(self.choices), len(self.vocab))
+        )
+        counts.sum_duplicates()
+        df = np.bincount(counts.indices, minlength=len(self.vocab))
+
+        # Smoothed idf as in scikit-learn; frequent n-grams get no weight at all
+        n = len(self.choices)
+        self.idf = np.log((1 + n) / (1 + df)) + 1
+        self.idf[df > max(1, max_df * n)] = 0
+        self.df = np.where(self.idf > 0, df, 0)
+        self.matrix_t = self._weigh(counts).T.tocsr()   # n-grams x choices
+
+    def _weigh(self, counts):
+        weighted = counts @ sparse.diags(self.idf)
+        weighted.eliminate_zeros()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1))).ravel()
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weighted
+
+    def transform(self, names):
+        """TF-IDF vectors of names (n-grams not in the index are ignored)."""
+        rows, cols = [], []
+        for row, name in enumerate(names):
+            for gram in word_ngrams(name, self.ngram):
+                col = self.vocab.get(gram)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(len(names), len(self.vocab))
+        )
+        counts.sum_duplicates()
+        return self._weigh(counts).tocsr()
+
+    def top_k(self, names, k):
+        """
+        The k most similar choices of every name as (name, choice, similarity)
+        arrays of pairs, most similar first within a name; pairs without a
+        shared n-gram are never returned.
+        """
+        vectors = self.transform(names)
+        # Upper bound of the nonzero products of every name, to size the chunks
+        binary = vectors.copy()
+        binary.data[:] = 1
+        cost = np.asarray(binary @ self.df).ravel() + 1
+        bounds = np.searchsorted(np.cumsum(cost), np.arange(1, math.ceil(cost.sum() / self.max_pairs) + 1)
+                                 * self.max_pairs)
+        starts = np.unique(np.concatenate([[0], np.minimum(bounds + 1, len(names))]))
+
+        out_rows, out_cols, out_sims = [], [], []
+        for start, stop in zip(starts, list(starts[1:]) + [len(names)]):
+            if start >= stop:
+                continue
+            sims = (vectors[start:stop] @ self.matrix_t).tocsr()
+            row_of = np.repeat(np.arange(stop - start), np.diff(sims.indptr))
+            # By name, then similarity (highest first), then choice order
+            order = np.lexsort((sims.indices, -sims.data, row_of))
+            rank = np.arange(len(order)) - sims.indptr[row_of[order]]
+            keep = order[rank < k]
+            out_rows.append(row_of[keep] + start)
+            out_cols.append(sims.indices[keep])
+            out_sims.append(sims.data[keep])
+
+        if not out_rows:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+        return np.concatenate(out_rows), np.concatenate(out_cols), np.concatenate(out_sims)
+
+
+# === Matcher ===
+class ApproximateMatcher:
+    """
+    Fuzzy matcher with the interface of InstitutionMatcher that only scores
+    the top-k TF-IDF candidates of every name (see the module docstring).
+
+    Parameters
+    ----------
+    choices : iterable of str
+        Normalized names to match against, in the order ``extractOne`` would
+        see them.
+    threshold : float
+        Minimum WRatio score of a match.
+    k : int
+        Candidates scored per name.
+    index : NgramTfidfIndex, optional
+        Index of the same choices, to share one between matchers.
+    """
+
+    def __init__(self, choices, threshold=90, k=20, index=None, **index_args):
+        self.choices = [c for c in choices if isinstance(c, str) and c]
+        self.threshold = threshold
+        self.k = k
+        self.index = index if index is not None else NgramTfidfIndex(self.choices, **index_args)
+
+    def match_unique(self, queries):
+        """
+        Match a list of distinct normalized names.
+
+        Returns
+        -------
+        (matched_names, scores) : arrays aligned with ``queries``, holding None
+        and NaN where no candidate reaches the threshold.
+        """
+        matched = np.full(len(queries), None, dtype=object)
+        scores = np.full(len(queries), np.nan, dtype=np.float64)
+
+        valid = [i for i, q in enumerate(queries) if isinstance(q, str) and q]
+        if not valid or not self.choices:
+            return matched, scores
+        names = [queries[i] for i in valid]
+
+        rows, cols, _ = self.index.top_k(names, self.k)
+        pair_scores = process.cpdist(
+            [names[r] for r in rows],
+            [self.choices[c] for c in cols],
+            scorer=fuzz.WRatio,
+            score_cutoff=self.threshold,
+            dtype=np.float64,
+            workers=-1,
+        )
+
+        # Best score of every name, the earliest choice among equal scores;
+        # scores below the threshold come back as 0
+        hit = pair_scores > 0
+        rows, cols, pair_scores = rows[hit], cols[hit], pair_scores[hit]
+        order = np.lexsort((cols, -pair_scores, rows))
+        first = order[np.r_[True, rows[order][1:] != rows[order][:-1]]] if len(order) else order
+        for r, c, score in zip(rows[first], cols[first], pair_scores[first]):
+            matched[valid[r]] = self.choices[c]
+            scores[valid[r]] = score
+        return matched, scores
+
+    def match(self, names):
+        """
+        Match a Series of normalized names, scoring each distinct name once and
+        broadcasting the results back to the rows.
+
+        Returns
+        -------
+        DataFrame with columns ``fuzzy_matched_name`` and ``match_score``,
+        indexed like ``names``.
+        """
+        names = pd.Series(names)
+        codes, uniques = pd.factorize(names)
+        matched, scores = self.match_unique(list(uniques))
+
+        # Missing names (code -1) never match
+        matched = np.append(matched, None)
+        scores = np.append(scores, np.nan)
+        return pd.DataFrame({
+            'fuzzy_matched_name': matched[codes],
+            'match_score': scores[codes],
+        }, index=names.index)
+
+
+# === Recall against exact scoring ===
+def recall_at_k(index, names, expected, ks):
+    """
+    Share of the names with an expected choice (not None) whose expected
+    choice is among their top k candidates, for every k.
+    """
+    position = {choice: i for i, choice in enumerate(index.choices)}
+    labelled = [i for i, e in enumerate(expected) if e is not None and e in position]
+    if not labelled:
+        return pd.Series(np.nan, index=pd.Index(ks, name='k'), name='recall')
+
+    rows, cols, _ = index.top_k([names[i] for i in labelled], max(ks))
+    target = np.array([position[expected[i]] for i in labelled])
+    found = cols == target[rows]
+    # Rank of the expected choice among the candidates of its name
+    starts = np.searchsorted(rows, np.arange(len(labelled)))
+    rank = np.full(len(labelled), np.inf)
+    rank[rows[found]] = np.flatnonzero(found) - starts[rows[found]]
+    return pd.Series([(rank < k).mean() for k in ks], index=pd.Index(ks, name='k'), name='recall')
+
+
+def evaluate(choices, queries, threshold=90, ks=(1, 5, 10, 20, 50), labels=None, **index_args):
+    """
+    Recall@k of the approximate matcher against exact scoring
+    (InstitutionMatcher) on distinct normalized ``queries``, one row per k:
+    - candidate_recall: the exact match is among the top k candidates,
+    - match_recall: the approximate match reaches the exact match's score
+      (so equally good choices count too),
+    both among the queries with an exact match; label_recall: the expected
+    choice of ``labels`` ({query: choice}, e.g. hand-checked pairs or the
+    source names of synthetic queries) is among the top k candidates.
+    Also the matches, the agreement with the exact matches (same match or
+    same no-match), the seconds of both matchers (index builds included)
+    and the speedup.
+    """
+    choices = [c for c in choices if isinstance(c, str) and c]
+    queries = [q for q in dict.fromkeys(queries) if isinstance(q, str) and q]
+
+    start = time.perf_counter()
+    exact_names, exact_scores = InstitutionMatcher(choices, threshold=threshold).match_unique(queries)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = NgramTfidfIndex(choices, **index_args)
+    index_seconds = time.perf_counter() - start
+
+    candidate_recall = recall_at_k(index, queries, list(exact_names), ks)
+    if labels is not None:
+        label_recall = recall_at_k(index, queries, [labels.get(q) for q in queries], ks)
+    has_exact = ~np.isnan(exact_scores)
+
+    rows = []
+    for k in ks:
+        start = time.perf_counter()
+        approx_names, approx_scores = ApproximateMatcher(choices, threshold, k=k, index=index).match_unique(queries)
+        seconds = index_seconds + time.perf_counter() - start
+        row = {
+            'k': k,
+            'candidate_recall': candidate_recall[k],
+            'match_recall': (approx_scores[has_exact] == exact_scores[has_exact]).mean() if has_exact.any() else np.nan,
+        }
+        if labels is not None:
+            row['label_recall'] = label_recall[k]
+        rows.append({
+            **row,
+            'matches': sum(m is not None for m in approx_names),
+            'exact_matches': int(has_exact.sum()),
+            'agreement': np.mean([a == e for a, e in zip(approx_names, exact_names)]),
+            'seconds': seconds,
+            'exact_seconds': exact_seconds,
+            'speedup': exact_seconds / seconds,
+        })
+    result = pd.DataFrame(rows)
+    result.insert(0, 'choices', len(choices))
+    result.insert(1, 'queries', len(queries))
+    return result
+
+
+# === Test names ===
+def pipeline_names(ranking_path, institution_path):
+    """Normalized ranking names and the institution names without an exact match (as in 01)."""
+    normalizer = InstitutionNameNormalizer()
+    ranking = pd.read_parquet(ranking_path, columns=['name'])
+    choices = list(dict.fromkeys(normalizer.normalize_series(ranking['name']).dropna()))
+    institutions = pd.read_parquet(institution_path, columns=['display_name'])
+    names = normalizer.normalize_series(institutions['display_name']).dropna().unique()
+    exact = set(choices)
+    return choices, [name for name in names if name not in exact]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--choices', type=int, default=100_000, help='synthetic choices')
+    parser.add_argument('--queries', type=int, default=2_000, help='synthetic queries')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ranking', help='ranking table (Parquet) to match against instead')
+    parser.add_argument('--institutions', default='cleaned_data/institution_2019_clean.parquet')
+    parser.add_argument('--labels', help='reviewed fuzzy matches (xlsx with display_name_clean, '
+                                         'fuzzy_matched_name, keep) used as the expected choices')
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5, 10, 20, 50])
+    parser.add_argument('--threshold', type=float, default=90)
+    parser.add_argument('--output-dir', default=RESULT_DIR)
+    args = parser.parse_args()
+
+    labels = None
+    if args.ranking:
+        choices, queries = pipeline_names(args.ranking, args.institutions)
+    else:
+        choices, queries, labels = synthetic_names(args.choices, args.queries, args.seed)
+    if args.labels:
+        checked = pd.read_excel(args.labels)
+        checked = checked[checked['keep'] == 1]
+        labels = dict(zip(checked['display_name_clean'], checked['fuzzy_matched_name']))
+
+    result = evaluate(choices, queries, args.threshold, args.k, labels)
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"candidate_recall_{datetime.now():%Y%m%d_%H%M%S}.csv")
+    result.to_csv(path, index=False)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(result.to_string(index=False))
+    print(f'\nResults: {path}')
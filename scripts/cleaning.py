@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Cleaning steps of 00_load_and_clean.py as reusable functions, plus a chunked
+streaming mode for dumps that do not fit in memory.
+
+00_load_and_clean.py applies these functions to whole DataFrames (with the
+inspection output). ``run_streaming`` applies the same steps to the
+publication and institution files chunk by chunk:
+- the DOI column of the publication file is read first and numbered
+  (doi_keys, see keys.py),
+- publication chunks are cleaned, keyed and appended to data_2019_clean,
+- institution chunks are cleaned, keyed, filtered on the DOI keys,
+  deduplicated against the rows already written (row hashes of a
+  dtype-stable form, as the dtypes inferred per chunk differ) and appended
+  to institution_2019_clean.
+The stream functions also take other table names (batch_driver.py uses them
+for every publication year).
+Peak memory is bounded by the chunk size (plus the key dictionaries and the
+row hashes of the kept institution rows).
+
+``--check DIR`` compares the streamed tables with the tables of the same
+name in DIR (e.g. cleaned_data/ written by 00_load_and_clean.py), so the
+two modes can be checked on any data set, e.g. synthetic_data.py; small
+chunks exercise the dtypes and categories that differ between chunks:
+    python scripts/cleaning.py --chunk-size 13 --output-dir cleaned_data/streamed --check cleaned_data
+
+Usage (from the repository root):
+    python scripts/cleaning.py --chunk-size 200000
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from keys import KeyDictionary, in_dictionary, institution_doi
+from ranking_parsing import parse_gender_ratio, parse_rank
+from storage import ChunkedTableWriter, read_table, write_table
+
+# Altmetric-type columns where NaN means "no mention"
+ALTMETRIC_COLS = [
+    'linkedin', 'misc', 'facebook', 'googleplus', 'video', 'weibo', 'twitter', 'wikipedia',
+    'blogs', 'news', 'reddit', 'policy', 'patent', 'qa', 'pinterest', 'syllabi', 'f1000',
+    'book_reviews', 'peer_reviews', 'stot', 'stot_log', 'stot_log_stand', 'stot_log_jb_stand'
+]
+
+# Institutions without display_name / country_code in OpenAlex
+KNOWN_INSTITUTIONS = {
+    'https://openalex.org/I4210154534': ('Instituto de Investigacións Mariñas', 'ES'),
+}
+
+# Tables written by run_streaming
+STREAMED_TABLES = [
+    'author_clean', 'data_2019_clean', 'institution_2019_clean', 'ranking_clean',
+    'doi_keys', 'author_keys',
+]
+
+
+# === Columns ===
+def normalize_column_names(df):
+    """Strip, lowercase, snake_case and drop special characters (in place)."""
+    df.columns = (
+        df.columns
+        .str.strip()
+        .str.lower()
+        .str.replace(' ', '_')
+        .str.replace(r'[^\w\d_]', '', regex=True)
+    )
+    return df
+
+
+def drop_unnamed_columns(df):
+    """Drop the index columns written by earlier exports (in place)."""
+    unnamed_cols = [col for col in df.columns if col.startswith('unnamed')]
+    df.drop(columns=unnamed_cols, inplace=True)
+    return df
+
+
+# === Tables ===
+def clean_author(df):
+    # 'last_known_institution' is completely empty
+    df = df.drop(columns=['last_known_institution'])
+    # Counts stay integers where some are missing (Int64, as in storage.SCHEMAS)
+    df[['works_count', 'cited_by_count']] = df[['works_count', 'cited_by_count']].astype('Int64')
+    return df
+
+
+def clean_data_2019(df):
+    """Fill missing codes and mentions, parse pubdate and normalize DOIs."""
+    df = df.copy()
+    df['code'] = df['code'].fillna('unknown')
+    df[ALTMETRIC_COLS] = df[ALTMETRIC_COLS].fillna(0)
+    df['pubdate'] = pd.to_datetime(df['pubdate'], errors='coerce')
+    df['doi'] = df['doi'].str.strip().str.lower()
+    return df
+
+
+def normalize_institution_doi(df):
+    """Lowercase institution DOIs and remove the 'https://doi.org/' prefix."""
+    df = df.copy()
+    df['doi'] = institution_doi(df['doi'])
+    return df
+
+
+def fix_known_institutions(df):
+    """Fill display_name and country_code of institutions missing them in OpenAlex."""
+    df = df.copy()
+    for institution, (display_name, country_code) in KNOWN_INSTITUTIONS.items():
+        is_known = df['institutions'] == institution
+        df.loc[is_known, 'display_name'] = display_name
+        df.loc[is_known, 'country_code'] = country_code
+    return df
+
+
+# === Ranking ===
+def clean_ranking(df):
+    """Numeric student counts, international share, gender split and rank."""
+    df = df.copy()
+
+    # Remove commas and convert to numeric
+    df['stats_number_students'] = (
+        df['stats_number_students']
+        .str.replace(',', '')
+        .astype(float)
+    )
+
+    # Clean and convert 'stats_pc_intl_students' safely
+    df['stats_pc_intl_students'] = (
+        df['stats_pc_intl_students']
+        .astype(str)                          # Ensure string type
+        .str.strip()                          # Remove leading/trailing spaces
+        .replace('', np.nan)                  # Replace truly empty strings with NaN
+        .str.replace('%', '', regex=False)    # Remove percentage symbol
+        .replace('', np.nan)                  # In case removing '%' left an empty string
+        .astype(float)                        # Finally convert to float
+    )
+
+    # Split stats_female_male_ratio into numeric columns
+    df[['female_pct', 'male_pct']] = parse_gender_ratio(df['stats_female_male_ratio'])
+
+    # Clean rank column to numeric format (rank_clean)
+    df['rank_clean'] = parse_rank(df['rank'])
+    return df
+
+
+# === Streaming mode ===
+def _read_chunks(path, chunk_size):
+    for chunk in pd.read_csv(path, encoding='utf-8', chunksize=chunk_size):
+        yield drop_unnamed_columns(normalize_column_names(chunk))
+
+
+def collect_column(path, column, chunk_size):
+    """Distinct values of one column of a CSV file, reading only that column."""
+    raw_columns = pd.read_csv(path, encoding='utf-8', nrows=0).columns
+    normalized = normalize_column_names(pd.DataFrame(columns=raw_columns)).columns
+    raw_name = raw_columns[normalized.get_loc(column)]
+    values = [
+        chunk[raw_name].drop_duplicates()
+        for chunk in pd.read_csv(path, encoding='utf-8', usecols=[raw_name], chunksize=chunk_size)
+    ]
+    return pd.concat(values, ignore_index=True).drop_duplicates()
+
+
+def stream_publications(path, chunk_size, directory='cleaned_data', name='data_2019_clean'):
+    """
+    Clean a publication file chunk by chunk into table ``name``; its DOI
+    dictionary is built first and saved as doi_keys.
+    Returns the DOI dictionary and whether any DOI is missing.
+    """
+    doi_keys = KeyDictionary.build('doi', collect_column(path, 'doi', chunk_size))
+    doi_keys.save(directory)
+
+    writer = ChunkedTableWriter(name, directory, schema='data_2019_clean')
+    has_missing_doi = False
+    for chunk in _read_chunks(path, chunk_size):
+        chunk = clean_data_2019(chunk)
+        chunk['doi_key'] = doi_keys.lookup(chunk['doi'])
+        has_missing_doi |= chunk['doi'].isna().any()
+        writer.write(chunk)
+    writer.close()
+    print(f"{name}: {writer.rows} rows, {len(doi_keys)} distinct DOIs")
+    return doi_keys, has_missing_doi
+
+
+def _dtype_stable(df):
+    """
+    Values of a chunk in a form that does not depend on the dtypes read_csv
+    inferred for that chunk (int / float / all-missing object columns):
+    strings, integral numbers without a decimal part, missing values as None.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            numbers = values.astype(float)
+            integral = numbers.notna() & (numbers % 1 == 0)
+            text = numbers.astype(str).astype(object)
+            text[integral] = numbers[integral].astype(np.int64).astype(str)
+        else:
+            text = values.astype(str).astype(object)
+        columns[col] = text.where(values.notna(), None)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def stream_institutions(path, doi_keys, has_missing_doi, author_keys, chunk_size,
+                        directory='cleaned_data', name='institution_2019_clean'):
+    """
+    Clean the institution file chunk by chunk into table ``name``,
+    keeping only rows whose DOI is a kept publication (missing DOIs match
+    each other, as with ``isin``) and dropping exact duplicate rows.
+    """
+    writer = ChunkedTableWriter(name, directory, schema='institution_2019_clean')
+    seen_rows = set()
+    for chunk in _read_chunks(path, chunk_size):
+        chunk = normalize_institution_doi(chunk)
+        chunk['doi_key'] = doi_keys.lookup(chunk['doi'])
+        chunk['author_key'] = author_keys.lookup(chunk['author'])
+
+        # Keep only rows where the DOI exists in the publication data
+        chunk = chunk[in_dictionary(chunk['doi_key'], has_missing_doi)]
+
+        # Exact duplicates within the chunk and with the rows already written
+        row_hashes = pd.util.hash_pandas_object(_dtype_stable(chunk), index=False).to_numpy()
+        keep = ~pd.Series(row_hashes).duplicated().to_numpy()
+        keep &= np.array([h not in seen_rows for h in row_hashes], dtype=bool)
+        seen_rows.update(row_hashes[keep].tolist())
+
+        writer.write(fix_known_institutions(chunk[keep]))
+    writer.close()
+    print(f"{name}: {writer.rows} rows")
+
+
+def build_author_keys(df_author, institutions_path, chunk_size, directory='cleaned_data'):
+    """Author dictionary of the author table and the institution file, saved as author_keys."""
+    author_keys = KeyDictionary.build(
+        'author', df_author['author'], collect_column(institutions_path, 'author', chunk_size)
+    )
+    author_keys.save(directory)
+    return author_keys
+
+
+def run_streaming(chunk_size, data_dir='data', directory='cleaned_data'):
+    """Produce all four cleaned tables, streaming the two large files."""
+    os.makedirs(directory, exist_ok=True)
+    institutions_path = f'{data_dir}/merged_institutions_data.csv'
+
+    # Small tables are loaded at once
+    df_author = pd.read_csv(f'{data_dir}/merged_author_data.csv', encoding='utf-8')
+    df_ranking = pd.read_csv(f'{data_dir}/2019_rankings.csv', encoding='utf-8')
+    for df in [df_author, df_ranking]:
+        drop_unnamed_columns(normalize_column_names(df))
+    df_author = clean_author(df_author)
+    author_keys = build_author_keys(df_author, institutions_path, chunk_size, directory)
+    df_author['author_key'] = author_keys.lookup(df_author['author'])
+    write_table(df_author, 'author_clean', directory)
+    write_table(clean_ranking(df_ranking), 'ranking_clean', directory)
+
+    doi_keys, has_missing_doi = stream_publications(
+        f'{data_dir}/data_2019.csv', chunk_size, directory
+    )
+    stream_institutions(
+        institutions_path, doi_keys, has_missing_doi, author_keys, chunk_size, directory
+    )
+
+
+def compare_tables(directory, reference):
+    """
+    Names of the cleaned tables and key dictionaries of ``directory`` that
+    differ from those of ``reference`` (values, dtypes, row order).
+    """
+    differ = []
+    for name in STREAMED_TABLES:
+        try:
+            pd.testing.assert_frame_equal(read_table(name, directory=directory),
+                                          read_table(name, directory=reference))
+        except AssertionError:
+            differ.append(name)
+    return differ
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--chunk-size', type=int, default=200_000)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--output-dir', default='cleaned_data')
+    parser.add_argument('--check', metavar='DIR', default=None,
+                        help='compare the streamed tables with those in DIR')
+    args = parser.parse_args()
+    run_streaming(args.chunk_size, args.data_dir, args.output_dir)
+    if args.check:
+        differ = compare_tables(args.output_dir, args.check)
+        print(f"Streamed tables equal to {args.check}: {not differ}"
+              + (f" (differ: {', '.join(differ)})" if differ else ''))
+        if differ:
+            raise SystemExit(1)
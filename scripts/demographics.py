@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Per-article demographic majority labels in one grouped NumPy pass.
+
+Article ids (parent_id) are integer coded once; the per-article sums and
+counts are ``np.bincount`` over those codes, and the labels are taken back to
+the rows by position (no merge or map over strings).
+
+- gender_majority: the larger of the summed female and male counts of the
+  article's rows ('gender_female_majority' / 'gender_male_majority'), ties
+  are 'gender_undetermined_majority' (the rule of the 02 notebook);
+- ethnicity majority: the most frequent ethnicity_majority value among the
+  article's rows; ties between values get ``ethnicity_tie_label``.
+Rows without an article id get no label.
+"""
+
+import numpy as np
+import pandas as pd
+
+GENDER_LABELS = np.array(
+    ['gender_undetermined_majority', 'gender_female_majority', 'gender_male_majority'],
+    dtype=object
+)
+
+
+def _article_codes(ids):
+    codes, uniques = pd.factorize(ids)
+    return codes, len(uniques)
+
+
+def _take(labels, codes):
+    """Per-article labels to rows (NaN where the row has no article)."""
+    out = np.append(labels, np.nan).astype(object)
+    return out[np.where(codes >= 0, codes, len(labels))]
+
+
+def gender_majority_labels(female, male, codes, n_articles):
+    """Gender majority label of every article from its summed female / male counts."""
+    valid = codes >= 0
+    female_sum = np.bincount(codes[valid], weights=np.nan_to_num(female[valid]), minlength=n_articles)
+    male_sum = np.bincount(codes[valid], weights=np.nan_to_num(male[valid]), minlength=n_articles)
+
+    # 0: tie, 1: female, 2: male
+    choice = np.select([female_sum > male_sum, male_sum > female_sum], [1, 2], default=0)
+    return GENDER_LABELS[choice]
+
+
+def mode_labels(values, codes, n_articles, tie_label=None):
+    """Most frequent value per article (ties get tie_label, no values NaN)."""
+    value_codes, categories = pd.factorize(values)
+    valid = (codes >= 0) & (value_codes >= 0)
+    n_values = len(categories)
+    labels = np.full(n_articles, np.nan, dtype=object)
+    if n_values == 0:
+        return labels
+
+    counts = np.bincount(
+        codes[valid] * n_values + value_codes[valid], minlength=n_articles * n_values
+    ).reshape(n_articles, n_values)
+    best = counts.argmax(axis=1)
+    top = counts.max(axis=1)
+    n_top = (counts == top[:, None]).sum(axis=1)
+
+    has_values = top > 0
+    labels[has_values] = np.asarray(categories, dtype=object)[best[has_values]]
+    labels[has_values & (n_top > 1)] = tie_label
+    return labels
+
+
+def demographic_majorities(df, id_col='parent_id', ethnicity_tie_label='ethnicity_undetermined_majority'):
+    """
+    gender_majority and ethnicity_majority of every row's article, as a
+    DataFrame aligned with ``df``.
+    """
+    codes, n_articles = _article_codes(df[id_col])
+    gender = gender_majority_labels(
+        df['female'].to_numpy(dtype=float), df['male'].to_numpy(dtype=float), codes, n_articles
+    )
+    ethnicity = mode_labels(
+        df['ethnicity_majority'].to_numpy(), codes, n_articles, tie_label=ethnicity_tie_label
+    )
+    return pd.DataFrame({
+        'gender_majority': _take(gender, codes),
+        'ethnicity_majority': _take(ethnicity, codes),
+    }, index=df.index)
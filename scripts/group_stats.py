@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Group comparison tests for many (outcome, factor, strata) specs in one call.
+
+A spec is ``(outcome, factor, strata)``, e.g.
+``('stot_log1p', 'gender_majority', 'rank_group')``; strata None means the
+whole table. The table is partitioned once per strata column (one groupby)
+and every requested test is computed for every stratum from the same group
+codes, sums and ranks:
+- 'anova': one-way ANOVA F test (as stats.f_oneway), effect size eta²,
+- 'kruskal': Kruskal–Wallis H test with tie correction (as stats.kruskal),
+  effect size epsilon² = H / (n - 1),
+- 'dunn': Dunn's pairwise z tests on the same ranks (as sp.posthoc_dunn),
+  one row per pair, estimate = difference of mean ranks,
+- 'ols': outcome ~ C(factor) by least squares (as smf.ols), one row per
+  non-reference level (the first level, as in patsy), estimate = coefficient,
+  effect size R².
+Strata can be run on a process pool (``workers``); with a ``shared`` frame
+(shared_frames.py) the workers read the columns from its memory-mapped files
+and the tasks only carry row positions.
+
+The result is one tidy table, one row per test (and per pair / level), with
+``p_bonferroni``: the p-value times the number of rows of its family, capped
+at 1. By default a family is all rows of a spec and test (so all strata);
+add 'stratum' to ``family`` to correct within every stratum (the Bonferroni
+adjustment of the notebook's Dunn tables).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+TESTS = ('anova', 'kruskal', 'dunn', 'ols')
+
+RESULT_COLUMNS = [
+    'outcome', 'factor', 'strata', 'stratum', 'test', 'term', 'n', 'n_groups',
+    'statistic', 'df_num', 'df_den', 'p_value', 'estimate', 'effect_size',
+    'effect_measure', 'p_bonferroni'
+]
+
+FAMILY = ('outcome', 'factor', 'strata', 'test')
+
+
+# === Tests of one stratum ===
+def _tie_sum(ranks_sorted_values):
+    """Sum of t³ - t over the tie groups of sorted values."""
+    _, counts = np.unique(ranks_sorted_values, return_counts=True)
+    return float((counts ** 3 - counts).sum())
+
+
+def _row(test, n, k, statistic=np.nan, df_num=np.nan, df_den=np.nan, p_value=np.nan,
+         term=None, estimate=np.nan, effect_size=np.nan, effect_measure=None):
+    return {
+        'test': test, 'term': term, 'n': n, 'n_groups': k, 'statistic': statistic,
+        'df_num': df_num, 'df_den': df_den, 'p_value': p_value, 'estimate': estimate,
+        'effect_size': effect_size, 'effect_measure': effect_measure,
+    }
+
+
+def group_tests(values, codes, levels, tests=TESTS):
+    """
+    All requested tests of one outcome across the groups given by codes
+    (indices into levels, -1 for missing). Rows with a missing value or
+    group are dropped; groups without rows are left out.
+    Returns a list of result dicts.
+    """
+    keep = (codes >= 0) & ~np.isnan(values)
+    values = values[keep]
+    present, codes = np.unique(codes[keep], return_inverse=True)
+    labels = np.asarray(levels, dtype=object)[present]
+    n, k = len(values), len(present)
+    if k < 2:
+        return [_row(test, n, k) for test in tests]
+
+    sizes = np.bincount(codes, minlength=k).astype(float)
+    means = np.bincount(codes, weights=values, minlength=k) / sizes
+    grand_mean = values.mean()
+    ss_between = float((sizes * (means - grand_mean) ** 2).sum())
+    ss_within = float(((values - means[codes]) ** 2).sum())
+    df_between, df_within = k - 1, n - k
+
+    rows = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = ss_between / (ss_between + ss_within)
+        mse = ss_within / df_within if df_within > 0 else np.nan
+
+        if 'anova' in tests:
+            f_stat = (ss_between / df_between) / mse
+            rows.append(_row(
+                'anova', n, k, f_stat, df_between, df_within, stats.f.sf(f_stat, df_between, df_within),
+                effect_size=r_squared, effect_measure='eta_squared'
+            ))
+
+        if 'kruskal' in tests or 'dunn' in tests:
+            order = np.argsort(values, kind='mergesort')
+            ranks = stats.rankdata(values)
+            tie_sum = _tie_sum(values[order])
+            mean_ranks = np.bincount(codes, weights=ranks, minlength=k) / sizes
+
+        if 'kruskal' in tests:
+            h_stat = 12 / (n * (n + 1)) * (sizes * mean_ranks ** 2).sum() - 3 * (n + 1)
+            h_stat /= 1 - tie_sum / (n ** 3 - n)
+            rows.append(_row(
+                'kruskal', n, k, h_stat, df_between, p_value=stats.chi2.sf(h_stat, df_between),
+                effect_size=h_stat / (n - 1), effect_measure='epsilon_squared'
+            ))
+
+        if 'dunn' in tests:
+            variance = n * (n + 1) / 12 - tie_sum / (12 * (n - 1))
+            first, second = map(np.array, zip(*combinations(range(k), 2)))
+            difference = mean_ranks[first] - mean_ranks[second]
+            z = difference / np.sqrt(variance * (1 / sizes[first] + 1 / sizes[second]))
+            p_values = 2 * stats.norm.sf(np.abs(z))
+            for i, j, diff, z_ij, p_ij in zip(first, second, difference, z, p_values):
+                rows.append(_row(
+                    'dunn', n, k, z_ij, p_value=p_ij, term=f'{labels[i]} vs {labels[j]}',
+                    estimate=diff
+                ))
+
+        if 'ols' in tests:
+            # Treatment coding with the first level as reference
+            coefs = means[1:] - means[0]
+            std_errors = np.sqrt(mse * (1 / sizes[1:] + 1 / sizes[0]))
+            t_stats = coefs / std_errors
+            p_values = 2 * stats.t.sf(np.abs(t_stats), df_within)
+            for label, coef, t_stat, p_value in zip(labels[1:], coefs, t_stats, p_values):
+                rows.append(_row(
+                    'ols', n, k, t_stat, df_den=df_within, p_value=p_value, term=str(label),
+                    estimate=coef, effect_size=r_squared, effect_measure='r_squared'
+                ))
+    return rows
+
+
+def _shared_columns(shared, rows, outcomes, present):
+    """Columns of one stratum read from a SharedFrame, as _tasks slices them."""
+    columns = {o: shared.values(o, rows) for o in outcomes}
+    columns.update({f: shared.factor(f, rows, levels) for f, levels in present.items()})
+    return columns
+
+
+def _run_stratum(task):
+    """Tests of all specs of one stratum (runs in a worker when parallel)."""
+    strata, stratum, columns, specs, tests = task
+    if isinstance(columns, tuple):
+        columns = _shared_columns(*columns)
+    rows = []
+    for outcome, factor in specs:
+        codes, levels = columns[factor]
+        for row in group_tests(columns[outcome], codes, levels, tests):
+            rows.append({'outcome': outcome, 'factor': factor, 'strata': strata,
+                         'stratum': stratum, **row})
+    return rows
+
+
+# === Batched engine ===
+def _factor_codes(series):
+    """Integer codes and levels of a factor (category order, else sorted as patsy)."""
+    codes, levels = pd.factorize(series, sort=True)
+    return codes, np.asarray(levels, dtype=object)
+
+
+def _tasks(df, specs, tests, shared=None):
+    """
+    One task per (strata column, stratum), from one groupby per strata column.
+    With ``shared``, a task holds the row positions of its stratum in the
+    SharedFrame instead of the columns.
+    """
+    by_strata = {}
+    for outcome, factor, strata in specs:
+        by_strata.setdefault(strata, []).append((outcome, factor))
+
+    if shared is None:
+        # Whole-table arrays, converted once
+        outcomes = {o: df[o].to_numpy(dtype=float) for o, _, _ in specs}
+        factors = {f: _factor_codes(df[f]) for _, f, _ in specs}
+    else:
+        rows = shared.rows(df)
+        present = {f: shared.factor_levels(f, rows) for _, f, _ in specs}
+
+    for strata, pairs in by_strata.items():
+        if strata is None:
+            partitions = [('all', np.arange(len(df)))]
+        else:
+            partitions = df.groupby(strata, observed=True, sort=True).indices.items()
+        needed_outcomes = dict.fromkeys(o for o, _ in pairs)
+        needed_factors = dict.fromkeys(f for _, f in pairs)
+        for stratum, positions in partitions:
+            if shared is None:
+                columns = {o: outcomes[o][positions] for o in needed_outcomes}
+                columns.update({f: (factors[f][0][positions], factors[f][1]) for f in needed_factors})
+            else:
+                # Only the row positions are pickled to the workers
+                columns = (shared, rows[positions], list(needed_outcomes),
+                           {f: present[f] for f in needed_factors})
+            yield strata, stratum, columns, pairs, tests
+
+
+def bonferroni(results, family=FAMILY):
+    """p_bonferroni: p-value times the number of tested rows of its family, capped at 1."""
+    tested = results['p_value'].notna()
+    size = tested.groupby([results[col] for col in family], dropna=False).transform('sum')
+    return (results['p_value'] * size).clip(upper=1)
+
+
+def compare_groups(df, specs, tests=TESTS, family=FAMILY, workers=1, shared=None):
+    """
+    Run ``tests`` for every (outcome, factor, strata) spec and every stratum.
+    ``workers`` > 1 runs the strata on a process pool. ``shared`` is a
+    SharedFrame holding the rows of ``df`` (e.g. of the analytic table that
+    ``df`` is a subset of); the columns are then read from it.
+    Returns the tidy results table (RESULT_COLUMNS).
+    """
+    unknown = set(tests) - set(TESTS)
+    if unknown:
+        raise ValueError(f"Unknown tests: {sorted(unknown)}")
+    specs = [tuple(spec) + (None,) * (3 - len(spec)) for spec in specs]
+    tasks = list(_tasks(df, specs, tuple(tests), shared))
+
+    if workers is not None and workers <= 1:
+        chunks = map(_run_stratum, tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_run_stratum, tasks, chunksize=max(1, len(tasks) // 64)))
+
+    results = pd.DataFrame([row for chunk in chunks for row in chunk],
+                           columns=RESULT_COLUMNS[:-1])
+    results['p_bonferroni'] = bonferroni(results, family)
+    return results
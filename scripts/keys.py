@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Dense integer surrogate keys of DOIs and authors.
+
+DOIs and author ids are canonicalized once and numbered in sorted order
+(``KeyDictionary``); the dictionaries are saved as the tables doi_keys and
+author_keys (key, value). The cleaned tables carry the keys (doi_key,
+author_key, int32), so merges, filters and groupbys on DOIs and authors run
+on integers instead of hashing the strings again.
+
+Keys of values that cannot be joined:
+- MISSING_KEY (-1): missing value; missing values match each other, like
+  NaN keys in a pandas merge or ``isin``,
+- UNKNOWN_KEY (-2): a value that is not in the dictionary; it matches no
+  row of the table the dictionary was built from.
+"""
+
+import numpy as np
+import pandas as pd
+
+from storage import CLEANED_DIR, read_table, write_table
+
+MISSING_KEY = -1
+UNKNOWN_KEY = -2
+
+DOI_PREFIX = 'https://doi.org/'
+
+
+# === Canonical values ===
+def canonical_doi(series):
+    """Stripped, lowercase DOI (publication DOIs are joined as they are)."""
+    return series.str.strip().str.lower()
+
+
+def institution_doi(series):
+    """Canonical DOI without the 'https://doi.org/' prefix of the OpenAlex institution rows."""
+    return canonical_doi(series).str.replace(DOI_PREFIX, '', regex=False)
+
+
+def canonical_author(series):
+    """Author id (OpenAlex URL) without surrounding whitespace."""
+    return series.str.strip()
+
+
+CANONICAL = {
+    'doi': canonical_doi,
+    'author': canonical_author,
+}
+
+
+# === Dictionaries ===
+class KeyDictionary:
+    """
+    Sorted distinct canonical values of one kind ('doi', 'author');
+    the key of a value is its position.
+    """
+
+    def __init__(self, name, values):
+        if len(values) > np.iinfo(np.int32).max:
+            raise ValueError(f"Too many {name} values for int32 keys: {len(values)}")
+        self.name = name
+        self.values = pd.Index(values, dtype=object)
+
+    @classmethod
+    def build(cls, name, *series):
+        """Dictionary of all non-missing values of the given Series."""
+        values = pd.concat([CANONICAL[name](s.astype(object)) for s in series], ignore_index=True)
+        return cls(name, np.sort(values.dropna().unique()))
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def key_column(self):
+        return f'{self.name}_key'
+
+    def lookup(self, series):
+        """int32 keys of a Series (MISSING_KEY / UNKNOWN_KEY where not found)."""
+        canonical = CANONICAL[self.name](series.astype(object))
+        keys = self.values.get_indexer(canonical)
+        missing = canonical.isna().to_numpy()
+        keys[(keys < 0) & ~missing] = UNKNOWN_KEY
+        keys[missing] = MISSING_KEY
+        return keys.astype(np.int32)
+
+    def decode(self, keys):
+        """Values of keys (NaN for missing and unknown keys)."""
+        keys = np.asarray(keys)
+        values = np.append(self.values.to_numpy(), np.nan)
+        return values[np.where(keys >= 0, keys, len(self.values))]
+
+    def to_frame(self):
+        return pd.DataFrame({
+            self.key_column: np.arange(len(self.values), dtype=np.int32),
+            self.name: self.values.to_numpy(),
+        })
+
+    def save(self, directory=CLEANED_DIR):
+        return write_table(self.to_frame(), f'{self.name}_keys', directory)
+
+    @classmethod
+    def load(cls, name, directory=CLEANED_DIR):
+        table = read_table(f'{name}_keys', directory=directory)
+        return cls(name, table.sort_values(f'{name}_key')[name].to_numpy())
+
+
+def in_dictionary(keys, missing_matches):
+    """
+    Rows whose key is in the dictionary; missing keys only if the dictionary
+    table has missing values too (``isin`` semantics).
+    """
+    keys = np.asarray(keys)
+    return (keys >= 0) | ((keys == MISSING_KEY) & bool(missing_matches))
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy execution mode of the pipeline (Polars): load -> clean -> 2019 DOI
+filter -> rank join -> analytic merge, with the same outputs as
+00_load_and_clean.py + 01_merge_rank_institution.py + analytic_table.py.
+
+The large inputs are scanned lazily and each is read once:
+- publications: only the DOI and the columns of the analytic table are read
+  (projection pushdown), DOIs are cleaned in the plan,
+- institutions: DOIs are canonicalized, rows are kept by a semi join on the
+  publication DOIs and exact duplicates are dropped (this needs every column,
+  as drop_duplicates in 00); the author key dictionary comes from the same scan,
+- authors: only author, works_count and cited_by_count are read.
+The scans run together (``pl.collect_all``, shared subplans, all cores of the
+Polars thread pool, POLARS_MAX_THREADS). The steps that only Python code can
+do run on distinct values and are joined back: name normalization and the
+exact / fuzzy / manual rank resolution of 01 (per distinct display name,
+small pandas tables), pubdate parsing (per distinct date string). The rank,
+key and analytic joins are one lazy plan over the collected frames.
+
+Same outputs: the CSVs are read as text with pandas' missing-value
+strings and typed as ``pd.read_csv`` would (int, float or text column), the
+DOI / author keys are the positions in the sorted dictionaries (keys.py), the
+ranked CSV is written by pandas, and the derived columns and dtypes of the
+analytic table come from analytic_table.py. Floats parsed from the CSVs can
+differ from pd.read_csv in the last bit (Polars rounds correctly).
+As in 01, final_rank takes the rank of the accepted fuzzy match where there
+is no exact rank, and accepted fuzzy names (manual_review/fuzzy_manual_checked.xlsx) and
+manual pairings (manual_review/unmatched_ranked_paired.xlsx) repeat rows if
+a name appears more than once there. The review exports and the match cache
+of 01 are not written.
+
+Usage (from the repository root):
+    python scripts/lazy_pipeline.py --output-dir cleaned_data/lazy --check
+``--check`` compares the outputs with cleaned_data/ranked_institution_2019.csv
+and the analytic table of the pandas path (analytic_table.py).
+"""
+
+import argparse
+import filecmp
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from analytic_table import (
+    ANALYTIC_PATH, DATA_COLUMNS, RANKED_PATH, add_derived_columns, build_analytic_table,
+    compact_dtypes
+)
+from cleaning import (
+    KNOWN_INSTITUTIONS, clean_ranking, drop_unnamed_columns, normalize_column_names
+)
+from institution_matching import InstitutionMatcher
+from keys import DOI_PREFIX, MISSING_KEY, UNKNOWN_KEY
+from name_normalization import InstitutionNameNormalizer
+from storage import ALTMETRIC_COUNT_COLS, apply_schema
+
+# Strings that pd.read_csv reads as missing by default
+PANDAS_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+# Columns of ranked_institution_2019.csv (final_columns of 01)
+RANKED_CSV_COLUMNS = [
+    'parent_id', 'doi', 'author', 'author_position', 'institutions', 'ror',
+    'display_name_original', 'display_name_clean', 'country_code', 'type',
+    'homepage_url', 'final_rank', 'rank_flag'
+]
+
+# Institution columns read by 01
+INSTITUTION_COLUMNS = [
+    'parent_id', 'doi', 'author', 'author_position', 'institutions', 'ror',
+    'display_name', 'country_code', 'type', 'homepage_url'
+]
+
+# Institution columns stored as strings in institution_2019_clean (storage.py)
+INSTITUTION_TEXT_COLUMNS = ['doi', 'author', 'institutions', 'display_name']
+
+
+# === Reading ===
+def scan_table(path):
+    """Lazy scan of a raw CSV as text, with the cleaned column names of 00."""
+    header = pl.read_csv(path, n_rows=0, infer_schema=False).columns
+    names = list(normalize_column_names(pd.DataFrame(columns=header)).columns)
+    frame = pl.scan_csv(path, infer_schema=False, null_values=PANDAS_NA_VALUES, new_columns=names)
+    return frame.drop([name for name in names if name.startswith('unnamed')])
+
+
+def infer_csv_types(df, columns):
+    """
+    Type text columns as pd.read_csv would: integers if every value is one
+    (float if some are missing, as after to_pandas), else floats if every
+    value is a number, else text. Columns without values are floats.
+    """
+    columns = [col for col in columns if df.schema[col] == pl.String]
+    if not columns:
+        return df
+    counts = df.select(
+        *[pl.col(col).count().alias(f'{col}:n') for col in columns],
+        *[pl.col(col).str.to_integer(strict=False).count().alias(f'{col}:int') for col in columns],
+        *[pl.col(col).cast(pl.Float64, strict=False).count().alias(f'{col}:float') for col in columns],
+    ).row(0, named=True)
+
+    casts = []
+    for col in columns:
+        n = counts[f'{col}:n']
+        if n == 0:
+            casts.append(pl.col(col).cast(pl.Float64))
+        elif counts[f'{col}:int'] == n:
+            casts.append(pl.col(col).str.to_integer())
+        elif counts[f'{col}:float'] == n:
+            casts.append(pl.col(col).cast(pl.Float64))
+    return df.with_columns(casts) if casts else df
+
+
+# === Expressions ===
+def canonical_doi(expr):
+    """keys.canonical_doi: stripped, lowercase."""
+    return expr.str.strip_chars().str.to_lowercase()
+
+
+def institution_doi(expr):
+    """keys.institution_doi: canonical, without the 'https://doi.org/' prefix."""
+    return canonical_doi(expr).str.replace_all(DOI_PREFIX, '', literal=True)
+
+
+def canonical_author(expr):
+    return expr.str.strip_chars()
+
+
+def key_dictionary(*frames):
+    """Sorted distinct values of one-column frames as (value, key) (keys.KeyDictionary)."""
+    values = pl.concat([frame.select(pl.all().alias('value')) for frame in frames])
+    return (
+        values.drop_nulls().unique().sort('value')
+        .with_row_index('key').with_columns(pl.col('key').cast(pl.Int32))
+    )
+
+
+def with_key(frame, dictionary, value, name):
+    """Add the int32 key of the canonical ``value`` expression (MISSING_KEY / UNKNOWN_KEY)."""
+    return (
+        frame.with_columns(value.alias('_value'))
+        .join(dictionary.lazy(), left_on='_value', right_on='value', how='left',
+              maintain_order='left')
+        .with_columns(
+            pl.when(pl.col('_value').is_null()).then(MISSING_KEY)
+            .otherwise(pl.col('key').fill_null(UNKNOWN_KEY))
+            .cast(pl.Int32).alias(name)
+        )
+        .drop('_value', 'key')
+    )
+
+
+# === Plans ===
+def publication_plan(path):
+    """Publications: DOI and the analytic columns only, cleaned as clean_data_2019."""
+    columns = [col for col in DATA_COLUMNS if col != 'doi_key']
+    return (
+        scan_table(path)
+        .select(['doi'] + columns)
+        .with_columns(
+            pl.col('doi').str.strip_chars().str.to_lowercase(),
+            *[pl.col(col).cast(pl.Float64).fill_null(0).cast(pl.Float32) for col in ALTMETRIC_COUNT_COLS],
+        )
+    )
+
+
+def institution_plans(path, publications):
+    """Institution rows of the publication DOIs (deduplicated) and the authors of the whole file."""
+    institutions = scan_table(path).with_columns(institution_doi(pl.col('doi')))
+    dois = publications.select(canonical_doi(pl.col('doi')).alias('_doi')).unique()
+
+    fixes = [pl.col(col) for col in ('display_name', 'country_code')]
+    for institution, (display_name, country_code) in KNOWN_INSTITUTIONS.items():
+        known = pl.col('institutions') == institution
+        fixes[0] = pl.when(known).then(pl.lit(display_name)).otherwise(fixes[0])
+        fixes[1] = pl.when(known).then(pl.lit(country_code)).otherwise(fixes[1])
+
+    kept = (
+        institutions
+        # Missing DOIs match missing DOIs, as isin in 00
+        .join(dois, left_on=canonical_doi(pl.col('doi')), right_on='_doi', how='semi',
+              nulls_equal=True, maintain_order='left')
+        .unique(keep='first', maintain_order=True)
+        .with_columns(fixes[0].alias('display_name'), fixes[1].alias('country_code'))
+        .select(INSTITUTION_COLUMNS)
+    )
+    authors = institutions.select(canonical_author(pl.col('author')))
+    return kept, authors
+
+
+def author_plan(path):
+    return scan_table(path).select('author', 'works_count', 'cited_by_count')
+
+
+# === Rank resolution (per distinct display name) ===
+def _read_reviews(manual_dir):
+    """Accepted fuzzy matches and manual pairings of 01 (empty if not reviewed)."""
+    checked_path = os.path.join(manual_dir, 'fuzzy_manual_checked.xlsx')
+    paired_path = os.path.join(manual_dir, 'unmatched_ranked_paired.xlsx')
+    accepted = pd.DataFrame(columns=['display_name_clean', 'fuzzy_matched_name', 'fuzzy_rank'])
+    manual = pd.DataFrame(columns=['display_name_clean', 'manual_rank'])
+    if os.path.exists(checked_path):
+        checked = pd.read_excel(checked_path)
+        accepted = checked[checked['keep'] == 1][list(accepted.columns)]
+    if os.path.exists(paired_path):
+        manual = pd.read_excel(paired_path)
+        manual = manual[manual['display_name_clean'].notna()][list(manual.columns)]
+    return accepted, manual
+
+
+def _csv_text(value):
+    """Text of a value as DataFrame.to_csv writes it (None if missing)."""
+    if isinstance(value, str):
+        return value
+    return None if pd.isna(value) else str(value)
+
+
+def resolve_names(display_names, df_ranking, accepted, manual, threshold=90):
+    """
+    Sections 5–14 of 01 on distinct display names: display_name_clean and
+    final_rank (exact rank, else rank of the accepted fuzzy match, else
+    manual rank, as CSV text) and rank_flag. A name has one row per accepted fuzzy x manual
+    row of its clean name (at least one).
+    """
+    normalizer = InstitutionNameNormalizer()
+    names = pd.DataFrame({'display_name': display_names})
+    names['display_name_clean'] = normalizer.normalize_series(names['display_name'])
+
+    ranking_name_mapping = {}
+    for norm_name, rank in zip(normalizer.normalize_series(df_ranking['name']), df_ranking['rank']):
+        ranking_name_mapping[norm_name] = rank
+    names['rank'] = names['display_name_clean'].map(ranking_name_mapping)
+
+    mask = names['rank'].isna()
+    matcher = InstitutionMatcher(list(ranking_name_mapping.keys()), threshold=threshold)
+    results = matcher.match(names.loc[mask, 'display_name_clean'])
+    names.loc[mask, 'fuzzy_matched_name'] = results['fuzzy_matched_name']
+    names.loc[mask, 'fuzzy_rank'] = results['match_score']
+
+    names['final_rank'] = names['rank']
+    names = names.merge(accepted, on='display_name_clean', how='left', suffixes=('', '_fuzzy'))
+    names['final_rank'] = names['final_rank'].combine_first(
+        names['fuzzy_matched_name_fuzzy'].map(ranking_name_mapping)
+    )
+    names = names.merge(manual, on='display_name_clean', how='left')
+    names['final_rank'] = names['final_rank'].combine_first(names['manual_rank'])
+
+    return pl.DataFrame({
+        'display_name': [_csv_text(v) for v in names['display_name']],
+        'display_name_clean': [_csv_text(v) for v in names['display_name_clean']],
+        'final_rank': [_csv_text(v) for v in names['final_rank']],
+        'rank_flag': names['final_rank'].notna().astype(np.int64).to_numpy(),
+    }, schema={'display_name': pl.String, 'display_name_clean': pl.String,
+               'final_rank': pl.String, 'rank_flag': pl.Int64})
+
+
+# === Pipeline ===
+def _to_pandas(df):
+    """pandas frame with NaN (not None) in text columns, as read_csv / merge give."""
+    out = df.to_pandas()
+    for col in out.columns[out.dtypes == object]:
+        out[col] = out[col].where(out[col].notna(), np.nan)
+    return out
+
+
+def run_lazy(data_dir='data', manual_dir='manual_review', threshold=90, verbose=True):
+    """
+    Run the whole pipeline; returns the ranked rows (as written to the
+    ranked CSV) and the analytic table, as pandas DataFrames.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    # 1. One scan of every large input (projection / predicate pushdown, shared subplans)
+    publications = publication_plan(f'{data_dir}/data_2019.csv')
+    institutions, institution_authors = institution_plans(
+        f'{data_dir}/merged_institutions_data.csv', publications
+    )
+    authors = author_plan(f'{data_dir}/merged_author_data.csv')
+    df_data, df_inst, inst_authors, df_author = pl.collect_all(
+        [publications, institutions, institution_authors, authors]
+    )
+    df_data = infer_csv_types(df_data, df_data.columns)
+    df_inst = infer_csv_types(df_inst, [c for c in df_inst.columns if c not in INSTITUTION_TEXT_COLUMNS])
+    df_author = infer_csv_types(df_author, ['works_count', 'cited_by_count'])
+    timings['scan_s'] = time.perf_counter() - start
+
+    # Small tables at once, as in 00: ranking (stored with the ranking_clean schema)
+    step = time.perf_counter()
+    df_ranking = pd.read_csv(f'{data_dir}/2019_rankings.csv', encoding='utf-8')
+    drop_unnamed_columns(normalize_column_names(df_ranking))
+    df_ranking = apply_schema(clean_ranking(df_ranking), 'ranking_clean')[['rank', 'name']]
+
+    # Distinct values through the Python-only steps
+    pubdates = df_data['pubdate'].unique(maintain_order=True)
+    parsed = pd.to_datetime(pd.Series(pubdates.to_list(), dtype=object), errors='coerce')
+    pubdate_map = pl.DataFrame({'pubdate': pubdates, '_parsed': parsed.astype('datetime64[ns]')})
+
+    accepted, manual = _read_reviews(manual_dir)
+    resolution = resolve_names(
+        df_inst['display_name'].unique(maintain_order=True).to_list(), df_ranking,
+        accepted, manual, threshold
+    )
+    timings['resolve_s'] = time.perf_counter() - step
+
+    # 2. Rank join: the rows of ranked_institution_2019.csv
+    step = time.perf_counter()
+    ranked = (
+        df_inst.lazy()
+        .join(resolution.lazy(), on='display_name', how='left', nulls_equal=True,
+              maintain_order='left_right')
+        .rename({'display_name': 'display_name_original'})
+        .select(RANKED_CSV_COLUMNS)
+        .collect()
+    )
+    df_ranked = _to_pandas(ranked)
+
+    # 3. Analytic merge on the DOI / author keys, with the ranked CSV typed as read_csv would
+    doi_keys = key_dictionary(df_data.select(canonical_doi(pl.col('doi'))))
+    author_keys = key_dictionary(df_author.select(canonical_author(pl.col('author'))), inst_authors)
+    data = with_key(
+        df_data.lazy()
+        .join(pubdate_map.lazy(), on='pubdate', how='left', maintain_order='left')
+        .with_columns(pl.col('_parsed').alias('pubdate')),
+        doi_keys, canonical_doi(pl.col('doi')), 'doi_key'
+    ).select(DATA_COLUMNS)
+    author = with_key(
+        df_author.lazy(), author_keys, canonical_author(pl.col('author')), 'author_key'
+    ).select('author_key', 'works_count', 'cited_by_count')
+
+    ranked_typed = infer_csv_types(ranked, ranked.columns).lazy()
+    ranked_typed = with_key(ranked_typed, doi_keys, canonical_doi(pl.col('doi')), 'doi_key')
+    ranked_typed = with_key(ranked_typed, author_keys, canonical_author(pl.col('author')), 'author_key')
+    merged = (
+        ranked_typed
+        .join(data, on='doi_key', how='left', maintain_order='left_right')
+        .join(author, on='author_key', how='left', maintain_order='left_right')
+        .collect()
+    )
+    df_analytic = compact_dtypes(add_derived_columns(_to_pandas(merged)))
+    timings['join_s'] = time.perf_counter() - step
+    timings['total_s'] = time.perf_counter() - start
+
+    if verbose:
+        print(f"Ranked rows: {len(df_ranked)}, analytic table: {df_analytic.shape}, "
+              f"threads: {pl.thread_pool_size()}")
+        print(', '.join(f'{k} {v:.2f}' for k, v in timings.items()))
+    return df_ranked, df_analytic
+
+
+def check_outputs(ranked_csv, df_analytic):
+    """Compare the lazy outputs with the pandas path's ranked CSV and analytic table."""
+    same_csv = filecmp.cmp(ranked_csv, RANKED_PATH, shallow=False)
+    print(f"ranked CSV identical to {RANKED_PATH}: {same_csv}")
+    # Built in memory: empty categoricals do not survive the Parquet round trip.
+    # Floats may differ in the last bit: pd.read_csv's default parser is not
+    # correctly rounded, Polars' is.
+    expected = build_analytic_table(RANKED_PATH)
+    try:
+        pd.testing.assert_frame_equal(df_analytic, expected, check_exact=False, rtol=1e-12)
+        print("analytic table identical to build_analytic_table(): True")
+        return same_csv
+    except AssertionError as error:
+        print(f"analytic table identical to build_analytic_table(): False\n{error}")
+        return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--manual-dir', default='manual_review')
+    parser.add_argument('--output-dir', default='cleaned_data/lazy')
+    parser.add_argument('--threshold', type=float, default=90)
+    parser.add_argument('--check', action='store_true',
+                        help='compare with the outputs of the pandas path in cleaned_data/')
+    args = parser.parse_args()
+
+    df_ranked, df_analytic = run_lazy(args.data_dir, args.manual_dir, args.threshold)
+    os.makedirs(args.output_dir, exist_ok=True)
+    ranked_csv = os.path.join(args.output_dir, os.path.basename(RANKED_PATH))
+    df_ranked.to_csv(ranked_csv, index=False, sep='|')
+    df_analytic.to_parquet(os.path.join(args.output_dir, os.path.basename(ANALYTIC_PATH)), index=False)
+    if args.check and not check_outputs(ranked_csv, df_analytic):
+        raise SystemExit(1)
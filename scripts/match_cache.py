@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk store of institution name resolutions (SQLite).
+
+For every normalized institution name (``display_name_clean``) the store keeps
+- the result of the fuzzy pass (best ranking name and WRatio score, or none),
+- the resolved rank and its provenance ('exact', 'fuzzy' or 'manual').
+
+The store is tied to one ranking file, one normalizer version and one fuzzy
+threshold. When any of these changes, all stored names are dropped, so a
+re-run never reuses a match computed against other ranking names or rules.
+On re-runs only names that were never seen before are fuzzy scored.
+"""
+
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from name_normalization import NORMALIZER_VERSION
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_sql_value(value):
+    # SQLite stores Python scalars only (no numpy types, NaN is NULL)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class MatchCache:
+    """
+    Resolution store keyed by normalized institution name.
+
+    Parameters
+    ----------
+    path : str
+        SQLite database file, created if missing.
+    ranking_path : str
+        Ranking file the names are matched against (its content is fingerprinted).
+    threshold : float
+        Fuzzy threshold of the matcher.
+    """
+
+    def __init__(self, path, ranking_path, threshold=90):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS resolutions (
+                display_name_clean TEXT PRIMARY KEY,
+                fuzzy_scored INTEGER NOT NULL DEFAULT 0,
+                fuzzy_matched_name TEXT,
+                match_score REAL,
+                resolved_rank,
+                provenance TEXT,
+                score REAL
+            );
+        """)
+        self.meta = {
+            'ranking_fingerprint': file_fingerprint(ranking_path),
+            'normalizer_version': str(NORMALIZER_VERSION),
+            'threshold': str(threshold),
+        }
+        self._validate()
+
+    def _validate(self):
+        """Drop every stored name if the ranking file, normalizer or threshold changed."""
+        stored = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        if stored != self.meta:
+            if stored:
+                print("Match cache invalidated (ranking file, normalizer or threshold changed)")
+            with self.conn:
+                self.conn.execute("DELETE FROM resolutions")
+                self.conn.execute("DELETE FROM meta")
+                self.conn.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)", self.meta.items()
+                )
+
+    def close(self):
+        self.conn.close()
+
+    # === Fuzzy results ===
+    def fuzzy_results(self):
+        """Stored fuzzy results, indexed by display_name_clean."""
+        return pd.read_sql_query(
+            "SELECT display_name_clean, fuzzy_matched_name, match_score "
+            "FROM resolutions WHERE fuzzy_scored = 1",
+            self.conn,
+            index_col='display_name_clean',
+        )
+
+    def match(self, matcher, names):
+        """
+        Same result as ``matcher.match(names)``, but only names never seen
+        before are scored; their results are added to the store.
+        """
+        names = pd.Series(names)
+        known = self.fuzzy_results()
+
+        uniques = names.dropna().unique()
+        new_names = [name for name in uniques if name not in known.index]
+        if new_names:
+            matched, scores = matcher.match_unique(new_names)
+            with self.conn:
+                # Keep an existing resolution, only (re)write the fuzzy result
+                self.conn.executemany(
+                    "INSERT INTO resolutions (display_name_clean, fuzzy_scored, fuzzy_matched_name, match_score) "
+                    "VALUES (?, 1, ?, ?) ON CONFLICT(display_name_clean) DO UPDATE SET "
+                    "fuzzy_scored = 1, fuzzy_matched_name = excluded.fuzzy_matched_name, "
+                    "match_score = excluded.match_score",
+                    [(n, _to_sql_value(m), _to_sql_value(s))
+                     for n, m, s in zip(new_names, matched, scores)]
+                )
+            known = pd.concat([
+                known,
+                pd.DataFrame({'fuzzy_matched_name': matched, 'match_score': scores},
+                             index=pd.Index(new_names, name='display_name_clean')),
+            ])
+        print(f"Fuzzy scored names: {len(new_names)} new, {len(uniques) - len(new_names)} from cache")
+
+        return pd.DataFrame({
+            'fuzzy_matched_name': names.map(known['fuzzy_matched_name']),
+            'match_score': names.map(known['match_score'].astype(float)),
+        }, index=names.index)
+
+    # === Resolutions ===
+    def store_resolutions(self, names, ranks, provenance, scores):
+        """
+        Record the resolved rank, provenance ('exact', 'fuzzy', 'manual') and
+        score of every distinct name; names without a resolution are cleared.
+        """
+        resolved = pd.DataFrame({
+            'display_name_clean': names, 'resolved_rank': ranks,
+            'provenance': provenance, 'score': scores,
+        }).dropna(subset=['display_name_clean']).drop_duplicates('display_name_clean')
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO resolutions (display_name_clean, resolved_rank, provenance, score) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(display_name_clean) DO UPDATE SET "
+                "resolved_rank = excluded.resolved_rank, "
+                "provenance = excluded.provenance, "
+                "score = excluded.score",
+                [tuple(_to_sql_value(v) for v in row)
+                 for row in resolved.itertuples(index=False, name=None)]
+            )
+
+    def resolutions(self):
+        """Stored resolved ranks with their provenance, indexed by display_name_clean."""
+        return pd.read_sql_query(
+            "SELECT display_name_clean, resolved_rank, provenance, score "
+            "FROM resolutions WHERE provenance IS NOT NULL",
+            self.conn,
+            index_col='display_name_clean',
+        )
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled normalizer for institution names.
+
+Produces exactly the same output as the original row-wise ``normalization()``
+of 01_merge_rank_institution.py, but
+- all term replacements are one precompiled alternation regex with a lookup table,
+- invisible characters, dashes and punctuation are handled by one ``str.translate``,
+- results are memoized per distinct input string,
+- whole Series are normalized on their unique values and mapped back.
+"""
+
+import re
+
+import pandas as pd
+from unidecode import unidecode
+
+# Bump whenever the rules below change (cached matches depend on it)
+NORMALIZER_VERSION = 1
+
+# === Rules ===
+INVISIBLE_CHARS = [
+    '\u200b', '\u00a0', '\ufeff', '\u202f', '\u2060',
+    '\u180e', '\u200e', '\u200f'
+]
+
+# Unwanted punctuation (digits are kept)
+PUNCTUATION = ".,/\\&+:'\";=_@%!?()[]{}<>#^*~|‘’ʻʼʽˆ`ˋ´ˊ˘"
+
+# Standardize common education terms
+TERM_REPLACEMENTS = {
+    # Institute variants
+    "institutet": "institute",
+    "institute": "institute",
+    "instituto": "institute",
+    "instituut": "institute",
+    "instituttet": "institute",
+    "institutt": "institute",
+    "institut": "institute",
+    # University variants
+    "universite": "university",
+    "universitat": "university",
+    "universiteit": "university",
+    "univerzita": "university",
+    "universidad": "university",
+    "università": "university",
+    "universidade": "university",
+    "universität": "university",
+    "üniversite": "university",
+    "univerzitet": "university",
+    "üniversitesi": "university",
+    "yliopisto": "university",
+    "egyetem": "university",
+    # College variants
+    "college": "college",
+    "collegio": "college",
+    "colégio": "college",
+    "kolleg": "college",
+    "kolej": "college",
+    "kollégium": "college",
+    "kolegji": "college",
+    # School / academy
+    "school": "school",
+    "schule": "school",
+    "escola": "school",
+    "escuela": "school",
+    "skola": "school",
+    "école": "school",
+    "akademie": "academy",
+    "academy": "academy"
+}
+
+STOPWORDS = frozenset({
+    "of", "the", "and", "in", "for", "a", "an", "at", "on", "to",
+    "de", "del", "du", "di", "la", "le", "les", "des",
+    "von", "der", "den", "da", "do", "das", "dos",
+    "y", "e", "et", "und"
+})
+
+
+class InstitutionNameNormalizer:
+    """
+    Clean and normalize institution names for reliable comparison.
+    - Lowercases and removes accents
+    - Removes invisible and special characters
+    - Standardizes common education terms
+    - Removes stopwords
+
+    The instance is callable on a single name; use ``normalize_series`` for a
+    whole column.
+    """
+
+    def __init__(self, replacements=TERM_REPLACEMENTS, stopwords=STOPWORDS):
+        self.replacements = dict(replacements)
+        self.stopwords = frozenset(stopwords)
+
+        # Invisible chars are dropped, dashes become spaces, punctuation is dropped
+        table = {ord(ch): None for ch in INVISIBLE_CHARS}
+        table[ord('-')] = ' '
+        table.update({ord(ch): None for ch in PUNCTUATION})
+        self._table = table
+
+        # All terms are whole words, so one pass over the alternation replaces
+        # exactly what the chain of re.sub calls did
+        self._terms = re.compile(
+            r"\b(?:" + "|".join(re.escape(term) for term in self.replacements) + r")\b"
+        )
+        self._whitespace = re.compile(r"\s+")
+        self._cache = {}
+
+    def _normalize(self, text):
+        # Lowercase and remove accents
+        text = unidecode(text).lower()
+
+        # Remove invisible characters and punctuation, dashes to spaces
+        text = text.translate(self._table)
+
+        # Remove extra whitespace
+        text = self._whitespace.sub(" ", text).strip()
+
+        # Standardize common education terms
+        text = self._terms.sub(lambda m: self.replacements[m.group(0)], text)
+
+        # Content inside parentheses is already gone with the punctuation;
+        # remove common stopwords
+        return " ".join(w for w in text.split() if w not in self.stopwords)
+
+    def __call__(self, text):
+        if not isinstance(text, str):
+            return text
+        result = self._cache.get(text)
+        if result is None:
+            result = self._cache[text] = self._normalize(text)
+        return result
+
+    def normalize_series(self, series):
+        """
+        Normalize a Series by processing its unique values once and mapping
+        the results back to every row.
+        """
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        normalized = pd.Series([self(value) for value in uniques], dtype=object)
+        return pd.Series(
+            normalized.to_numpy()[codes], index=series.index, name=series.name
+        ).infer_objects()
@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+"""
+The pipeline (00, 01, analytic table, stats blocks and figures of 02) as a
+DAG of incremental stages (stage_runner.py).
+
+Stages, with the files they read or write:
+- clean: raw CSVs -> cleaned tables and DOI / author keys (00, sections 1–7),
+- fix_institutions: known institution fixes (cleaning.KNOWN_INSTITUTIONS),
+- validate: declared checks of the cleaned tables (validation.py) ->
+  results/validation/cleaned_tables.csv (00, section 8),
+- save_tables: cleaned_data/*.parquet and the key dictionaries (00, section 9),
+- normalize, exact_match, fuzzy_match: 01, sections 3–10,
+- review_exports: the files for manual review (01, sections 10, 11 and 13),
+- manual_merge: accepted fuzzy matches and manual pairings from
+  manual_review/*.xlsx -> cleaned_data/ranked_institution_2019.csv (01, 11–15),
+- analytic_table: cleaned_data/analytic_table_2019.parquet (analytic_table.py),
+- overall_comparisons: the Kruskal–Wallis, ANOVA, Dunn and OLS tests of 02,
+  sections 3–5 (gender, ethnicity and rank group on the whole subsets),
+- group_comparisons, resampled_gender_gaps, regression_sweep: the stats
+  blocks of 02, section 5.2 (with --workers > 1 the first two run their
+  strata / resamples on a process pool reading cleaned_data/shared/),
+- descriptive_tables: the grouped means of 02, section 6
+  (the stats stages write results/tables/<stage>.csv),
+- figure:<key>: every thesis figure (plotting.thesis_figure_specs) ->
+  results/plots/<key>.png.
+The other figures of 02 plot tables aggregated in the notebook, and the
+interaction models of section 6 and the Twitter / Wikipedia regressions
+are only in the notebook.
+
+Stages hash the whole modules they depend on (cleaning, keys, storage, ...),
+so an edit anywhere in a module reruns its stages. Editing a manual review
+spreadsheet reruns manual_merge and what follows; the CSV loading, cleaning
+and fuzzy matching are loaded from cleaned_data/stages/. Editing cleaning.py
+(e.g. KNOWN_INSTITUTIONS) reruns clean and fix_institutions, but a stage
+whose result did not change (the cleaned tables, or the names after a fix
+that only touched country_code) stops the rerun there.
+
+Usage (from the repository root):
+    python scripts/pipeline_stages.py                    # everything
+    python scripts/pipeline_stages.py manual_merge       # a stage and what it needs
+    python scripts/pipeline_stages.py 'figure:*' --force 'figure:*'
+    python scripts/pipeline_stages.py --status
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+import analytic_table
+import cleaning
+import demographics
+import group_stats
+import institution_matching
+import keys
+import name_normalization
+import plotting
+import ranking_parsing
+import regression
+import resampling
+import storage
+import validation
+from analytic_table import ANALYTIC_PATH, RANKED_PATH, load_analytic_table, subset_masks
+from cleaning import (
+    clean_author, clean_data_2019, clean_ranking, drop_unnamed_columns,
+    fix_known_institutions, normalize_column_names, normalize_institution_doi
+)
+from group_stats import compare_groups
+from institution_matching import InstitutionMatcher
+from keys import KeyDictionary, in_dictionary
+from name_normalization import InstitutionNameNormalizer
+from plotting import THESIS_FIGURES, render_figures, thesis_figure_specs
+from regression import RegressionDesign
+from resampling import compare_resampled
+from shared_frames import SharedFrame
+from stage_runner import CACHE_DIR, Stage, StageRunner
+from storage import read_table, table_path, write_table
+from validation import check_tables, summary
+
+DATA_DIR = 'data'
+MANUAL_DIR = 'manual_review'
+TABLE_DIR = os.path.join('results', 'tables')
+VALIDATION_PATH = os.path.join(validation.RESULT_DIR, 'cleaned_tables.csv')
+PLOT_DIR = os.path.join('results', 'plots')
+
+RAW_FILES = {
+    'author': os.path.join(DATA_DIR, 'merged_author_data.csv'),
+    'data': os.path.join(DATA_DIR, 'data_2019.csv'),
+    'ranking': os.path.join(DATA_DIR, '2019_rankings.csv'),
+    'institution': os.path.join(DATA_DIR, 'merged_institutions_data.csv'),
+}
+
+FUZZY_CHECKED_PATH = os.path.join(MANUAL_DIR, 'fuzzy_manual_checked.xlsx')
+MANUAL_PAIRED_PATH = os.path.join(MANUAL_DIR, 'unmatched_ranked_paired.xlsx')
+REVIEW_EXPORTS = {
+    'fuzzy_candidates': os.path.join(MANUAL_DIR, 'fuzzy_candidates_with_manual_check.csv'),
+    'unmatched_ranked': os.path.join(MANUAL_DIR, 'unmatched_ranked.xlsx'),
+    'unique_institutions': os.path.join(MANUAL_DIR, 'unique_institution_names.xlsx'),
+}
+
+TABLES = ['author_clean', 'institution_2019_clean', 'data_2019_clean', 'ranking_clean']
+TABLE_FILES = [table_path(name) for name in TABLES + ['doi_keys', 'author_keys']]
+
+INSTITUTION_COLUMNS = [
+    'parent_id', 'doi', 'author', 'author_position', 'institutions', 'ror',
+    'display_name', 'country_code', 'type', 'homepage_url'
+]
+
+# final_columns of 01
+RANKED_COLUMNS = [
+    'parent_id', 'doi', 'author', 'author_position', 'institutions', 'ror',
+    'display_name_original', 'display_name_clean', 'country_code', 'type',
+    'homepage_url', 'final_rank', 'rank_flag'
+]
+
+# Bonferroni within each rank group, as in the Dunn tables of 02
+WITHIN_RANK_GROUP = ('outcome', 'factor', 'strata', 'stratum', 'test')
+
+# Tests of 02, sections 3–5, without strata: (subset_masks key or None for all rows, spec)
+OVERALL_COMPARISONS = [
+    ('gender_filtered', ('stot_log1p', 'gender_majority', None)),
+    (None, ('stot_log1p', 'ethnicity_majority', None)),
+    ('ranked_gender_filtered', ('stot_log1p', 'gender_majority', None)),
+    ('ranked', ('stot_log1p', 'ethnicity_majority', None)),
+    ('ranked', ('stot_log1p', 'rank_group', None)),
+]
+
+# Grouped descriptive statistics of 02, section 6: (group column, subset_masks key)
+DESCRIPTIVE_GROUPS = [
+    ('gender_majority', 'ranked_gender_filtered'),
+    ('ethnicity_majority', 'ranked'),
+    ('rank_group', 'ranked'),
+]
+
+# Process pool of the stratified stats stages (--workers); not part of the
+# fingerprints, the results do not depend on it
+STATS_WORKERS = 1
+# Columns of the analytic table the pool workers read from the SharedFrame
+SHARED_COLUMNS = ['doi', 'stot_log1p', 'gender_majority', 'ethnicity_majority', 'rank_group']
+
+REGRESSION_MODELS = [
+    ('stot_log1p', ['gender_majority']),
+    ('stot_log1p', ['gender_majority', 'country_code']),
+    ('cit_log', ['gender_majority', 'country_code']),
+    ('stot_log1p', ['ethnicity_majority', 'country_code']),
+]
+
+
+# === 00: load and clean ===
+def clean_tables():
+    df_author = pd.read_csv(RAW_FILES['author'], encoding='utf-8')
+    df_data_2019 = pd.read_csv(RAW_FILES['data'], encoding='utf-8')
+    df_ranking = pd.read_csv(RAW_FILES['ranking'], encoding='utf-8')
+    df_institution = pd.read_csv(RAW_FILES['institution'], encoding='utf-8')
+    for df in [df_author, df_institution, df_ranking, df_data_2019]:
+        normalize_column_names(df)
+        drop_unnamed_columns(df)
+
+    df_author = clean_author(df_author)
+    df_data_2019 = clean_data_2019(df_data_2019)
+    df_ranking = clean_ranking(df_ranking)
+    df_institution = normalize_institution_doi(df_institution)
+
+    doi_keys = KeyDictionary.build('doi', df_data_2019['doi'])
+    author_keys = KeyDictionary.build('author', df_author['author'], df_institution['author'])
+    df_data_2019['doi_key'] = doi_keys.lookup(df_data_2019['doi'])
+    df_author['author_key'] = author_keys.lookup(df_author['author'])
+    df_institution['doi_key'] = doi_keys.lookup(df_institution['doi'])
+    df_institution['author_key'] = author_keys.lookup(df_institution['author'])
+
+    # Rows of the 2019 DOIs, without exact duplicates
+    in_2019 = in_dictionary(df_institution['doi_key'], df_data_2019['doi'].isna().any())
+    df_institution_2019 = df_institution[in_2019].drop_duplicates()
+    return {
+        'author_clean': df_author,
+        'data_2019_clean': df_data_2019,
+        'ranking_clean': df_ranking,
+        'institution_2019_unfixed': df_institution_2019,
+        'doi_keys': doi_keys,
+        'author_keys': author_keys,
+    }
+
+
+def fix_institutions(institution_2019_unfixed):
+    return {'institution_2019_clean': fix_known_institutions(institution_2019_unfixed)}
+
+
+def validate_tables(author_clean, institution_2019_clean, data_2019_clean, ranking_clean):
+    report = check_tables({
+        'author_clean': author_clean,
+        'data_2019_clean': data_2019_clean,
+        'institution_2019_clean': institution_2019_clean,
+        'ranking_clean': ranking_clean,
+    })
+    os.makedirs(os.path.dirname(VALIDATION_PATH), exist_ok=True)
+    report.to_csv(VALIDATION_PATH, index=False)
+    print(summary(report))
+    return {'validation': report}
+
+
+def save_tables(author_clean, institution_2019_clean, data_2019_clean, ranking_clean,
+                doi_keys, author_keys):
+    write_table(author_clean, 'author_clean')
+    write_table(institution_2019_clean, 'institution_2019_clean')
+    write_table(data_2019_clean, 'data_2019_clean')
+    write_table(ranking_clean, 'ranking_clean')
+    doi_keys.save()
+    author_keys.save()
+
+
+# === 01: rank matching ===
+def normalize_names():
+    """Institution and ranking names with their normalized forms (as read back by 01)."""
+    df_institution = read_table('institution_2019_clean', columns=INSTITUTION_COLUMNS)
+    df_ranking = read_table('ranking_clean', columns=['rank', 'name'])
+    df_institution['display_name_original'] = df_institution['display_name']
+    df_ranking['name_original'] = df_ranking['name']
+
+    normalizer = InstitutionNameNormalizer()
+    df_institution['display_name_clean'] = normalizer.normalize_series(df_institution['display_name'])
+    df_ranking['name_clean'] = normalizer.normalize_series(df_ranking['name'])
+    return {'institutions': df_institution, 'ranking': df_ranking}
+
+
+def exact_match(institutions, ranking):
+    # Later duplicates of a normalized ranking name win, as in 01
+    ranking_name_mapping = {}
+    for norm_name, rank in zip(ranking['name_clean'], ranking['rank']):
+        ranking_name_mapping[norm_name] = rank
+    exact_rank = institutions['display_name_clean'].map(ranking_name_mapping)
+    # Names to fuzzy match: fuzzy_match only depends on these, not on the other columns
+    unmatched = institutions.loc[exact_rank.isna(), 'display_name_clean']
+    return {
+        'ranking_name_mapping': ranking_name_mapping,
+        'exact_rank': exact_rank,
+        'unmatched_names': pd.Series(unmatched.dropna().unique(), dtype=object),
+    }
+
+
+def fuzzy_match(unmatched_names, ranking_name_mapping, threshold):
+    """Best ranking name and score of every distinct unmatched name (indexed by name)."""
+    matcher = InstitutionMatcher(list(ranking_name_mapping.keys()), threshold=threshold)
+    results = matcher.match(unmatched_names).set_index(unmatched_names)
+    return {'fuzzy_matches': results.rename(columns={'match_score': 'fuzzy_rank'})}
+
+
+def _matched_rows(institutions, exact_rank, fuzzy_matches):
+    """Institution rows with the exact rank and the fuzzy match (section 10 of 01)."""
+    df = institutions.copy()
+    df['rank'] = exact_rank
+    mask = df['rank'].isna()
+    names = df.loc[mask, 'display_name_clean']
+    df.loc[mask, 'fuzzy_matched_name'] = names.map(fuzzy_matches['fuzzy_matched_name'])
+    df.loc[mask, 'fuzzy_rank'] = names.map(fuzzy_matches['fuzzy_rank'])
+    return df
+
+
+def _with_accepted_fuzzy(df, ranking_name_mapping):
+    """final_rank from the exact rank, else the rank of the accepted fuzzy match (section 11 of 01)."""
+    checked_fuzzy_df = pd.read_excel(FUZZY_CHECKED_PATH)
+    accepted_fuzzy = checked_fuzzy_df[checked_fuzzy_df["keep"] == 1][[
+        'display_name_clean', 'fuzzy_matched_name', 'fuzzy_rank'
+    ]]
+    df['final_rank'] = df['rank']
+    df = df.merge(accepted_fuzzy, on='display_name_clean', how='left', suffixes=('', '_fuzzy'))
+    df['final_rank'] = df['final_rank'].combine_first(
+        df['fuzzy_matched_name_fuzzy'].map(ranking_name_mapping)
+    )
+    return df
+
+
+def review_exports(institutions, ranking, ranking_name_mapping, exact_rank, fuzzy_matches):
+    df = _matched_rows(institutions, exact_rank, fuzzy_matches)
+
+    # Fuzzy candidates without an exact match, best score first
+    fuzzy_only = df[df['fuzzy_rank'].notna() & df['rank'].isna()]
+    fuzzy_only.sort_values(by='fuzzy_rank', ascending=False).drop_duplicates(
+        subset='display_name_clean'
+    ).to_csv(REVIEW_EXPORTS['fuzzy_candidates'], index=False)
+
+    # Ranked institutions that no institution row matched yet
+    df = _with_accepted_fuzzy(df, ranking_name_mapping)
+    ranked = df['final_rank'].notna()
+    matched_names = set(df.loc[ranked, 'display_name_clean']) | set(df.loc[ranked, 'fuzzy_matched_name'].dropna())
+    unmatched_ranked = ranking[~ranking['name_clean'].isin(matched_names)]
+    unmatched_ranked[['rank', 'name_original', 'name_clean']].to_excel(
+        REVIEW_EXPORTS['unmatched_ranked'], index=False
+    )
+    df[['display_name_clean', 'display_name_original']].drop_duplicates(
+        subset='display_name_clean'
+    ).to_excel(REVIEW_EXPORTS['unique_institutions'], index=False)
+
+
+def manual_merge(institutions, ranking_name_mapping, exact_rank, fuzzy_matches):
+    df = _with_accepted_fuzzy(_matched_rows(institutions, exact_rank, fuzzy_matches),
+                              ranking_name_mapping)
+
+    manual_df = pd.read_excel(MANUAL_PAIRED_PATH)
+    manual_df = manual_df[manual_df['display_name_clean'].notna()]
+    df = df.merge(manual_df[['display_name_clean', 'manual_rank']], on='display_name_clean', how='left')
+    df['final_rank'] = df['final_rank'].combine_first(df['manual_rank'])
+
+    df['rank_flag'] = df['final_rank'].notna().astype(int)
+    ranked = df[RANKED_COLUMNS].copy()
+    ranked.to_csv(RANKED_PATH, index=False, sep='|')
+    print(f"Final ranked rows: {ranked['rank_flag'].sum()} of {len(ranked)}")
+    return {'ranked_institutions': ranked}
+
+
+# === 02: analytic table, stats blocks and figures ===
+def build_analytic():
+    return {'analytic': load_analytic_table(rebuild=True)}
+
+
+def _result_path(name):
+    return os.path.join(TABLE_DIR, f'{name}.csv')
+
+
+def _write_result(result, name):
+    os.makedirs(TABLE_DIR, exist_ok=True)
+    result.to_csv(_result_path(name), index=False)
+    return result
+
+
+def _shared_analytic():
+    """SharedFrame of the analytic table for the pool workers (None when serial)."""
+    if STATS_WORKERS is not None and STATS_WORKERS <= 1:
+        return None
+    return SharedFrame.from_table(ANALYTIC_PATH, columns=SHARED_COLUMNS)
+
+
+def overall_comparisons(analytic):
+    masks = subset_masks(analytic)
+    parts = []
+    for subset, spec in OVERALL_COMPARISONS:
+        columns = [c for c in spec if c is not None]
+        data = analytic if subset is None else analytic.loc[masks[subset], columns]
+        part = compare_groups(data, [spec])
+        part.insert(0, 'subset', subset or 'all')
+        parts.append(part)
+    result = pd.concat(parts, ignore_index=True)
+    return {'overall_comparisons': _write_result(result, 'overall_comparisons')}
+
+
+def group_comparisons(analytic):
+    masks = subset_masks(analytic)
+    shared = _shared_analytic()
+    result = pd.concat([
+        compare_groups(
+            analytic.loc[masks['ranked_gender_filtered'], ['stot_log1p', 'gender_majority', 'rank_group']],
+            [('stot_log1p', 'gender_majority', 'rank_group')],
+            family=WITHIN_RANK_GROUP, workers=STATS_WORKERS, shared=shared
+        ),
+        compare_groups(
+            analytic.loc[masks['ranked'], ['stot_log1p', 'ethnicity_majority', 'rank_group']],
+            [('stot_log1p', 'ethnicity_majority', 'rank_group')],
+            family=WITHIN_RANK_GROUP, workers=STATS_WORKERS, shared=shared
+        ),
+    ], ignore_index=True)
+    return {'group_comparisons': _write_result(result, 'group_comparisons')}
+
+
+def resampled_gender_gaps(analytic, n_resamples, seed):
+    masks = subset_masks(analytic)
+    result = compare_resampled(
+        analytic.loc[masks['ranked_gender_filtered'], ['stot_log1p', 'gender_majority', 'rank_group', 'doi']],
+        [('stot_log1p', 'gender_majority', 'rank_group')],
+        cluster='doi', n_resamples=n_resamples, seed=seed,
+        workers=STATS_WORKERS, shared=_shared_analytic()
+    )
+    return {'resampled_gender_gaps': _write_result(result, 'resampled_gender_gaps')}
+
+
+def regression_sweep(analytic):
+    # One sparse design of the whole table, the subset is a mask: nothing to
+    # pickle to workers, so the sweep runs in the stage process
+    design = RegressionDesign(
+        analytic,
+        categorical=['gender_majority', 'ethnicity_majority', 'country_code'],
+        cluster='doi'
+    )
+    result = design.sweep(REGRESSION_MODELS, strata='rank_group',
+                          mask=subset_masks(analytic)['ranked_gender_filtered'])
+    return {'regression_sweep': _write_result(result, 'regression_sweep')}
+
+
+def descriptive_tables(analytic):
+    masks = subset_masks(analytic)
+    parts = []
+    for group_col, subset in DESCRIPTIVE_GROUPS:
+        stats = (
+            analytic.loc[masks[subset], [group_col, 'stot_log1p', 'cit_log']]
+            .groupby(group_col, observed=True)
+            .agg(
+                Mean_Social_Visibility=('stot_log1p', 'mean'),
+                Std_Social_Visibility=('stot_log1p', 'std'),
+                Mean_Citation=('cit_log', 'mean'),
+                Std_Citation=('cit_log', 'std')
+            )
+            .round(3)
+            .sort_values('Mean_Social_Visibility', ascending=False)
+            .rename_axis('group')
+            .reset_index()
+        )
+        stats['group'] = stats['group'].astype(str)
+        stats.insert(0, 'grouping', group_col)
+        parts.append(stats)
+    result = pd.concat(parts, ignore_index=True)
+    return {'descriptive_tables': _write_result(result, 'descriptive_tables')}
+
+
+def draw_figure(analytic, figure):
+    """One thesis figure (not drawn again by render_figures if its data and arguments are unchanged)."""
+    specs = thesis_figure_specs(analytic, subset_masks(analytic), keys=[figure['key']])
+    render_figures(specs, folder=PLOT_DIR, workers=1)
+
+
+# === DAG ===
+def pipeline_stages(fuzzy_threshold=90, n_resamples=10_000, seed=42):
+    """Stages of the pipeline, in order."""
+    stages = [
+        Stage('clean', clean_tables, files=RAW_FILES.values(),
+              outputs=['author_clean', 'data_2019_clean', 'ranking_clean',
+                       'institution_2019_unfixed', 'doi_keys', 'author_keys'],
+              code=[cleaning, keys, ranking_parsing, storage]),
+        Stage('fix_institutions', fix_institutions, inputs=['institution_2019_unfixed'],
+              outputs=['institution_2019_clean'],
+              code=[cleaning]),
+        Stage('validate', validate_tables,
+              inputs=['author_clean', 'institution_2019_clean', 'data_2019_clean', 'ranking_clean'],
+              outputs=['validation'], writes=[VALIDATION_PATH], code=[validation, storage]),
+        Stage('save_tables', save_tables,
+              inputs=['author_clean', 'institution_2019_clean', 'data_2019_clean', 'ranking_clean',
+                      'doi_keys', 'author_keys'],
+              writes=TABLE_FILES, code=[storage, keys]),
+        Stage('normalize', normalize_names,
+              files=[table_path('institution_2019_clean'), table_path('ranking_clean')],
+              outputs=['institutions', 'ranking'],
+              code=[name_normalization, storage]),
+        Stage('exact_match', exact_match, inputs=['institutions', 'ranking'],
+              outputs=['ranking_name_mapping', 'exact_rank', 'unmatched_names']),
+        Stage('fuzzy_match', fuzzy_match, inputs=['unmatched_names', 'ranking_name_mapping'],
+              outputs=['fuzzy_matches'], code=[institution_matching],
+              params={'threshold': fuzzy_threshold}),
+        Stage('review_exports', review_exports,
+              inputs=['institutions', 'ranking', 'ranking_name_mapping', 'exact_rank', 'fuzzy_matches'],
+              files=[FUZZY_CHECKED_PATH], writes=REVIEW_EXPORTS.values(),
+              code=[_matched_rows, _with_accepted_fuzzy]),
+        Stage('manual_merge', manual_merge,
+              inputs=['institutions', 'ranking_name_mapping', 'exact_rank', 'fuzzy_matches'],
+              files=[FUZZY_CHECKED_PATH, MANUAL_PAIRED_PATH], outputs=['ranked_institutions'],
+              writes=[RANKED_PATH], code=[_matched_rows, _with_accepted_fuzzy, RANKED_COLUMNS]),
+        Stage('analytic_table', build_analytic,
+              files=[RANKED_PATH] + [table_path(n) for n in
+                                     ('data_2019_clean', 'author_clean', 'doi_keys', 'author_keys')],
+              outputs=['analytic'], writes=[ANALYTIC_PATH],
+              code=[analytic_table, demographics, keys, storage]),
+        Stage('overall_comparisons', overall_comparisons, inputs=['analytic'],
+              outputs=['overall_comparisons'], writes=[_result_path('overall_comparisons')],
+              code=[group_stats, analytic_table.subset_masks, OVERALL_COMPARISONS]),
+        Stage('group_comparisons', group_comparisons, inputs=['analytic'],
+              outputs=['group_comparisons'], writes=[_result_path('group_comparisons')],
+              code=[group_stats, analytic_table.subset_masks, WITHIN_RANK_GROUP]),
+        Stage('resampled_gender_gaps', resampled_gender_gaps, inputs=['analytic'],
+              outputs=['resampled_gender_gaps'], writes=[_result_path('resampled_gender_gaps')],
+              code=[resampling, analytic_table.subset_masks],
+              params={'n_resamples': n_resamples, 'seed': seed}),
+        Stage('regression_sweep', regression_sweep, inputs=['analytic'],
+              outputs=['regression_sweep'], writes=[_result_path('regression_sweep')],
+              code=[regression, analytic_table.subset_masks, REGRESSION_MODELS]),
+        Stage('descriptive_tables', descriptive_tables, inputs=['analytic'],
+              outputs=['descriptive_tables'], writes=[_result_path('descriptive_tables')],
+              code=[analytic_table.subset_masks, DESCRIPTIVE_GROUPS]),
+    ]
+    for figure in THESIS_FIGURES:
+        key = figure['key']
+        stages.append(Stage(
+            f'figure:{key}', draw_figure, inputs=['analytic'],
+            writes=[os.path.join(PLOT_DIR, f'{key}.png')],
+            code=[plotting, analytic_table.subset_masks], params={'figure': figure}
+        ))
+    return stages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('targets', nargs='*', help="stages or patterns (e.g. 'figure:*'), default all")
+    parser.add_argument('--force', nargs='+', default=[], help='stages or patterns to rerun anyway')
+    parser.add_argument('--status', action='store_true', help='show which stages are up to date')
+    parser.add_argument('--list', action='store_true', help='list the stages and their dependencies')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='process pool of the stratified stats stages (reads a SharedFrame)')
+    args = parser.parse_args()
+    STATS_WORKERS = args.workers
+
+    runner = StageRunner(pipeline_stages(), cache_dir=args.cache_dir)
+    targets = args.targets or None
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        if args.list:
+            for name in runner.order(targets):
+                print(f"{name:<34} <- {', '.join(runner.upstream(name)) or '-'}")
+        elif args.status:
+            print(runner.status(targets).to_string(index=False))
+        else:
+            report = runner.run(targets, force=args.force)
+            print(f"\n{(report['status'] == 'ran').sum()} of {len(report)} stages ran "
+                  f"in {report['seconds'].sum():.1f} s")
@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+Plot helpers of the 02 notebook and a batch renderer for figure specs.
+
+The helpers (plot_hist, plot_countplot, plot_boxplot, plot_barplot,
+combined_bar_line_plot, plot_regplot, plot_swarm_outliers) draw one figure
+each; in the notebook they save it as results/plots/<key>.png
+(save_current_figure, ``key`` argument of the helpers) and show it, so the
+notebook and ``render_figures`` name their files the same way.
+
+For large tables plot_regplot has a hexbin mode (binned density) and a
+sampled scatter mode (``max_points``), both with the regression line fitted
+on all rows and neither with ``hue_col``; samples (``stratified_sample``)
+are split in proportion across strata and always keep the top 1% of the y
+values (``outlier_mask``).
+
+``render_figures`` renders a declarative list of figure specs instead:
+    {'key': 'hist_stot_log1p', 'plot': 'hist', 'data': df_merged_all,
+     'column': 'stot_log1p', 'title': ...}
+i.e. a file key, a helper name (key of PLOTTERS), the data and the keyword
+arguments of the helper. Figures are drawn by the same helpers in a process
+pool with the Agg backend and written to <folder>/<key>.png. A figure whose
+hash (helper, arguments, style and the data of the columns it uses) matches
+the manifest of the folder (plots_manifest.json) is not drawn again.
+The figures of the thesis are listed in THESIS_FIGURES (specs without data,
+see ``thesis_figure_specs``).
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.lines import Line2D
+
+# Change when the helpers or the style change, so every figure is redrawn
+STYLE_VERSION = 1
+
+STYLE = {
+    "figure.figsize": (8, 5),
+    "axes.titlesize": 14,
+    "axes.labelsize": 12,
+    "xtick.labelsize": 10,
+    "ytick.labelsize": 10,
+    "axes.edgecolor": "gray",
+    "axes.linewidth": 1.0,
+    "grid.color": "lightgray",
+    "grid.linestyle": "--",
+    "grid.linewidth": 0.5,
+    "legend.fontsize": 10,
+    "font.family": "sans-serif",
+    "font.sans-serif": ["Arial", "Helvetica"]
+}
+
+MANIFEST = 'plots_manifest.json'
+DPI = 300
+
+# Helper arguments that name a column of the data
+COLUMN_ARGS = ('column', 'column_x', 'column_y', 'x_col', 'y_col', 'hue_col', 'bar_y_col', 'line_y_col')
+
+
+def apply_style():
+    """Seaborn whitegrid style and the rcParams of the thesis figures."""
+    sns.set_style("whitegrid")
+    plt.rcParams.update(STYLE)
+
+
+def _check_key(key):
+    if not isinstance(key, str) or not re.fullmatch(r'[\w.\-]+', key):
+        raise ValueError(f"Figure key must be a plain file name, got {key!r}")
+    return key
+
+
+# === helper: mentés kulcs szerint ===
+def save_current_figure(key, folder="results/plots", ext="png"):
+    """Save the current figure as <folder>/<key>.<ext> (as render_figures names it)."""
+    os.makedirs(folder, exist_ok=True)
+    plt.gcf().savefig(os.path.join(folder, f"{_check_key(key)}.{ext}"), dpi=DPI, bbox_inches="tight")
+
+
+def _finish(save, key):
+    """Save as <key>.png and show (notebook use)."""
+    if save:
+        save_current_figure(key)
+        plt.show()
+
+
+# === 1. Histogram Plot ===
+def plot_hist(data, column, bins=40, title=None, xlabel=None, color=None, key=None, save=True):
+    hist_color = color or sns.color_palette("Dark2")[0]
+    plt.figure()
+    sns.histplot(
+        data[column].dropna(),
+        bins=bins,
+        kde=False,
+        color=hist_color
+    )
+    plt.title(title or f"Distribution of {column}")
+    plt.xlabel(xlabel or column)
+    plt.ylabel("Frequency")
+    plt.tight_layout()
+    ax = plt.gca()
+    ax.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{int(x):,}"))
+    _finish(save, key)
+
+
+# === 2. Count Plot ===
+def plot_countplot(data, column, title=None, xlabel=None, key=None, save=True):
+    plt.figure()
+    sns.countplot(data=data, x=column, hue=column, palette='Dark2', legend=False)
+    plt.title(title or f"Distribution of {column}")
+    plt.xlabel(xlabel or column)
+    plt.ylabel("Count")
+    plt.tight_layout()
+    ax = plt.gca()
+    ax.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{int(x):,}"))
+    _finish(save, key)
+
+
+# === 3. Box Plot ===
+def plot_boxplot(data, column_x, column_y, title=None, xlabel=None, ylabel=None, key=None, save=True):
+    plt.figure(figsize=(8, 6))
+    sns.boxplot(data=data, x=column_x, y=column_y, hue=column_x, palette='Dark2')
+    plt.title(title or f"{column_y} by {column_x}")
+    plt.xlabel(xlabel or column_x)
+    plt.ylabel(ylabel or column_y)
+    plt.tight_layout()
+    ax = plt.gca()
+    ax.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{int(x):,}"))
+    _finish(save, key)
+
+
+# === 4. Bar Plot ===
+def plot_barplot(data,
+                 x_col,
+                 y_col,
+                 hue_col=None,
+                 title=None,
+                 xlabel=None,
+                 ylabel=None,
+                 palette="Dark2",
+                 rot=45,
+                 distinct_colors=True,
+                 format_yaxis=True,
+                 key=None,
+                 save=True):
+
+    plt.figure(figsize=(10, 8))
+
+    if hue_col:
+        sns.barplot(
+            data=data, x=x_col, y=y_col, hue=hue_col,
+            palette=palette, legend=True,
+            errorbar=None
+        )
+    else:
+        if distinct_colors:
+            sns.barplot(
+                data=data, x=x_col, y=y_col, hue=x_col,
+                palette=palette, legend=False,
+                errorbar=None
+            )
+        else:
+            single_color = sns.color_palette(palette)[0]
+            sns.barplot(
+                data=data, x=x_col, y=y_col, color=single_color,
+                errorbar=None
+            )
+
+    plt.xticks(rotation=rot, ha="right")
+    plt.title(title or f"{y_col} by {x_col}")
+    plt.xlabel(xlabel or x_col)
+    plt.ylabel(ylabel or y_col)
+
+    if format_yaxis:
+        ax = plt.gca()
+        ax.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{int(x):,}"))
+
+    plt.tight_layout()
+    _finish(save, key)
+
+
+# === 5. Combined bar + line plot ===
+def combined_bar_line_plot(
+    data,
+    x_col,
+    bar_y_col,
+    line_y_col,
+    title="Combined Bar and Line Plot",
+    xlabel=None,
+    bar_ylabel="Bar Value",
+    line_ylabel="Line Value",
+    palette="Dark2",
+    line_color="orange",
+    key=None,
+    save=True
+):
+    fig, ax1 = plt.subplots(figsize=(8, 5))
+    sns.barplot(data=data, x=x_col, y=bar_y_col, hue=x_col, palette=palette, ax=ax1)
+    ax1.set_ylabel(bar_ylabel, fontsize=12)
+    ax1.set_xlabel(xlabel or x_col, fontsize=12)
+    ax1.tick_params(axis='y')
+    ax1.grid(axis='y', linestyle='--', linewidth=0.5, color='lightgray')
+    ax1.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{int(x):,}"))
+    ax2 = ax1.twinx()
+    ax2.plot(data[x_col], data[line_y_col], color=line_color, marker="o", linewidth=2)
+    ax2.set_ylabel(line_ylabel, fontsize=12)
+    ax2.tick_params(axis='y')
+    ax2.grid(False)
+    ax2.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{int(x):,}"))
+    plt.title(title, fontsize=14)
+    fig.tight_layout()
+    _finish(save, key)
+
+
+# === 6. Scatter + Regression line (single- vagy multi-hue) ===
+def plot_regplot(data,
+                 x_col,
+                 y_col,
+                 hue_col=None,
+                 title=None,
+                 xlabel=None,
+                 ylabel=None,
+                 palette="Dark2",
+                 scatter_alpha=0.1,
+                 scatter_size=10,
+                 line_color=None,
+                 mode='scatter',
+                 max_points=None,
+                 gridsize=50,
+                 key=None,
+                 save=True):
+    # mode='hexbin': binned density instead of points; max_points: scatter of a
+    # stratified sample (top 1% of y kept). The line is fitted on all rows.
+    if mode not in ('scatter', 'hexbin'):
+        raise ValueError(f"Unknown mode '{mode}', expected 'scatter' or 'hexbin'")
+    if mode == 'hexbin' and hue_col:
+        raise ValueError("hexbin mode does not support hue_col")
+    if max_points is not None and hue_col:
+        raise ValueError("max_points (sampled scatter) does not support hue_col")
+    sns.set_style("whitegrid")
+    if hue_col:
+        sns.lmplot(
+            data=data,
+            x=x_col,
+            y=y_col,
+            hue=hue_col,
+            palette=palette,
+            scatter_kws={"alpha": scatter_alpha, "s": scatter_size},
+            height=6,
+            aspect=1.5,
+            markers='o',
+            ci=None
+        )
+        plt.title(title or f"{y_col} vs. {x_col} by {hue_col}")
+        plt.xlabel(xlabel or x_col)
+        plt.ylabel(ylabel or y_col)
+        plt.tight_layout()
+        _finish(save, key)
+    else:
+        pal = sns.color_palette(palette)
+        scat_col = pal[0]
+        reg_col  = line_color or pal[1]
+        plt.figure(figsize=(8, 5))
+        if mode == 'hexbin':
+            # Binned density of all rows, regression line fitted on all rows
+            full = data[[x_col, y_col]].dropna()
+            plt.hexbin(full[x_col], full[y_col], gridsize=gridsize, bins='log', mincnt=1,
+                       cmap=sns.light_palette(scat_col, as_cmap=True))
+            plt.colorbar(label="Rows (log scale)")
+            _plot_fit_line(full[x_col], full[y_col], reg_col)
+        elif max_points is not None and len(data) > max_points:
+            # Sample across the x range, keeping the top 1% of y; line fitted on all rows
+            full = data[[x_col, y_col]].dropna()
+            x_bins = pd.qcut(full[x_col], 10, duplicates='drop')
+            sample = stratified_sample(full, max_points, strata=x_bins, keep=outlier_mask(full, y_col))
+            sns.regplot(
+                data=sample,
+                x=x_col,
+                y=y_col,
+                scatter_kws={"s": scatter_size, "alpha": scatter_alpha, "color": scat_col},
+                fit_reg=False
+            )
+            _plot_fit_line(full[x_col], full[y_col], reg_col)
+        else:
+            sns.regplot(
+                data=data,
+                x=x_col,
+                y=y_col,
+                scatter_kws={"s": scatter_size, "alpha": scatter_alpha, "color": scat_col},
+                line_kws={"color": reg_col},
+                ci=None
+            )
+        plt.title(title or f"{y_col} vs. {x_col}")
+        plt.xlabel(xlabel or x_col)
+        plt.ylabel(ylabel or y_col)
+        plt.tight_layout()
+        ax = plt.gca()
+        ax.get_yaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: f"{x:,.0f}"))
+        _finish(save, key)
+
+
+def _plot_fit_line(x, y, color):
+    """Least squares line of y on x over the range of x (as sns.regplot draws it)."""
+    slope, intercept = np.polyfit(x, y, 1)
+    xs = np.linspace(x.min(), x.max(), 100)
+    plt.plot(xs, intercept + slope * xs, color=color)
+
+
+# === 7. Swarm plot with highlighted outliers ===
+def plot_swarm_outliers(data,
+                        x_col,
+                        y_col,
+                        outliers=None,
+                        order=None,
+                        n=3000,
+                        title=None,
+                        xlabel=None,
+                        ylabel=None,
+                        random_state=42,
+                        key=None,
+                        save=True):
+    # About n rows in total: the top 1% of y, and the rest sampled in proportion
+    # to the size of every x group
+    sampled = stratified_sample(data, n, strata=x_col, keep=outlier_mask(data, y_col),
+                                random_state=random_state)
+
+    plt.figure(figsize=(10, 6))
+
+    # Base swarmplot
+    sns.swarmplot(
+        data=sampled,
+        x=x_col,
+        y=y_col,
+        order=order,
+        size=4,
+        alpha=0.7
+    )
+
+    # Outliers in red (without duplicate legend entries)
+    if outliers is not None:
+        sns.stripplot(
+            data=outliers,
+            x=x_col,
+            y=y_col,
+            order=order,
+            color='red',
+            size=7,
+            jitter=True,
+            label=None
+        )
+
+        # Add custom circular dot to legend
+        outlier_dot = Line2D([0], [0], marker='o', color='w', label='Outliers',
+                             markerfacecolor='red', markersize=8)
+        plt.legend(handles=[outlier_dot])
+
+    plt.title(title or f"{y_col} by {x_col}")
+    plt.xlabel(xlabel or x_col)
+    plt.ylabel(ylabel or y_col)
+    plt.tight_layout()
+    _finish(save, key)
+
+
+# === Large data ===
+def outlier_mask(data, column, q=0.99):
+    """Rows at or above the q quantile of a column (the notebook's top 1% by default)."""
+    return (data[column] >= data[column].quantile(q)).to_numpy()
+
+
+def stratified_sample(data, n, strata=None, keep=None, random_state=42):
+    """
+    About n rows of data: every row of the boolean ``keep`` mask, and the
+    rest sampled in proportion to the size of every stratum (a column name
+    or values aligned with data). Rows keep their original order.
+    """
+    keep = np.zeros(len(data), dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+    rest = np.flatnonzero(~keep)
+    quota = max(n - int(keep.sum()), 0)
+    rng = np.random.default_rng(random_state)
+
+    if quota >= len(rest):
+        chosen = rest
+    elif strata is None:
+        chosen = rng.choice(rest, quota, replace=False)
+    else:
+        values = data[strata] if isinstance(strata, str) else strata
+        codes = pd.factorize(np.asarray(values, dtype=object)[rest])[0] + 1   # 0: missing stratum
+        sizes = np.bincount(codes)
+        # Largest remainder allocation of the quota
+        exact = sizes * quota / len(rest)
+        per_stratum = np.floor(exact).astype(int)
+        extra = np.argsort(per_stratum - exact, kind='stable')[:quota - per_stratum.sum()]
+        per_stratum[extra] += 1
+        chosen = np.concatenate([
+            rng.choice(rest[codes == c], per_stratum[c], replace=False)
+            for c in range(len(sizes)) if per_stratum[c]
+        ])
+    return data.iloc[np.sort(np.concatenate([np.flatnonzero(keep), chosen]))]
+
+
+PLOTTERS = {
+    'hist': plot_hist,
+    'countplot': plot_countplot,
+    'boxplot': plot_boxplot,
+    'barplot': plot_barplot,
+    'bar_line': combined_bar_line_plot,
+    'regplot': plot_regplot,
+    'swarm': plot_swarm_outliers,
+}
+
+
+# === Batch rendering ===
+def _spec_columns(spec):
+    """Columns of the data a spec plots (its COLUMN_ARGS)."""
+    return list(dict.fromkeys(spec[arg] for arg in COLUMN_ARGS if spec.get(arg) is not None))
+
+
+def _split_spec(spec):
+    """key, helper name, data (only the used columns) and helper arguments of a spec."""
+    spec = dict(spec)
+    key, plot, data = _check_key(spec.pop('key')), spec.pop('plot'), spec.pop('data')
+    if plot not in PLOTTERS:
+        raise ValueError(f"Unknown plot '{plot}', expected one of {sorted(PLOTTERS)}")
+    return key, plot, data[_spec_columns(spec)], spec
+
+
+def _hash_default(value):
+    """JSON stand-in of a non-JSON argument: content hash of data, repr otherwise."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes().hex()
+    return repr(value)
+
+
+def figure_hash(plot, data, kwargs):
+    """Hash of everything a figure depends on: helper, arguments, style and data."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([STYLE_VERSION, plot, kwargs], sort_keys=True, default=_hash_default).encode())
+    digest.update(json.dumps([list(data.columns), [str(t) for t in data.dtypes]]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _init_worker():
+    matplotlib.use('Agg', force=True)
+    apply_style()
+
+
+def _render(task):
+    """Draw one figure and write it (runs in a worker)."""
+    plot, data, kwargs, path = task
+    start = time.perf_counter()
+    PLOTTERS[plot](data, save=False, **kwargs)
+    plt.gcf().savefig(path, dpi=DPI, bbox_inches="tight")
+    plt.close('all')
+    return time.perf_counter() - start
+
+
+def render_figures(specs, folder="results/plots", workers=None, force=False):
+    """
+    Render the figure specs to <folder>/<key>.png on a process pool, skipping
+    figures unchanged since the last run (unless ``force``).
+    Returns a report with the status and drawing time of every figure.
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    report, tasks, hashes = [], {}, {}
+    for spec in specs:
+        key, plot, data, kwargs = _split_spec(spec)
+        if key in hashes:
+            raise ValueError(f"Duplicate figure key '{key}'")
+        path = os.path.join(folder, f'{key}.png')
+        hashes[key] = figure_hash(plot, data, kwargs)
+        if not force and manifest.get(key) == hashes[key] and os.path.exists(path):
+            report.append({'key': key, 'path': path, 'status': 'unchanged', 'seconds': 0.0})
+        else:
+            tasks[key] = (plot, data, kwargs, path)
+
+    try:
+        if tasks:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                for key, seconds in zip(tasks, pool.map(_render, tasks.values())):
+                    report.append({'key': key, 'path': tasks[key][3], 'status': 'rendered',
+                                   'seconds': seconds})
+                    manifest[key] = hashes[key]
+    finally:
+        # Figures written before a failure are kept
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    return pd.DataFrame(report, columns=['key', 'path', 'status', 'seconds'])
+
+
+# === Thesis figures ===
+# Figure specs of the 02 notebook without their data; 'subset' names the
+# subset_masks mask of the rows to plot (None: the whole analytic table)
+THESIS_FIGURES = [
+    {'key': 'hist_stot', 'plot': 'hist', 'subset': None, 'column': 'stot',
+     'title': "Distribution of Social Visibility (Raw)", 'xlabel': "Social Visibility (untransformed)"},
+    {'key': 'hist_stot_log1p', 'plot': 'hist', 'subset': None, 'column': 'stot_log1p',
+     'title': "Distribution of Log-Transformed Social Visibility", 'xlabel': "log(1 + Social Visibility)"},
+    {'key': 'hist_cit_log', 'plot': 'hist', 'subset': None, 'column': 'cit_log',
+     'title': "Distribution of Log-Transformed Citation Counts", 'xlabel': "log(1 + Citation Count)"},
+    {'key': 'hist_cited_by_count', 'plot': 'hist', 'subset': None, 'column': 'cited_by_count',
+     'title': 'Distribution of Author-Level Citation Counts', 'xlabel': 'Number of Citations'},
+    {'key': 'hist_cited_by_log1p', 'plot': 'hist', 'subset': None, 'column': 'cited_by_log1p',
+     'title': 'Distribution of Log-Transformed Author-Level Citations', 'xlabel': 'log(1 + Citations)'},
+    {'key': 'regplot_cit_log_stot_log1p', 'plot': 'regplot', 'subset': None,
+     'x_col': "cit_log", 'y_col': "stot_log1p",
+     'title': "Relationship Between Citations and Social Visibility",
+     'xlabel': "log(1 + Citation Count)", 'ylabel': "log(1 + Social Visibility)",
+     'scatter_alpha': 0.15, 'scatter_size': 12, 'line_color': "darkorange", 'mode': 'hexbin'},
+    {'key': 'countplot_gender_majority', 'plot': 'countplot', 'subset': 'gender_filtered',
+     'column': 'gender_majority', 'title': "Gender Distribution", 'xlabel': "Gender majority"},
+    {'key': 'boxplot_gender_stot_log1p', 'plot': 'boxplot', 'subset': 'gender_filtered',
+     'column_x': 'gender_majority', 'column_y': 'stot_log1p',
+     'title': "Social Visibility by Gender Majority", 'xlabel': "Gender Majority",
+     'ylabel': "log(1 + Social Visibility)"},
+    {'key': 'ranked_hist_stot', 'plot': 'hist', 'subset': 'ranked', 'column': 'stot',
+     'title': "Distribution of Social Visibility (Ranked Institutions)", 'xlabel': "Social Visibility (raw values)"},
+    {'key': 'ranked_hist_stot_log1p', 'plot': 'hist', 'subset': 'ranked', 'column': 'stot_log1p',
+     'title': "Log-Transformed Distribution of Social Visibility (Ranked Institutions)",
+     'xlabel': "log(1 + Social Visibility)"},
+    {'key': 'ranked_hist_cit_log', 'plot': 'hist', 'subset': 'ranked', 'column': 'cit_log',
+     'title': "Distribution of Log-Transformed Citations (Ranked Institutions)", 'xlabel': "log(1 + Citation Count)"},
+    {'key': 'ranked_hist_cited_by_log1p', 'plot': 'hist', 'subset': 'ranked', 'column': 'cited_by_log1p',
+     'title': 'Distribution of Log-Transformed Author-Level Citations (Ranked Institutions)',
+     'xlabel': 'log(1 + Citation Count)'},
+    {'key': 'ranked_regplot_cit_log_stot_log1p', 'plot': 'regplot', 'subset': 'ranked',
+     'x_col': "cit_log", 'y_col': "stot_log1p",
+     'title': "Relationship Between Citations and Social Visibility (Ranked Institutions)",
+     'xlabel': "log(1 + Citation Count)", 'ylabel': "log(1 + Social Visibility)",
+     'scatter_alpha': 0.15, 'scatter_size': 12, 'line_color': "darkorange"},
+    {'key': 'ranked_countplot_gender_majority', 'plot': 'countplot', 'subset': 'ranked_gender_filtered',
+     'column': 'gender_majority', 'title': "Gender Distribution (Ranked Institutions)", 'xlabel': "Gender"},
+    {'key': 'ranked_boxplot_gender_stot_log1p', 'plot': 'boxplot', 'subset': 'ranked_gender_filtered',
+     'column_x': 'gender_majority', 'column_y': 'stot_log1p',
+     'title': "Social Visibility by Gender (Ranked Institutions)", 'xlabel': "Gender",
+     'ylabel': "log(1 + Social Visibility)"},
+]
+
+
+def thesis_figure_specs(df, masks, keys=None):
+    """
+    THESIS_FIGURES (only ``keys`` if given) with their data: the analytic
+    table or its rows of ``masks[subset]`` (only the plotted columns).
+    """
+    specs = []
+    for figure in THESIS_FIGURES:
+        if keys is not None and figure['key'] not in keys:
+            continue
+        spec = dict(figure)
+        subset = spec.pop('subset')
+        spec['data'] = df if subset is None else df.loc[masks[subset], _spec_columns(spec)]
+        specs.append(spec)
+    return specs
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Stage-level timing and memory report of the pipeline scripts.
+
+A ``PipelineProfiler`` splits a script into named stages, one per numbered
+section ("=== 1. Load raw data ===" -> ``profiler.stage('1. Load raw data')``).
+A stage ends where the next one starts, at ``end()`` / ``finish()``, or at the
+end of a ``with profiler.stage(...)`` block. For every stage it records:
+- wall and CPU time (process CPU, so work in other threads counts too),
+- memory: the process peak RSS so far (``resource``, not on Windows), the
+  current RSS (Linux) and, with ``trace_memory``, the peak of the Python /
+  NumPy allocations within the stage (tracemalloc, slows the run down),
+- the DataFrames of the script's namespace (``globals()``) at the start and
+  end of the stage: rows in / out and ``memory_usage`` (shallow, i.e. string
+  columns count their pointers only; ``deep_memory=True`` measures the
+  strings, which scans every value); the frames at the end of a stage are
+  those at the start of the next one, and measuring them is not part of the
+  stage times (it is reported as overhead_s),
+- with ``profile_dir``, a cProfile dump of the stage (open with pstats or
+  snakeviz).
+
+The run report (JSON with the per-frame details, CSV with one row per stage)
+is rewritten after every stage, so a run that is stopped still shows where
+it was. Reports go to results/profiling/<run>_<timestamp>.json / .csv;
+``python scripts/profiling.py REPORT.json [REPORT.json ...]`` prints them side
+by side (e.g. the previous data year against the new one).
+
+In the notebook the stages also include the time between cells, so time it
+with "Run All" (or nbconvert --execute).
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+REPORT_DIR = 'results/profiling'
+
+STAGE_COLUMNS = [
+    'run', 'stage_index', 'stage', 'started', 'wall_s', 'cpu_s', 'overhead_s',
+    'max_rss_mb', 'rss_mb', 'traced_peak_mb', 'rows_in', 'rows_out',
+    'frame_memory_mb', 'frames', 'profile'
+]
+
+MB = 1024 ** 2
+
+
+# === Memory readings ===
+def max_rss_mb():
+    """Peak resident set size of the process so far (NaN without ``resource``)."""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / MB if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """Current resident set size (Linux only, else NaN)."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return float('nan')
+    return pages * os.sysconf('SC_PAGE_SIZE') / MB
+
+
+def frame_sizes(namespace, deep=True):
+    """Rows and memory (MB) of every DataFrame variable of a namespace."""
+    sizes = {}
+    for name, obj in list(namespace.items()):
+        if isinstance(obj, pd.DataFrame) and not name.startswith('_'):
+            sizes[name] = {
+                'rows': len(obj),
+                'memory_mb': obj.memory_usage(deep=deep).sum() / MB,
+            }
+    return sizes
+
+
+def _reading(value):
+    """Memory reading for the report (None when not available)."""
+    return None if value != value else value
+
+
+def _slug(text):
+    return re.sub(r'[^0-9a-zA-Z]+', '_', text).strip('_').lower()[:60]
+
+
+# === Profiler ===
+class PipelineProfiler:
+    """
+    Named stages of one run of a script. ``namespace`` is the dict whose
+    DataFrames are measured (``globals()`` of the script), None for none.
+    """
+
+    def __init__(self, run_name, namespace=None, report_dir=REPORT_DIR, trace_memory=False,
+                 profile_dir=None, deep_memory=False):
+        self.run_name = run_name
+        self.namespace = namespace
+        self.report_dir = report_dir
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.deep_memory = deep_memory
+
+        self.started = datetime.now()
+        stamp = self.started.strftime('%Y%m%d_%H%M%S')
+        self.report_path = os.path.join(report_dir, f'{run_name}_{stamp}')
+        self.stages = []
+        self.status = 'running'
+        self._current = None
+        self._frames_out = {}
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # A script that fails still leaves its report
+        atexit.register(self._at_exit)
+
+    # --- Stages ---
+    def stage(self, name):
+        """End the current stage and start ``name``; usable as ``with profiler.stage(name):``."""
+        # Frames measured at the end of the previous stage, unless none was running
+        follows = self._current is not None
+        self.end()
+        overhead = time.perf_counter()
+        if follows:
+            frames_in = self._frames_out
+        else:
+            frames_in = frame_sizes(self.namespace, self.deep_memory) if self.namespace is not None else {}
+
+        profile = None
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        self._current = {
+            'name': name,
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'frames_in': frames_in,
+            'profile': profile,
+            'overhead_s': time.perf_counter() - overhead,
+            'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+        }
+        if profile is not None:
+            profile.enable()
+        return self
+
+    def end(self):
+        """End the current stage (if any) and rewrite the report."""
+        current, self._current = self._current, None
+        if current is None:
+            return
+        wall_s = time.perf_counter() - current['wall']
+        cpu_s = time.process_time() - current['cpu']
+        profile = current['profile']
+        if profile is not None:
+            profile.disable()
+        traced_peak_mb = tracemalloc.get_traced_memory()[1] / MB if self.trace_memory else None
+
+        overhead = time.perf_counter()
+        index = len(self.stages) + 1
+        profile_path = None
+        if profile is not None:
+            profile_path = os.path.join(
+                self.profile_dir, f'{self.run_name}_{index:02d}_{_slug(current["name"])}.prof'
+            )
+            profile.dump_stats(profile_path)
+        frames_out = frame_sizes(self.namespace, self.deep_memory) if self.namespace is not None else {}
+        self._frames_out = frames_out
+
+        # Frames that exist at either end of the stage
+        frames = {}
+        for name in dict.fromkeys([*current['frames_in'], *frames_out]):
+            before, after = current['frames_in'].get(name), frames_out.get(name)
+            frames[name] = {
+                'rows_in': before['rows'] if before else None,
+                'rows_out': after['rows'] if after else None,
+                'memory_mb': round(after['memory_mb'], 3) if after else None,
+            }
+
+        self.stages.append({
+            'run': self.run_name,
+            'stage_index': index,
+            'stage': current['name'],
+            'started': current['started'],
+            'wall_s': wall_s,
+            'cpu_s': cpu_s,
+            'overhead_s': current['overhead_s'] + time.perf_counter() - overhead,
+            'max_rss_mb': _reading(max_rss_mb()),
+            'rss_mb': _reading(current_rss_mb()),
+            'traced_peak_mb': traced_peak_mb,
+            'rows_in': sum(f['rows'] for f in current['frames_in'].values()),
+            'rows_out': sum(f['rows'] for f in frames_out.values()),
+            'frame_memory_mb': sum(f['memory_mb'] for f in frames_out.values()),
+            'frames': frames,
+            'profile': profile_path,
+        })
+        self.write_report()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+        return False
+
+    def finish(self):
+        """End the last stage, write the final report and return its path (without extension)."""
+        self.end()
+        if self.status == 'running':
+            self.status = 'completed'
+            if self.trace_memory:
+                tracemalloc.stop()
+            self.write_report()
+        return self.report_path
+
+    def _at_exit(self):
+        if self.status == 'running':
+            self.end()
+            self.status = 'exited'
+            self.write_report()
+
+    # --- Reports ---
+    def stage_table(self):
+        """One row per finished stage (STAGE_COLUMNS); frames as 'name rows_in->rows_out'."""
+        table = pd.DataFrame(self.stages, columns=STAGE_COLUMNS)
+        table['frames'] = [
+            '; '.join(f"{name} {f['rows_in']}->{f['rows_out']}" for name, f in frames.items())
+            for frames in table['frames']
+        ]
+        return table
+
+    def write_report(self):
+        os.makedirs(self.report_dir, exist_ok=True)
+        report = {
+            'run': self.run_name,
+            'status': self.status,
+            'started': self.started.isoformat(timespec='seconds'),
+            'written': datetime.now().isoformat(timespec='seconds'),
+            'argv': sys.argv,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'trace_memory': self.trace_memory,
+            'total_wall_s': sum(s['wall_s'] for s in self.stages),
+            'total_cpu_s': sum(s['cpu_s'] for s in self.stages),
+            'stages': self.stages,
+        }
+        with open(self.report_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, default=str)
+        self.stage_table().to_csv(self.report_path + '.csv', index=False)
+
+
+# === Reading reports ===
+def load_report(path):
+    """Stage table of a JSON run report."""
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    table = pd.DataFrame(report['stages'], columns=STAGE_COLUMNS).drop(columns='frames')
+    table['report'] = os.path.basename(path)
+    return table
+
+
+def compare_reports(paths, value='wall_s'):
+    """``value`` of every stage (rows) in every report (columns)."""
+    tables = pd.concat([load_report(path) for path in paths], ignore_index=True)
+    return tables.pivot_table(index=['stage_index', 'stage'], columns='report', values=value,
+                              aggfunc='sum', sort=False)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print the stage times of run reports side by side.')
+    parser.add_argument('reports', nargs='+', help='JSON run reports')
+    parser.add_argument('--value', default='wall_s', choices=STAGE_COLUMNS[4:13])
+    args = parser.parse_args()
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200,
+                           'display.float_format', '{:.2f}'.format):
+        print(compare_reports(args.reports, args.value))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Rank matching of institution rows as functions (exact -> fuzzy -> manual).
+
+Same steps as 01_merge_rank_institution.py without the interactive review
+exports, for running the pipeline unattended (batch_driver.py):
+- exact match of the normalized display name to a normalized ranking name,
+- fuzzy match (WRatio >= threshold) for the remaining names, whose rank is
+  the rank of the matched ranking name; if a list of accepted names (manual
+  check of the fuzzy candidates) is given, only those are used,
+- manual pairings (display_name_clean -> manual_rank) fill what is left.
+For large ranking tables the fuzzy step can score only the top ``candidates``
+names of an n-gram TF-IDF index (candidate_index.py) instead of all of them.
+"""
+
+import numpy as np
+import pandas as pd
+
+from candidate_index import ApproximateMatcher
+from institution_matching import InstitutionMatcher
+
+RANKED_COLUMNS = [
+    'parent_id', 'doi', 'doi_key', 'author', 'author_key', 'author_position',
+    'institutions', 'ror', 'display_name_original', 'display_name_clean', 'country_code', 'type',
+    'homepage_url', 'fuzzy_matched_name', 'match_score', 'rank_source',
+    'final_rank', 'rank_flag'
+]
+
+
+class RankingIndex:
+    """
+    Read-only lookup structures of one cleaned ranking table: the
+    normalized name -> rank mapping and the fuzzy matcher over those names
+    (approximate, top ``candidates`` per name, if given).
+    """
+
+    def __init__(self, df_ranking, normalizer, threshold=90, candidates=None):
+        names = normalizer.normalize_series(df_ranking['name'])
+        # Later duplicates of a normalized name win, as in 01
+        self.mapping = dict(zip(names, df_ranking['rank']))
+        if candidates:
+            self.matcher = ApproximateMatcher(list(self.mapping.keys()), threshold=threshold, k=candidates)
+        else:
+            self.matcher = InstitutionMatcher(list(self.mapping.keys()), threshold=threshold)
+
+
+def match_ranks(df_institution, index, normalizer, accepted_names=None, manual_df=None):
+    """
+    Add display_name_clean, the exact / fuzzy / manual ranks, final_rank,
+    rank_source ('exact', 'fuzzy', 'manual') and rank_flag to an
+    institution table. Returns a new DataFrame.
+    """
+    df = df_institution.copy()
+    df['display_name_original'] = df['display_name']
+    df['display_name_clean'] = normalizer.normalize_series(df['display_name'])
+
+    # Exact match
+    df['rank'] = df['display_name_clean'].map(index.mapping)
+
+    # Fuzzy match of the rest
+    mask = df['rank'].isna()
+    results = index.matcher.match(df.loc[mask, 'display_name_clean'])
+    df['fuzzy_matched_name'] = results['fuzzy_matched_name'].reindex(df.index)
+    df['match_score'] = results['match_score'].reindex(df.index)
+    df['fuzzy_rank'] = df['fuzzy_matched_name'].map(index.mapping)
+    if accepted_names is not None:
+        df['fuzzy_rank'] = df['fuzzy_rank'].where(df['display_name_clean'].isin(accepted_names))
+
+    # Manual pairings
+    if manual_df is not None:
+        manual = manual_df.dropna(subset=['display_name_clean']).drop_duplicates('display_name_clean')
+        df['manual_rank'] = df['display_name_clean'].map(
+            manual.set_index('display_name_clean')['manual_rank']
+        )
+    else:
+        df['manual_rank'] = np.nan
+
+    df['final_rank'] = df['rank'].combine_first(df['fuzzy_rank']).combine_first(df['manual_rank'])
+    df['rank_source'] = pd.Series(
+        np.select(
+            [df['rank'].notna(), df['fuzzy_rank'].notna(), df['manual_rank'].notna()],
+            ['exact', 'fuzzy', 'manual'],
+            default=''
+        ),
+        index=df.index
+    ).replace('', None)
+    df['rank_flag'] = df['final_rank'].notna().astype(int)
+    return df
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized parsing of ranking columns.
+
+``parse_rank`` and ``parse_gender_ratio`` work on whole columns with
+``str.extract`` and numeric array operations and give the same results as the
+row-wise reference functions ``clean_rank`` and ``split_gender_ratio``:
+- rank labels: '=12', '201–250' / '201-250', '1001+', '>800', plain numbers,
+- female : male ratios: '55 : 45'.
+Every distinct value is parsed once. The few values that none of the patterns
+covers (e.g. '1-2-3', '1e3') are passed to the reference function.
+
+Run this file to check the vectorized parsers against the reference functions
+(on built-in cases and, if it exists, on cleaned_data/ranking_clean.parquet):
+    python scripts/ranking_parsing.py
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# === Reference (row-wise) parsers ===
+def split_gender_ratio(ratio):
+    """Split 'female : male' into percentages."""
+    try:
+        female, male = ratio.split(':')
+        total = int(female.strip()) + int(male.strip())
+        return int(female.strip()) / total * 100, int(male.strip()) / total * 100
+    except:
+        return np.nan, np.nan
+
+
+def clean_rank(value):
+    """Convert a rank label ('=5', '201–250', '1001+', '>800') to a number."""
+    if pd.isnull(value):
+        return np.nan
+    value = str(value).strip()
+    if value.startswith('='):
+        return int(value[1:])
+    if '–' in value or '-' in value:
+        parts = value.replace('–', '-').split('-')
+        try:
+            nums = list(map(int, parts))
+            return sum(nums) / len(nums)
+        except:
+            return np.nan
+    if value.endswith('+'):
+        try:
+            return float(value.replace('+', ''))
+        except:
+            return np.nan
+    if '>' in value:
+        try:
+            return float(value.replace('>', ''))
+        except:
+            return np.nan
+    try:
+        return float(value)
+    except:
+        return np.nan
+
+
+# === Vectorized parsers ===
+# One alternative per branch of clean_rank; each only matches values that take
+# that branch there
+_NUMBER = r'[0-9]+(?:\.[0-9]+)?'
+RANK_PATTERN = '|'.join([
+    r'=\s*(?P<equal>\+?[0-9]+)',                                     # '=12'
+    r'(?P<range_from>\+?[0-9]+)\s*[-–]\s*(?P<range_to>\+?[0-9]+)',   # '201–250'
+    rf'(?P<plus>{_NUMBER})\+',                                        # '1001+'
+    rf'>\s*(?P<greater>{_NUMBER})',                                   # '>800'
+    rf'(?P<plain>{_NUMBER})',                                         # '12'
+])
+RATIO_PATTERN = r'\s*(?P<female>[+-]?[0-9]{1,15})\s*:\s*(?P<male>[+-]?[0-9]{1,15})\s*'
+
+
+def _parse_rank_labels(labels):
+    """Numeric ranks of distinct, non-missing labels."""
+    labels = pd.Series(labels, dtype=object)
+    groups = labels.astype(str).str.strip().str.extract(f'^(?:{RANK_PATTERN})$')
+    groups = groups.astype(float)
+
+    values = (
+        groups['equal']
+        .fillna((groups['range_from'] + groups['range_to']) / 2)
+        .fillna(groups['plus'])
+        .fillna(groups['greater'])
+        .fillna(groups['plain'])
+        .to_numpy()
+    )
+
+    # Anything else goes through the reference parser
+    parsed = groups.notna().any(axis=1).to_numpy()
+    if not parsed.all():
+        values[~parsed] = [clean_rank(v) for v in labels[~parsed]]
+    return values
+
+
+def parse_rank(ranks):
+    """Numeric rank of every label of a Series (same as ``ranks.apply(clean_rank)``)."""
+    ranks = pd.Series(ranks)
+    # Rankings repeat a small set of labels: parse each distinct label once
+    codes, labels = pd.factorize(ranks)
+    values = np.append(_parse_rank_labels(labels), np.nan)
+    return pd.Series(values[codes], index=ranks.index, name=ranks.name)
+
+
+def _parse_ratio_labels(ratios):
+    """Female and male percentages of distinct, non-missing ratios."""
+    ratios = pd.Series(ratios, dtype=object)
+    female = np.full(len(ratios), np.nan)
+    male = np.full(len(ratios), np.nan)
+
+    # Non-strings are always NaN
+    is_text = ratios.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    groups = ratios[is_text].str.extract(f'^{RATIO_PATTERN}$')
+    hit = groups['female'].notna().to_numpy()
+    f = groups['female'].to_numpy()[hit].astype(np.int64)
+    m = groups['male'].to_numpy()[hit].astype(np.int64)
+    total = f + m
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # A zero total is a ZeroDivisionError (NaN) in the reference
+        female_hit = np.where(total != 0, f / total * 100, np.nan)
+        male_hit = np.where(total != 0, m / total * 100, np.nan)
+
+    rows = np.flatnonzero(is_text)
+    female[rows[hit]] = female_hit
+    male[rows[hit]] = male_hit
+
+    # Other strings (e.g. '1_0 : 5', very long numbers) go through the reference parser
+    for row in rows[~hit]:
+        female[row], male[row] = split_gender_ratio(ratios.iloc[row])
+    return female, male
+
+
+def parse_gender_ratio(ratios):
+    """
+    Female and male percentages of every 'female : male' ratio of a Series
+    (same as ``split_gender_ratio`` per value). Returns a DataFrame with
+    columns female_pct and male_pct.
+    """
+    ratios = pd.Series(ratios)
+    codes, labels = pd.factorize(ratios)
+    female, male = _parse_ratio_labels(labels)
+    return pd.DataFrame({
+        'female_pct': np.append(female, np.nan)[codes],
+        'male_pct': np.append(male, np.nan)[codes],
+    }, index=ratios.index)
+
+
+# === Test harness ===
+RANK_CASES = [
+    '1', ' 12 ', '=12', '= 7', '=+3', '201–250', '201-250', '201 – 250', '+5-6',
+    '1001+', '1001.5+', '>800', '> 800', '12.5', '1-2-3', '-5', '5-', '–',
+    'abc', '', '1e3', 'inf', '1001++', '+7', '>1001+', '1_000', 12, 12.0, np.nan, None,
+]
+RATIO_CASES = [
+    '55 : 45', '55:45', ' 40 : 60 ', '0 : 0', '-5 : 10', '+5 : 5', '1_0 : 5',
+    'n/a', '', ':', '1 : 2 : 3', '50', '12345678901234567890 : 1', 1.5, np.nan, None,
+]
+
+
+def _same(a, b):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return a.shape == b.shape and bool(np.all((a == b) | (np.isnan(a) & np.isnan(b))))
+
+
+def check_against_reference(ranks=None, ratios=None):
+    """
+    Compare the vectorized parsers with the reference functions on the
+    built-in cases plus the given values. Raises AssertionError on a mismatch.
+    """
+    ranks = pd.Series(RANK_CASES + list(ranks if ranks is not None else []), dtype=object)
+    ratios = pd.Series(RATIO_CASES + list(ratios if ratios is not None else []), dtype=object)
+
+    expected_rank = ranks.apply(clean_rank)
+    got_rank = parse_rank(ranks)
+    bad = [(v, e, g) for v, e, g in zip(ranks, expected_rank, got_rank) if not _same([e], [g])]
+    assert not bad, f"parse_rank differs from clean_rank (value, expected, got): {bad}"
+
+    expected_ratio = ratios.apply(lambda x: pd.Series(split_gender_ratio(x)))
+    got_ratio = parse_gender_ratio(ratios)
+    assert _same(expected_ratio[0], got_ratio['female_pct']), "female_pct differs from split_gender_ratio"
+    assert _same(expected_ratio[1], got_ratio['male_pct']), "male_pct differs from split_gender_ratio"
+
+    print(f"Vectorized parsers match the reference on {len(ranks)} ranks and {len(ratios)} ratios")
+
+
+if __name__ == '__main__':
+    path = os.path.join('cleaned_data', 'ranking_clean.parquet')
+    if os.path.exists(path):
+        ranking = pd.read_parquet(path, columns=['rank', 'stats_female_male_ratio'])
+        check_against_reference(ranking['rank'], ranking['stats_female_male_ratio'])
+    else:
+        check_against_reference()
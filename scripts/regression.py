@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+OLS sweeps over a shared sparse design matrix.
+
+The design matrix of the whole table is built once (``RegressionDesign``):
+an intercept, one treatment-coded one-hot block per categorical term
+(column names as patsy, e.g. 'C(gender_majority)[T.gender_male_majority]')
+and the numeric terms, as one scipy.sparse CSR matrix. A model is a set of
+terms and an outcome; it is fitted on a row mask of that matrix (stratum,
+subset, rows without missing values) with the normal equations, so no
+formula is parsed and no dense design is built per model. Country fixed
+effects with hundreds of levels stay cheap: only X'X (terms x terms) is dense.
+
+As smf.ols on the same rows:
+- the reference level of a categorical term is its first level present in
+  the rows (category order, else sorted),
+- levels absent from the rows get no column,
+- standard errors are nonrobust (t tests, df = n - k) or clustered
+  (``cluster``, e.g. doi: statsmodels' small-sample correction, z tests).
+Rows with a missing outcome, term or cluster are left out.
+
+A sweep runs in one process and takes no SharedFrame: subsets are masks of
+the one design matrix (nothing is copied), and a model is one small solve,
+so there is no per-stratum data to hand to pool workers.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+COEFFICIENT_COLUMNS = [
+    'model', 'outcome', 'strata', 'stratum', 'term', 'coef', 'std_err', 'statistic',
+    'p_value', 'ci_low', 'ci_high', 'n', 'n_clusters', 'r_squared', 'cov_type'
+]
+
+
+class RegressionDesign:
+    """
+    Sparse design matrix of ``df`` with the given categorical and numeric
+    terms, built once and shared by all models of a sweep.
+    """
+
+    def __init__(self, df, categorical=(), numeric=(), cluster=None):
+        n = len(df)
+        self.n_rows = n
+        self.df = df
+        self.columns = ['Intercept']
+        self.term_columns = {}       # term -> positions of its columns
+        self.term_levels = {}        # categorical term -> (row codes, column of every level)
+        self.valid = {}              # term -> rows without a missing value
+        blocks = [sparse.csr_matrix(np.ones((n, 1)))]
+        width = 1
+
+        for term in categorical:
+            codes, levels = pd.factorize(df[term], sort=True)
+            valid = codes >= 0
+            # Level 0 is the default reference and has no column
+            rows = np.flatnonzero(valid & (codes > 0))
+            blocks.append(sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, codes[rows] - 1)), shape=(n, max(len(levels) - 1, 0))
+            ))
+            names = [f'C({term})[T.{level}]' for level in levels[1:]]
+            self.term_columns[term] = np.arange(width, width + len(names))
+            self.term_levels[term] = (codes, np.r_[-1, np.arange(width, width + len(names))])
+            self.valid[term] = valid
+            self.columns += names
+            width += len(names)
+
+        for term in numeric:
+            values = df[term].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            blocks.append(sparse.csr_matrix(np.where(valid, values, 0)[:, None]))
+            self.term_columns[term] = np.array([width])
+            self.valid[term] = valid
+            self.columns.append(term)
+            width += 1
+
+        self.matrix = sparse.hstack(blocks, format='csr')
+        self.columns = np.array(self.columns, dtype=object)
+
+        self.cluster = cluster
+        self.cluster_codes = None
+        if cluster is not None:
+            self.cluster_codes = (
+                df.groupby(cluster, sort=False, observed=True, dropna=True).ngroup()
+                .fillna(-1).to_numpy(dtype=np.int64)
+            )
+
+    def _model_columns(self, terms, rows):
+        """Intercept and term columns of a model on ``rows``, as smf.ols would have them."""
+        columns = [np.array([0])]
+        for term in terms:
+            if term not in self.term_levels:
+                columns.append(self.term_columns[term])
+                continue
+            codes, positions = self.term_levels[term]
+            present = np.flatnonzero(np.bincount(codes[rows], minlength=len(positions)))
+            # The first present level is the reference
+            columns.append(positions[present[1:]])
+        return np.concatenate(columns)
+
+    def fit(self, outcome, terms, mask=None, name=None):
+        """
+        Fit outcome ~ terms on the rows of ``mask`` (all rows if None).
+        Returns the coefficient table of the model (COEFFICIENT_COLUMNS).
+        """
+        y = self.df[outcome].to_numpy(dtype=float)
+        rows = ~np.isnan(y) if mask is None else np.asarray(mask, dtype=bool) & ~np.isnan(y)
+        for term in terms:
+            rows &= self.valid[term]
+        if self.cluster_codes is not None:
+            rows &= self.cluster_codes >= 0
+        rows = np.flatnonzero(rows)
+
+        columns = self._model_columns(terms, rows)
+        X = self.matrix[rows][:, columns]
+        y = y[rows]
+        n, k = X.shape
+
+        xtx_inv = np.linalg.pinv((X.T @ X).toarray())
+        beta = xtx_inv @ (X.T @ y)
+        residuals = y - X @ beta
+        ss_residual = float(residuals @ residuals)
+        ss_total = float(((y - y.mean()) ** 2).sum())
+
+        if self.cluster_codes is None:
+            cov = xtx_inv * ss_residual / (n - k)
+            n_clusters = np.nan
+            cov_type = 'nonrobust'
+        else:
+            # Sum of the scores X'e within every cluster
+            clusters, cluster_rows = np.unique(self.cluster_codes[rows], return_inverse=True)
+            n_clusters = len(clusters)
+            members = sparse.csr_matrix(
+                (residuals, (cluster_rows, np.arange(n))), shape=(n_clusters, n)
+            )
+            # Only the k x k meat is dense, not the n_clusters x k scores
+            scores = members @ X
+            meat = (scores.T @ scores).toarray()
+            correction = n_clusters / (n_clusters - 1) * (n - 1) / (n - k)
+            cov = correction * xtx_inv @ meat @ xtx_inv
+            cov_type = 'cluster'
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std_err = np.sqrt(np.diag(cov))
+            statistic = beta / std_err
+        if cov_type == 'nonrobust':
+            distribution = stats.t(n - k)
+        else:
+            distribution = stats.norm()
+        p_value = 2 * distribution.sf(np.abs(statistic))
+        margin = distribution.ppf(0.975) * std_err
+
+        return pd.DataFrame({
+            'model': name if name is not None else f"{outcome} ~ {' + '.join(terms) or '1'}",
+            'outcome': outcome,
+            'strata': None,
+            'stratum': None,
+            'term': self.columns[columns],
+            'coef': beta,
+            'std_err': std_err,
+            'statistic': statistic,
+            'p_value': p_value,
+            'ci_low': beta - margin,
+            'ci_high': beta + margin,
+            'n': n,
+            'n_clusters': n_clusters,
+            'r_squared': 1 - ss_residual / ss_total if ss_total > 0 else np.nan,
+            'cov_type': cov_type,
+        }, columns=COEFFICIENT_COLUMNS)
+
+    def sweep(self, models, strata=None, mask=None):
+        """
+        Fit every (outcome, terms) model on every stratum of ``strata`` (the
+        whole table if None), within the rows of ``mask``.
+        Returns one coefficient table.
+        """
+        base = np.ones(self.n_rows, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        if strata is None:
+            partitions = [('all', base)]
+        else:
+            partitions = []
+            for stratum, positions in self.df.groupby(strata, observed=True, sort=True).indices.items():
+                in_stratum = np.zeros(self.n_rows, dtype=bool)
+                in_stratum[positions] = True
+                partitions.append((stratum, base & in_stratum))
+
+        tables = []
+        for stratum, rows in partitions:
+            if not rows.any():
+                continue
+            for outcome, terms in models:
+                table = self.fit(outcome, list(terms), mask=rows)
+                table['strata'] = strata
+                table['stratum'] = stratum
+                tables.append(table)
+        return pd.concat(tables, ignore_index=True)
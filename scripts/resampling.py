@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Cluster bootstrap and permutation tests of group differences (mean, median).
+
+Articles repeat once per author / institution row in the analytic table, so
+rows are not independent: resampling works on clusters (doi by default).
+- Bootstrap: clusters are drawn with replacement; each resample is a row of
+  a matrix of cluster multiplicities (``np.bincount`` of the drawn indices).
+  Group means are then one matrix product with the per-cluster group sums
+  and counts, group medians come from the cumulative multiplicities of the
+  value-sorted rows. Percentile intervals of the differences are reported.
+- Permutation: group labels are shuffled between the clusters of the two
+  compared groups (a cluster keeps all its rows, so the factor must be
+  constant within a cluster) and the statistics of the two relabelled
+  groups are recomputed the same way.
+Statistics are row-level, as the group means of the notebook. Where the
+factor varies within a cluster there is no permutation p-value; the
+``permutation_note`` column says why.
+
+Resamples are generated in chunks of index matrices (``max_cells`` bounds the
+cells of a chunk: resamples x clusters, or resamples x rows of a group for
+medians, whose cumulative weights are taken over the rows). Every chunk has its own seed spawned from ``seed``, so the
+results do not depend on the number of workers. Chunks can run on a process
+pool; the data of all comparisons is handed to the workers once, or, with a
+``shared`` frame (shared_frames.py), only the row positions of every
+comparison: the workers then read the columns from its memory-mapped files
+and build the comparison data themselves.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+STATISTICS = ('mean', 'median')
+
+RESULT_COLUMNS = [
+    'outcome', 'factor', 'strata', 'stratum', 'cluster', 'term', 'statistic',
+    'n_a', 'n_b', 'estimate', 'ci_low', 'ci_high', 'p_permutation', 'permutation_note', 'n_resamples'
+]
+
+# Comparison data of the worker process, set by _init_worker
+_PROBLEMS = None
+
+
+# === Statistics of weighted clusters ===
+def multiset_median(sorted_values, weights):
+    """
+    Median of every row of ``weights`` taken as the multiplicities of
+    ``sorted_values`` (pandas median of the expanded sample), NaN if empty.
+    """
+    if len(sorted_values) == 0:
+        return np.full(len(weights), np.nan)
+    cum = np.cumsum(weights, axis=1, dtype=np.int64)
+    total = cum[:, -1].copy()
+    # Rows are searched together: cum is increasing within a row, offsets keep the rows apart
+    width = int(total.max()) + 1
+    offsets = np.arange(len(cum)) * width
+    cum += offsets[:, None]
+    flat = cum.ravel()
+    n = cum.shape[1]
+    lower = np.searchsorted(flat, (total - 1) // 2 + offsets, side='right') - np.arange(len(cum)) * n
+    upper = np.searchsorted(flat, total // 2 + offsets, side='right') - np.arange(len(cum)) * n
+    medians = (sorted_values[np.minimum(lower, n - 1)] + sorted_values[np.minimum(upper, n - 1)]) / 2
+    return np.where(total > 0, medians, np.nan)
+
+
+def weighted_statistics(groups, weights, statistics):
+    """
+    Row-level statistics of every group for every row of cluster ``weights``
+    (resamples x clusters): {statistic: resamples x groups}.
+    ``groups`` holds the per-cluster sums and counts (clusters x groups) and,
+    per group, its value-sorted rows with their cluster codes.
+    """
+    out = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'mean' in statistics:
+            out['mean'] = (weights @ groups['sums']) / (weights @ groups['counts'])
+        if 'median' in statistics:
+            out['median'] = np.column_stack([
+                multiset_median(values, weights[:, clusters])
+                for values, clusters in groups['sorted']
+            ])
+    return out
+
+
+def _groups(values, codes, clusters, n_groups, n_clusters):
+    """Per-cluster sums / counts and sorted rows of every group."""
+    cells = clusters * n_groups + codes
+    size = n_clusters * n_groups
+    order = np.argsort(values, kind='mergesort')
+    return {
+        'sums': np.bincount(cells, weights=values, minlength=size).reshape(n_clusters, n_groups),
+        'counts': np.bincount(cells, minlength=size).reshape(n_clusters, n_groups).astype(float),
+        'sorted': [(values[order][codes[order] == g], clusters[order][codes[order] == g])
+                   for g in range(n_groups)],
+    }
+
+
+def build_problem(values, codes, clusters):
+    """
+    Resampling data of one comparison: outcome values, group codes and
+    cluster codes of its rows (rows with a missing value, group or cluster
+    are dropped).
+    """
+    keep = ~np.isnan(values) & (codes >= 0) & (clusters >= 0)
+    values = values[keep]
+    codes = codes[keep]
+    present, clusters = np.unique(clusters[keep], return_inverse=True)
+    n_clusters, n_groups = len(present), int(codes.max()) + 1 if len(codes) else 0
+
+    problem = {
+        'n_clusters': n_clusters,
+        'by_group': _groups(values, codes, clusters, n_groups, n_clusters),
+        # All rows as one group, for the relabelled groups of the permutations
+        'pooled': _groups(values, np.zeros_like(codes), clusters, 1, n_clusters),
+        'cluster_labels': None,
+    }
+    # Label of every cluster, if the factor is constant within clusters
+    labels = np.full(n_clusters, -1)
+    labels[clusters] = codes
+    if np.array_equal(labels[clusters], codes):
+        problem['cluster_labels'] = labels
+    return problem
+
+
+# === Resampling chunks ===
+def bootstrap_weights(rng, size, n_clusters):
+    """Cluster multiplicities of ``size`` bootstrap resamples (size x n_clusters)."""
+    draws = rng.integers(0, n_clusters, size=(size, n_clusters))
+    offsets = np.arange(size)[:, None] * n_clusters
+    return np.bincount((draws + offsets).ravel(), minlength=size * n_clusters).reshape(size, n_clusters)
+
+
+def permutation_weights(rng, size, labels, pair):
+    """Cluster memberships (0/1) of groups a and b in ``size`` label permutations."""
+    a, b = pair
+    in_pair = np.flatnonzero((labels == a) | (labels == b))
+    n_a = int((labels == a).sum())
+    # The n_a smallest of uniform keys are a random subset of n_a clusters
+    keys = rng.random((size, len(in_pair)))
+    kth = np.partition(keys, n_a - 1, axis=1)[:, [n_a - 1]]
+    weights_a = np.zeros((size, len(labels)), dtype=np.int32)
+    weights_b = np.zeros_like(weights_a)
+    weights_a[:, in_pair] = keys <= kth
+    weights_b[:, in_pair] = keys > kth
+    return weights_a, weights_b
+
+
+def _run_chunk(task):
+    """Statistics of one chunk of resamples (runs in a worker when parallel)."""
+    kind, key, pair, size, seed_seq, statistics = task
+    problem = _PROBLEMS[key]
+    rng = np.random.default_rng(seed_seq)
+    if kind == 'bootstrap':
+        weights = bootstrap_weights(rng, size, problem['n_clusters'])
+        return weighted_statistics(problem['by_group'], weights, statistics)
+
+    weights_a, weights_b = permutation_weights(rng, size, problem['cluster_labels'], pair)
+    stats_a = weighted_statistics(problem['pooled'], weights_a, statistics)
+    stats_b = weighted_statistics(problem['pooled'], weights_b, statistics)
+    return {s: stats_a[s][:, 0] - stats_b[s][:, 0] for s in statistics}
+
+
+def _summarize(task):
+    """
+    Size, group counts and observed statistics of one comparison (runs in a
+    worker when parallel, so shared comparisons are never built in the parent).
+    """
+    key, statistics = task
+    problem = _PROBLEMS[key]
+    return {
+        'n_clusters': problem['n_clusters'],
+        # Rows of the largest group (bootstrap medians) and of all groups (permutation medians)
+        'group_rows': max([len(values) for values, _ in problem['by_group']['sorted']], default=0),
+        'n_rows': len(problem['pooled']['sorted'][0][0]),
+        'permutable': problem['cluster_labels'] is not None,
+        'counts': problem['by_group']['counts'].sum(axis=0),
+        'observed': weighted_statistics(
+            problem['by_group'], np.ones((1, problem['n_clusters'])), statistics
+        ),
+    }
+
+
+def _init_worker(problems):
+    global _PROBLEMS
+    _PROBLEMS = problems
+
+
+class SharedProblems:
+    """
+    Comparison data built on first use from a SharedFrame: ``rows`` are the
+    positions of the compared table in the frame, ``specs`` map a comparison
+    key to its (outcome, factor, factor levels, positions in the table).
+    Only these are pickled to the workers.
+    """
+
+    def __init__(self, shared, rows, cluster, specs):
+        self.shared = shared
+        self.rows = rows
+        self.cluster = cluster
+        self.specs = specs
+        self._clusters = None
+        self._built = {}
+
+    def __getstate__(self):
+        return {'shared': self.shared, 'rows': self.rows, 'cluster': self.cluster, 'specs': self.specs}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def cluster_codes(self):
+        """Cluster codes of the table as _cluster_codes (order of first appearance)."""
+        if self._clusters is None:
+            if self.cluster is None:
+                self._clusters = np.arange(len(self.rows))
+            else:
+                codes, _ = self.shared.factor(self.cluster, self.rows)
+                valid = codes >= 0
+                _, first = np.unique(codes[valid], return_index=True)
+                relabel = np.empty(len(first), dtype=np.int64)
+                relabel[np.argsort(first)] = np.arange(len(first))
+                self._clusters = np.full(len(codes), -1, dtype=np.int64)
+                self._clusters[valid] = relabel[codes[valid]]
+        return self._clusters
+
+    def __getitem__(self, key):
+        if key not in self._built:
+            outcome, factor, levels, positions = self.specs[key]
+            rows = self.rows[positions]
+            codes, _ = self.shared.factor(factor, rows, levels)
+            self._built[key] = build_problem(
+                self.shared.values(outcome, rows), codes, self.cluster_codes()[positions]
+            )
+        return self._built[key]
+
+
+def _chunk_sizes(n_resamples, n_clusters, max_cells):
+    per_chunk = max(1, min(n_resamples, max_cells // max(n_clusters, 1)))
+    sizes = [per_chunk] * (n_resamples // per_chunk)
+    if n_resamples % per_chunk:
+        sizes.append(n_resamples % per_chunk)
+    return sizes
+
+
+# === Comparisons ===
+def _codes(series):
+    """Integer codes and levels (category order, else sorted)."""
+    codes, levels = pd.factorize(series, sort=True)
+    return codes, np.asarray(levels, dtype=object)
+
+
+def _cluster_codes(df, cluster):
+    """Integer code of every row's cluster (order of first appearance, -1 if missing)."""
+    if cluster is None:
+        return np.arange(len(df))
+    return (
+        df.groupby(cluster, sort=False, observed=True, dropna=True).ngroup()
+        .fillna(-1).to_numpy(dtype=np.int64)
+    )
+
+
+def _partitions(df, strata):
+    if strata is None:
+        return [('all', np.arange(len(df)))]
+    return df.groupby(strata, observed=True, sort=True).indices.items()
+
+
+def compare_resampled(df, specs, cluster='doi', statistics=STATISTICS, n_resamples=10_000,
+                      ci=0.95, seed=0, workers=1, max_cells=5_000_000, shared=None):
+    """
+    Cluster bootstrap intervals and permutation p-values of the pairwise
+    group differences (a - b) of every (outcome, factor, strata) spec and
+    stratum. ``cluster`` is a column, a list of columns or None (rows).
+    ``workers`` > 1 runs the chunks on a process pool; with ``shared``, a
+    SharedFrame holding the rows of ``df``, the workers read the data from it
+    and the parent only slices the strata (``cluster`` must then be a single
+    column or None).
+    Returns the tidy results table (RESULT_COLUMNS).
+    """
+    specs = [tuple(spec) + (None,) * (3 - len(spec)) for spec in specs]
+    if shared is not None and not (cluster is None or isinstance(cluster, str)):
+        raise ValueError("A shared frame needs a single cluster column (or None)")
+    cluster_name = cluster if cluster is None or isinstance(cluster, str) else '+'.join(cluster)
+
+    # Comparisons of every spec and stratum; their data is built in the parent
+    # unless the workers read it from the shared frame
+    parallel = workers is None or workers > 1
+    local = shared is None or not parallel
+    problems, comparisons, shared_specs = {}, [], {}
+    if local:
+        cluster_codes = _cluster_codes(df, cluster)
+    else:
+        rows = shared.rows(df)
+    for outcome, factor, strata in specs:
+        codes, levels = _codes(df[factor])
+        if local:
+            values = df[outcome].to_numpy(dtype=float)
+        else:
+            present = shared.factor_levels(factor, rows)
+        for stratum, positions in _partitions(df, strata):
+            key = len(comparisons)
+            if local:
+                problems[key] = build_problem(values[positions], codes[positions], cluster_codes[positions])
+            else:
+                shared_specs[key] = (outcome, factor, present, positions)
+            comparisons.append((key, outcome, factor, strata, stratum, levels))
+
+    pool = None
+    if parallel:
+        source = problems if local else SharedProblems(shared, rows, cluster, shared_specs)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,))
+    else:
+        _init_worker(problems)
+    run = map if pool is None else pool.map
+    try:
+        keys = [comparison[0] for comparison in comparisons]
+        summaries = dict(zip(keys, run(_summarize, [(key, statistics) for key in keys])))
+
+        # Chunks of resamples, every chunk with its own seed
+        tasks = []
+        problem_seeds = np.random.SeedSequence(seed).spawn(len(comparisons))
+        median = 'median' in statistics
+        for key, summary in summaries.items():
+            n_clusters = summary['n_clusters']
+            sizes = _chunk_sizes(n_resamples, max(n_clusters, summary['group_rows'] if median else 0),
+                                 max_cells)
+            boot_seed, perm_seed = problem_seeds[key].spawn(2)
+            for size, seed_seq in zip(sizes, boot_seed.spawn(len(sizes))):
+                tasks.append(('bootstrap', key, None, size, seed_seq, statistics))
+            if not summary['permutable']:
+                continue
+            sizes = _chunk_sizes(n_resamples, max(n_clusters, summary['n_rows'] if median else 0),
+                                 max_cells)
+            pairs = list(combinations(np.flatnonzero(summary['counts']), 2))
+            for pair, pair_seed in zip(pairs, perm_seed.spawn(len(pairs))):
+                for size, seed_seq in zip(sizes, pair_seed.spawn(len(sizes))):
+                    tasks.append(('permutation', key, tuple(map(int, pair)), size, seed_seq, statistics))
+        chunks = list(run(_run_chunk, tasks))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Resamples of every comparison, in chunk order
+    resamples = {}
+    for task, chunk in zip(tasks, chunks):
+        for statistic, values in chunk.items():
+            resamples.setdefault((task[0], task[1], task[2], statistic), []).append(values)
+    resamples = {key: np.concatenate(values) for key, values in resamples.items()}
+
+    tail = (1 - ci) / 2
+    rows = []
+    for key, outcome, factor, strata, stratum, levels in comparisons:
+        counts, observed = summaries[key]['counts'], summaries[key]['observed']
+        note = None if summaries[key]['permutable'] else 'factor varies within clusters'
+        for a, b in combinations(range(len(counts)), 2):
+            if counts[a] == 0 or counts[b] == 0:
+                continue
+            for statistic in statistics:
+                estimate = observed[statistic][0, a] - observed[statistic][0, b]
+                boot = resamples[('bootstrap', key, None, statistic)]
+                boot = boot[:, a] - boot[:, b]
+                perm = resamples.get(('permutation', key, (a, b), statistic))
+                p_value = np.nan
+                if perm is not None:
+                    p_value = (1 + np.sum(np.abs(perm) >= np.abs(estimate) - 1e-12)) / (len(perm) + 1)
+                rows.append({
+                    'outcome': outcome, 'factor': factor, 'strata': strata, 'stratum': stratum,
+                    'cluster': cluster_name, 'term': f'{levels[a]} vs {levels[b]}',
+                    'statistic': statistic, 'n_a': int(counts[a]), 'n_b': int(counts[b]),
+                    'estimate': estimate,
+                    'ci_low': np.nanquantile(boot, tail), 'ci_high': np.nanquantile(boot, 1 - tail),
+                    'p_permutation': p_value, 'permutation_note': note, 'n_resamples': n_resamples,
+                })
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
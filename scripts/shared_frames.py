@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped, read-only copy of the analytic table for parallel workers.
+
+Process pools (group_stats.py, resampling.py) otherwise pickle the columns
+of every stratum to the workers: with a large table that costs the time of
+the serialization and a copy of the data in every worker. A ``SharedFrame``
+stores the columns once on local disk, one .npy file per column:
+- numeric, boolean and datetime columns as they are (nullable integers as
+  float64 with NaN),
+- categorical columns as their codes (int8 / int16 / int32) with the
+  categories, string / object columns as the codes of ``pd.factorize(sort=True)``
+  with the sorted values,
+- the index of the table, to find the rows of subsets (``rows``).
+Workers open the files with ``np.load(mmap_mode='r')``: the pages are shared
+through the OS page cache, nothing is copied until a worker indexes them.
+Pickling a SharedFrame only pickles its directory, so a task only carries
+row positions.
+
+``values`` and ``factor`` read the rows of a subset as the engines read
+DataFrame columns (``to_numpy(dtype=float)``, ``pd.factorize(sort=True)`` of
+the subset), so results do not depend on where the data comes from.
+
+Usage (from the repository root):
+    python scripts/shared_frames.py --output-dir cleaned_data/shared
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analytic_table import ANALYTIC_PATH
+from match_cache import file_fingerprint
+
+SHARED_DIR = os.path.join('cleaned_data', 'shared')
+META = 'meta.json'
+
+
+def _code_dtype(n_levels):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_levels < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _encode(series):
+    """Array and metadata of one column."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        levels = dtype.categories
+        codes = series.cat.codes.to_numpy()
+        return codes.astype(_code_dtype(len(levels))), {
+            'kind': 'category', 'levels': levels.tolist(), 'ordered': bool(dtype.ordered)
+        }
+    if dtype == object or isinstance(dtype, pd.StringDtype):
+        codes, levels = pd.factorize(series, sort=True)
+        return codes.astype(_code_dtype(len(levels))), {
+            'kind': 'factor', 'levels': list(levels), 'dtype': str(dtype)
+        }
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        # Nullable integers / floats / booleans
+        return series.to_numpy(dtype=np.float64, na_value=np.nan), {'kind': 'values', 'dtype': str(dtype)}
+    values = series.to_numpy()
+    if values.dtype == object:
+        raise TypeError(f"Column '{series.name}' of dtype {dtype} cannot be shared")
+    return values, {'kind': 'values', 'dtype': str(dtype)}
+
+
+class SharedFrame:
+    """
+    Columns of a table stored as .npy files in ``directory``, opened as
+    read-only memory maps (see the module docstring).
+    """
+
+    def __init__(self, directory=SHARED_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, META), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.columns = list(self.meta['columns'])
+        self._arrays = {}
+        self._index = None
+
+    # --- Creation ---
+    @classmethod
+    def create(cls, df, directory=SHARED_DIR, columns=None, source=None):
+        """
+        Store the ``columns`` of ``df`` (all by default) in ``directory``,
+        replacing its content. ``source`` is recorded for ``from_table``.
+        """
+        columns = list(df.columns if columns is None else columns)
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        # Written next to the target and swapped in at the end
+        staging = tempfile.mkdtemp(dir=parent, prefix='.shared-')
+        try:
+            meta = {'rows': len(df), 'source': source, 'columns': {}}
+            np.save(os.path.join(staging, 'index.npy'), df.index.to_numpy())
+            for i, column in enumerate(columns):
+                values, info = _encode(df[column])
+                info['file'] = f'{i}.npy'
+                np.save(os.path.join(staging, info['file']), values)
+                meta['columns'][column] = info
+            with open(os.path.join(staging, META), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=1)
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.replace(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return cls(directory)
+
+    @classmethod
+    def from_table(cls, path=ANALYTIC_PATH, directory=SHARED_DIR, columns=None):
+        """
+        SharedFrame of a Parquet table (the analytic table by default),
+        reused while the file and the requested columns are unchanged.
+        """
+        source = {'path': os.path.normpath(path), 'fingerprint': file_fingerprint(path),
+                  'columns': None if columns is None else list(columns)}
+        if os.path.exists(os.path.join(directory, META)):
+            shared = cls(directory)
+            if shared.meta['source'] == source:
+                return shared
+        df = pd.read_parquet(path, engine='pyarrow', columns=columns)
+        return cls.create(df, directory, source=source)
+
+    # --- Pickling: only the directory travels to the workers ---
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    # --- Access ---
+    def array(self, column):
+        """Memory-mapped array of a column (codes for categorical / string columns)."""
+        if column not in self._arrays:
+            info = self.meta['columns'].get(column)
+            if info is None:
+                raise KeyError(f"Column '{column}' is not in the shared frame {self.directory}")
+            self._arrays[column] = np.load(os.path.join(self.directory, info['file']), mmap_mode='r')
+        return self._arrays[column]
+
+    def index(self):
+        """Index of the shared table."""
+        if self._index is None:
+            self._index = pd.Index(np.load(os.path.join(self.directory, 'index.npy'), allow_pickle=True))
+        return self._index
+
+    def rows(self, df):
+        """
+        Positions in the shared table of the rows of ``df`` (a subset of the
+        table the frame was created from, with its index).
+        """
+        index = self.index()
+        if not index.is_unique:
+            raise ValueError("The index of the shared table is not unique")
+        positions = index.get_indexer(df.index)
+        if (positions < 0).any():
+            raise KeyError(f"{int((positions < 0).sum())} rows are not in the shared frame {self.directory}")
+        return positions
+
+    def values(self, column, rows):
+        """Float values of a numeric column at ``rows`` (as ``to_numpy(dtype=float)``)."""
+        info = self.meta['columns'][column]
+        if info['kind'] != 'values':
+            raise TypeError(f"Column '{column}' is not numeric")
+        return np.asarray(self.array(column)[rows], dtype=float)
+
+    def factor_levels(self, column, rows):
+        """
+        Levels of a column present at ``rows``, in the order of
+        ``pd.factorize(sort=True)`` (stored codes for categorical / string
+        columns, values otherwise).
+        """
+        values = self.array(column)[rows]
+        if self.meta['columns'][column]['kind'] == 'values':
+            return np.unique(values[~pd.isna(values)])
+        return np.unique(values[values >= 0])
+
+    def factor(self, column, rows, present=None):
+        """
+        Codes and levels of a column at ``rows``, as ``pd.factorize(sort=True)``
+        of those rows (missing values coded -1). With ``present``, the
+        ``factor_levels`` of a superset of the rows, the codes are those of
+        the factorized superset, e.g. of a table sliced by stratum.
+        """
+        if present is None:
+            present = self.factor_levels(column, rows)
+        info = self.meta['columns'][column]
+        values = self.array(column)[rows]
+        missing = pd.isna(values) if info['kind'] == 'values' else values < 0
+        codes = np.where(missing, -1, np.searchsorted(present, values))
+        if info['kind'] == 'values':
+            return codes, np.asarray(present, dtype=object)
+        return codes, np.asarray(info['levels'], dtype=object)[present]
+
+    def take(self, rows, columns=None):
+        """DataFrame of ``rows`` (positions) and ``columns``, with the original dtypes."""
+        data = {}
+        for column in self.columns if columns is None else columns:
+            info = self.meta['columns'][column]
+            values = np.asarray(self.array(column)[rows])
+            if info['kind'] == 'category':
+                data[column] = pd.Categorical.from_codes(
+                    values, categories=info['levels'], ordered=info['ordered']
+                )
+            elif info['kind'] == 'factor':
+                levels = np.asarray(info['levels'] + [np.nan], dtype=object)
+                data[column] = pd.array(levels[values], dtype=object).astype(info['dtype'])
+            else:
+                data[column] = pd.array(values).astype(info['dtype'])
+        return pd.DataFrame(data, index=self.index()[rows])
+
+    def nbytes(self):
+        """Size of the stored columns in bytes."""
+        return sum(os.path.getsize(os.path.join(self.directory, info['file']))
+                   for info in self.meta['columns'].values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--table', default=ANALYTIC_PATH)
+    parser.add_argument('--output-dir', default=SHARED_DIR)
+    parser.add_argument('--columns', nargs='+', default=None)
+    args = parser.parse_args()
+
+    shared = SharedFrame.from_table(args.table, args.output_dir, args.columns)
+    print(f"{shared.directory}: {shared.meta['rows']} rows, {len(shared.columns)} columns, "
+          f"{shared.nbytes() / 2**20:.1f} MiB")
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental stage runner: a DAG of pipeline stages that only recomputes what
+changed.
+
+A ``Stage`` declares what it depends on and what it produces:
+- ``inputs``: artifacts, i.e. named outputs of other stages, passed to the
+  stage function as keyword arguments,
+- ``files``: files it reads (raw data, manual review spreadsheets, or files
+  written by other stages),
+- ``outputs``: names of the artifacts it returns (the function returns a
+  dict {name: value}); they are pickled to <cache_dir>/<name>.pkl,
+- ``writes``: files it writes,
+- ``code``: functions, classes, modules or constants whose source / value it
+  depends on (the stage function itself always counts), and ``params``. A
+  module counts with its whole file but not with the modules it imports,
+  so list the modules of the helpers a stage calls, not only the helpers.
+
+The fingerprint of a stage is a hash of its code, params and the content
+hashes of its input artifacts and files (SHA-256). DataFrames and Series are
+hashed by their values (``pd.util.hash_pandas_object``), columns and dtypes,
+other artifacts by their pickle, whose bytes can differ for equal frames
+(e.g. after a copy or a merge). A stage whose fingerprint
+matches the last run, and whose outputs are still on disk, is skipped;
+downstream stages load its cached outputs, and only when they run
+themselves. A stage that reruns but produces the same outputs does not
+invalidate the stages after it (its output hashes are unchanged).
+
+File hashes are reused while a file's size and modification time are
+unchanged, so large inputs are not hashed again on every run. The state of
+all stages is kept in <cache_dir>/manifest.json.
+"""
+
+import fnmatch
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from match_cache import file_fingerprint
+
+CACHE_DIR = os.path.join('cleaned_data', 'stages')
+
+
+def _source(obj):
+    """Source of a function / class / module (file content), repr of anything else."""
+    if inspect.ismodule(obj):
+        with open(obj.__file__, 'rb') as f:
+            return f.read().decode('utf-8', errors='replace')
+    if inspect.isfunction(obj) or inspect.isclass(obj) or inspect.ismethod(obj):
+        return inspect.getsource(obj)
+    return repr(obj)
+
+
+def _hash_default(value):
+    return repr(value)
+
+
+def artifact_hash(value):
+    """Content hash of an artifact (see the module docstring)."""
+    digest = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            hashes = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        except TypeError:   # unhashable values, e.g. lists
+            hashes = None
+        if hashes is not None:
+            if isinstance(value, pd.DataFrame):
+                layout = [type(value).__name__, list(map(str, value.columns)), list(map(str, value.dtypes))]
+            else:
+                layout = [type(value).__name__, str(value.name), str(value.dtype)]
+            layout.append(str(value.index.dtype))
+            digest.update(json.dumps(layout).encode('utf-8'))
+            digest.update(hashes.tobytes())
+            return digest.hexdigest()
+    digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+class Stage:
+    """One step of the DAG, see the module docstring."""
+
+    def __init__(self, name, func, inputs=(), files=(), outputs=(), writes=(), code=(), params=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.files = list(files)
+        self.outputs = list(outputs)
+        self.writes = list(writes)
+        self.code = list(code)
+        self.params = dict(params or {})
+
+    def code_hash(self):
+        digest = hashlib.sha256()
+        for obj in [self.func, *self.code]:
+            digest.update(_source(obj).encode('utf-8'))
+        return digest.hexdigest()
+
+    def __repr__(self):
+        return f'Stage({self.name!r})'
+
+
+class StageRunner:
+    """Stages of one pipeline, with their cached outputs in ``cache_dir``."""
+
+    def __init__(self, stages, cache_dir=CACHE_DIR):
+        self.stages = {}
+        self.producers = {}   # artifact name / written file -> stage name
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage '{stage.name}'")
+            self.stages[stage.name] = stage
+            for product in stage.outputs + [os.path.normpath(p) for p in stage.writes]:
+                if product in self.producers:
+                    raise ValueError(f"'{product}' is produced by both "
+                                     f"'{self.producers[product]}' and '{stage.name}'")
+                self.producers[product] = stage.name
+        for stage in stages:
+            unknown = [name for name in stage.inputs if name not in self.producers]
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' needs unknown artifacts: {unknown}")
+
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.manifest = {'stages': {}, 'files': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self._loaded = {}
+
+    # --- Graph ---
+    def upstream(self, name):
+        """Names of the stages that ``name`` directly depends on."""
+        stage = self.stages[name]
+        products = stage.inputs + [os.path.normpath(p) for p in stage.files]
+        return list(dict.fromkeys(self.producers[p] for p in products if p in self.producers))
+
+    def order(self, targets=None):
+        """Stages needed for ``targets`` (names or patterns, all if None), upstream first."""
+        if targets is None:
+            wanted = list(self.stages)
+        else:
+            wanted = []
+            for target in targets:
+                matches = fnmatch.filter(self.stages, target)
+                if not matches:
+                    raise ValueError(f"No stage matches '{target}'")
+                wanted += matches
+
+        ordered, visiting = [], set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle through stage '{name}'")
+            visiting.add(name)
+            for dependency in self.upstream(name):
+                visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in wanted:
+            visit(name)
+        return ordered
+
+    # --- Hashes ---
+    def file_hash(self, path):
+        """Content hash of a file (None if missing), reused while size and mtime are unchanged."""
+        path = os.path.normpath(path)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        known = self.manifest['files'].get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = file_fingerprint(path)
+        self.manifest['files'][path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def fingerprint(self, stage, artifact_hashes):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([
+            stage.name,
+            stage.code_hash(),
+            stage.params,
+            {name: artifact_hashes.get(name) for name in stage.inputs},
+            {os.path.normpath(p): self.file_hash(p) for p in stage.files},
+        ], sort_keys=True, default=_hash_default).encode())
+        return digest.hexdigest()
+
+    # --- Artifacts ---
+    def artifact_path(self, name):
+        return os.path.join(self.cache_dir, f'{name}.pkl')
+
+    def load(self, name):
+        """Value of an artifact (from this run or the cache)."""
+        if name not in self._loaded:
+            with open(self.artifact_path(name), 'rb') as f:
+                self._loaded[name] = pickle.load(f)
+        return self._loaded[name]
+
+    def _store(self, name, value):
+        with open(self.artifact_path(name), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._loaded[name] = value
+        return artifact_hash(value)
+
+    def _is_current(self, stage, fingerprint):
+        state = self.manifest['stages'].get(stage.name)
+        if state is None or state['fingerprint'] != fingerprint:
+            return False
+        if not all(os.path.exists(self.artifact_path(name)) for name in stage.outputs):
+            return False
+        # Written files must still be the ones this stage wrote
+        return all(self.file_hash(path) == digest for path, digest in state['writes'].items())
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+
+    # --- Runs ---
+    def run(self, targets=None, force=(), verbose=True):
+        """
+        Bring ``targets`` (stage names or patterns such as 'figure:*', all
+        stages if None) up to date. Stages matching a pattern of ``force``
+        are rerun even if nothing changed. Returns a report with the status
+        ('cached' / 'ran') and run time of every stage.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        artifact_hashes, report = {}, []
+        try:
+            for name in self.order(targets):
+                stage = self.stages[name]
+                fingerprint = self.fingerprint(stage, artifact_hashes)
+                forced = any(fnmatch.fnmatch(name, pattern) for pattern in force)
+
+                if not forced and self._is_current(stage, fingerprint):
+                    state = self.manifest['stages'][name]
+                    artifact_hashes.update(state['outputs'])
+                    report.append({'stage': name, 'status': 'cached', 'seconds': 0.0})
+                    if verbose:
+                        print(f'{name:<34} cached')
+                    continue
+
+                start = time.perf_counter()
+                values = stage.func(**{n: self.load(n) for n in stage.inputs}, **stage.params) or {}
+                missing = [n for n in stage.outputs if n not in values]
+                if missing:
+                    raise ValueError(f"Stage '{name}' did not return {missing}")
+                seconds = time.perf_counter() - start
+
+                outputs = {n: self._store(n, values[n]) for n in stage.outputs}
+                artifact_hashes.update(outputs)
+                self.manifest['stages'][name] = {
+                    'fingerprint': fingerprint,
+                    'outputs': outputs,
+                    'writes': {os.path.normpath(p): self.file_hash(p) for p in stage.writes},
+                    'seconds': seconds,
+                    'finished': datetime.now().isoformat(timespec='seconds'),
+                }
+                self._save_manifest()
+                report.append({'stage': name, 'status': 'ran', 'seconds': seconds})
+                if verbose:
+                    print(f'{name:<34} ran in {seconds:.2f} s', flush=True)
+        finally:
+            self._save_manifest()
+        return pd.DataFrame(report, columns=['stage', 'status', 'seconds'])
+
+    def status(self, targets=None):
+        """Whether every stage of ``targets`` is up to date, without running anything."""
+        artifact_hashes, rows = {}, []
+        for name in self.order(targets):
+            stage = self.stages[name]
+            fingerprint = self.fingerprint(stage, artifact_hashes)
+            current = self._is_current(stage, fingerprint)
+            state = self.manifest['stages'].get(name)
+            if current:
+                artifact_hashes.update(state['outputs'])
+            rows.append({
+                'stage': name,
+                'up_to_date': current,
+                'last_run': state['finished'] if state else None,
+                'last_seconds': state['seconds'] if state else None,
+            })
+        self._save_manifest()
+        return pd.DataFrame(rows, columns=['stage', 'up_to_date', 'last_run', 'last_seconds'])
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Typed columnar storage of the cleaned tables (Parquet, via pyarrow).
+
+00_load_and_clean.py writes the cleaned tables with ``write_table`` and the
+later stages read them back with ``read_table``. Compared to the former
+pipe-delimited CSVs
+- dtypes survive the round trip (categoricals, datetimes, float32 counts),
+- every stage reads only the columns it needs,
+- there is no text parsing at startup.
+
+DOIs and authors also carry dense int32 keys (doi_key, author_key, see
+keys.py) for the joins of the later stages.
+
+The explicit schemas below fix the dtype of the known columns; columns that
+are not listed keep the dtype they have in the DataFrame. Tables that are
+cleaned in chunks are written with ``ChunkedTableWriter``.
+"""
+
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+CLEANED_DIR = 'cleaned_data'
+
+# Altmetric mention counts (stored as float32, NaN was already filled with 0)
+ALTMETRIC_COUNT_COLS = [
+    'linkedin', 'misc', 'facebook', 'googleplus', 'video', 'weibo', 'twitter', 'wikipedia',
+    'blogs', 'news', 'reddit', 'policy', 'patent', 'qa', 'pinterest', 'syllabi', 'f1000',
+    'book_reviews', 'peer_reviews', 'stot'
+]
+
+# === Schemas ===
+SCHEMAS = {
+    'author_clean': {
+        'author': 'string',
+        'author_key': 'int32',
+        # Nullable: the author aggregates may be missing (not essential, see validation.py)
+        'works_count': 'Int64',
+        'cited_by_count': 'Int64',
+    },
+    'data_2019_clean': {
+        'altmetric_id': 'int64',
+        'doi': 'string',
+        'doi_key': 'int32',
+        'pubdate': 'datetime64[ns]',
+        'code': 'category',
+        **{col: 'float32' for col in ALTMETRIC_COUNT_COLS},
+    },
+    'institution_2019_clean': {
+        'doi': 'string',
+        'doi_key': 'int32',
+        'author': 'string',
+        'author_key': 'int32',
+        'institutions': 'string',
+        'display_name': 'string',
+        'country_code': 'category',
+        'type': 'category',
+    },
+    'ranked_institution': {
+        'doi': 'string',
+        'author': 'string',
+        'display_name_clean': 'string',
+        'country_code': 'category',
+        'type': 'category',
+        'final_rank': 'string',
+        'rank_flag': 'int8',
+    },
+    'ranking_clean': {
+        'rank': 'string',
+        'name': 'string',
+        'stats_number_students': 'float64',
+        'stats_pc_intl_students': 'float64',
+        'female_pct': 'float64',
+        'male_pct': 'float64',
+        'rank_clean': 'float64',
+    },
+    # Surrogate key dictionaries (keys.py)
+    'doi_keys': {
+        'doi_key': 'int32',
+        'doi': 'string',
+    },
+    'author_keys': {
+        'author_key': 'int32',
+        'author': 'string',
+    },
+}
+
+
+def table_path(name, directory=CLEANED_DIR):
+    return os.path.join(directory, f'{name}.parquet')
+
+
+def apply_schema(df, name):
+    """
+    Cast the columns of ``df`` to the schema of table ``name``.
+    Raises ValueError if a column of the schema is missing, or if a
+    non-nullable integer column (int8 / int32 / int64, unlike Int64) has
+    missing values.
+    """
+    schema = SCHEMAS.get(name, {})
+    missing = [col for col in schema if col not in df.columns]
+    if missing:
+        raise ValueError(f"Table '{name}' is missing schema columns: {missing}")
+
+    integer = [col for col, dtype in schema.items() if dtype.startswith('int')]
+    nulls = df[integer].isna().sum()
+    nulls = nulls[nulls > 0]
+    if len(nulls):
+        raise ValueError(f"Table '{name}' has missing values in integer columns: "
+                         f"{', '.join(f'{col} ({n} rows)' for col, n in nulls.items())}")
+
+    df = df.copy()
+    for col, dtype in schema.items():
+        if dtype == 'string':
+            # Keep missing values as NaN (plain object column), like read_csv
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str)).astype(object)
+        elif dtype.startswith('datetime'):
+            df[col] = pd.to_datetime(df[col], errors='coerce').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def write_table(df, name, directory=CLEANED_DIR, schema=None):
+    """
+    Write a cleaned table as typed Parquet and return its path.
+    ``schema`` names the schema to apply if it differs from the table name
+    (e.g. 'data_2019_clean' for another publication year).
+    """
+    path = table_path(name, directory)
+    apply_schema(df, schema or name).to_parquet(path, engine='pyarrow', index=False)
+    return path
+
+
+def read_table(name, columns=None, directory=CLEANED_DIR):
+    """Read a cleaned table, optionally only the given columns."""
+    return pd.read_parquet(table_path(name, directory), engine='pyarrow', columns=columns)
+
+
+# === Chunked writing ===
+def _unify_types(types):
+    """Common Arrow type of one column over all chunks (pandas-like promotion)."""
+    types = [t for t in types if not pa.types.is_null(t)]
+    if not types:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        # An integer column with missing values in some chunk is float, as in read_csv
+        return pa.float64()
+    if all(pa.types.is_dictionary(t) for t in types):
+        return pa.dictionary(pa.int32(), pa.string())
+    if all(pa.types.is_timestamp(t) for t in types):
+        return types[0]
+    return pa.string()
+
+
+class ChunkedTableWriter:
+    """
+    Write a cleaned table chunk by chunk, with bounded memory.
+
+    Every chunk is cast to the table schema and written as a part file.
+    ``close()`` unifies the column types of all parts (chunks of a CSV do not
+    always infer the same dtypes), re-encodes the categorical columns against
+    the sorted union of their categories and streams the parts into the final
+    Parquet file, one part at a time.
+    """
+
+    def __init__(self, name, directory=CLEANED_DIR, schema=None):
+        self.name = name
+        self.schema = schema or name
+        self.path = table_path(name, directory)
+        self.parts_dir = tempfile.mkdtemp(prefix=f'{name}_parts_', dir=directory)
+        self.parts = []
+        self.rows = 0
+
+    def write(self, df):
+        if df.empty:
+            return
+        part = os.path.join(self.parts_dir, f'part_{len(self.parts):05d}.parquet')
+        apply_schema(df, self.schema).to_parquet(part, engine='pyarrow', index=False)
+        self.parts.append(part)
+        self.rows += len(df)
+
+    def close(self):
+        """Write the final table and remove the part files; returns its path."""
+        try:
+            schemas = [pq.read_schema(part) for part in self.parts]
+            if not schemas:
+                raise ValueError(f"No rows were written to table '{self.name}'")
+            fields = [
+                pa.field(field.name, _unify_types([s.field(field.name).type for s in schemas]))
+                for field in schemas[0]
+            ]
+            # Categorical columns share the sorted union of the part dictionaries,
+            # as astype('category') of the whole column
+            categories = {
+                field.name: self._categories(field.name, field.type.value_type)
+                for field in fields if pa.types.is_dictionary(field.type)
+            }
+            fields = [
+                pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type)) if f.name in categories else f
+                for f in fields
+            ]
+            schema = pa.schema(fields)
+            with pq.ParquetWriter(self.path, schema) as writer:
+                for part in self.parts:
+                    table = pq.read_table(part).select(schema.names)
+                    for name, values in categories.items():
+                        i = schema.get_field_index(name)
+                        table = table.set_column(i, name, _encode(table.column(name), values))
+                    writer.write_table(table.cast(schema))
+        finally:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+        return self.path
+
+    def _categories(self, column, value_type):
+        """Sorted distinct dictionary values of a column over all parts."""
+        values = set()
+        for part in self.parts:
+            for chunk in pq.read_table(part, columns=[column]).column(column).chunks:
+                if pa.types.is_dictionary(chunk.type):
+                    values.update(chunk.dictionary.to_pylist())
+                else:   # an all-missing column of some chunk
+                    values.update(v for v in chunk.to_pylist() if v is not None)
+        return pa.array(sorted(values), type=value_type)
+
+
+def _encode(column, values):
+    """Dictionary column re-encoded against the dictionary ``values``."""
+    dense = column.cast(values.type)
+    return pa.chunked_array(
+        [pa.DictionaryArray.from_arrays(pc.index_in(chunk, value_set=values), values)
+         for chunk in dense.chunks],
+        type=pa.dictionary(pa.int32(), values.type)
+    )
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded synthetic versions of the raw input tables, for benchmarks and for
+running the pipeline offline (the data/ files are not shipped).
+
+``synthetic_dataset(rows, seed)`` returns the four raw tables with the
+columns of the real exports (before normalize_column_names):
+- 'data': Altmetric publication rows (DOI, pubdate, code, the ALTMETRIC_COLS
+  counts with NaN for "no mention", citations, gender / ethnicity counts),
+- 'author': OpenAlex authors (works_count, cited_by_count),
+- 'ranking': the ranking table (Rank labels such as '=74', '201–250',
+  '1001+', student counts, 'Stats Female Male Ratio' such as '55 : 45'),
+- 'institution': author–institution affiliation rows of the publications.
+``rows`` is the number of affiliation rows; there are rows / 2 publications
+and rows / 3 authors.
+
+Affiliation display names are drawn with a Zipf-like popularity from a pool
+of distinct names: the ranking names as is and variants with the noise of
+the real exports (``NOISE`` gives the share of every kind):
+- language variants that normalization() maps to the same term
+  ('Universidad de X' for 'University of X'), or that change word order,
+- accents added or removed, case changes, dashes / commas / invisible
+  characters, parentheticals ('(Main Campus)'), department prefixes, typos,
+plus institutions that are not ranked (other universities, hospitals,
+companies). The pool grows with the rows (``names_per_row``) up to
+``max_names``, so the fuzzy matching load grows as on real data.
+``synthetic_names`` draws normalized choices and noisy queries the same way
+for the matcher benchmarks (institution_matching.py, candidate_index.py).
+
+Usage (from the repository root; writes data/ and empty manual_review/ files):
+    python scripts/synthetic_data.py --rows 100000 --out synthetic
+"""
+
+import argparse
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from cleaning import ALTMETRIC_COLS
+from name_normalization import InstitutionNameNormalizer
+
+# === Name noise ===
+# Templates that normalize to 'university <place>' (TERM_REPLACEMENTS, stopwords)
+UNIVERSITY_VARIANTS = [
+    'University of {}', 'Universidad de {}', 'Università di {}', 'Universidade de {}',
+    'Université de {}', 'Universität {}', 'Universiteit {}', 'Univerzita {}',
+]
+
+# Other ranked templates and their weights
+RANKED_TEMPLATES = {
+    'University of {}': 0.45,
+    '{} University': 0.15,
+    'Universidad de {}': 0.06,
+    'Universität {}': 0.06,
+    'Università di {}': 0.04,
+    'Université de {}': 0.04,
+    'Universidade de {}': 0.03,
+    'Universiteit {}': 0.02,
+    '{} Institute of Technology': 0.04,
+    'Instituto de {}': 0.02,
+    '{} College': 0.03,
+    'Technische Universität {}': 0.02,
+    '{} yliopisto': 0.01,
+    '{} Egyetem': 0.01,
+    '{} Üniversitesi': 0.01,
+    'École Polytechnique de {}': 0.01,
+}
+
+# Word order changes (no exact match after normalization)
+REORDERED = {
+    'University of {}': '{} University',
+    '{} University': 'University of {}',
+    '{} yliopisto': 'Yliopisto {}',
+    '{} Egyetem': 'Egyetem {}',
+}
+
+UNRANKED_TEMPLATES = [
+    'University of {}', '{} University', '{} General Hospital', '{} Medical Center',
+    '{} Research Center', 'Institute for {} Studies', '{} Pharmaceuticals', '{} State College',
+    'Hospital Universitario de {}', 'Klinikum {}', '{} National Laboratory', '{} Academy of Sciences',
+]
+
+# Share of every kind of pool name
+NOISE = {
+    'exact': 0.40,
+    'language_variant': 0.10,
+    'reordered': 0.03,
+    'case': 0.06,
+    'accents': 0.06,
+    'punctuation': 0.05,
+    'parenthetical': 0.05,
+    'department': 0.04,
+    'typo': 0.05,
+    'unranked': 0.16,
+}
+
+PARENTHETICALS = [
+    '(Main Campus)', '(UK)', '(USA)', '(Medical School)', '(CNRS)', '(Hospital)', '(Graduate School)',
+]
+DEPARTMENTS = [
+    'Department of Physics', 'Faculty of Medicine', 'School of Public Health',
+    'Department of Biology', 'Institute of Psychology', 'Faculty of Law',
+]
+ACCENTED = {'a': 'áàä', 'e': 'éèë', 'i': 'íì', 'o': 'óöô', 'u': 'úüù', 'n': 'ñ', 'c': 'ç', 's': 'š'}
+PLAIN = {accented: plain for plain, chars in ACCENTED.items() for accented in chars}
+SEPARATORS = ['-', ', ', ' – ', '​', ' ', ' / ']
+
+SYLLABLES = [
+    'ka', 'lo', 'mer', 'vin', 'dor', 'sa', 'tel', 'bru', 'an', 'os', 'ri', 'gel', 'mon', 'ta',
+    'ver', 'lin', 'ha', 'zu', 'pel', 'nor', 'ek', 'ba', 'stro', 'mi', 'fen', 'da', 'ro', 'lis',
+    'tar', 'vel', 'qui', 'sten', 'gor', 'ely', 'bach', 'wen', 'tor', 'cas', 'mun', 'ai',
+]
+
+ETHNICITIES = ['Western/Northern', 'Asian', 'Hispanic', 'African']
+INSTITUTION_TYPES = ['education', 'healthcare', 'facility', 'company', 'government', 'nonprofit', 'other']
+COUNTRIES = ['US', 'GB', 'DE', 'CN', 'FR', 'JP', 'IT', 'ES', 'CA', 'AU', 'NL', 'BR', 'HU', 'FI', 'TR']
+
+# Institution without display_name / country_code in OpenAlex (fix_known_institutions)
+UNNAMED_INSTITUTION = 'https://openalex.org/I4210154534'
+
+
+def place_names(rnd, n, taken=()):
+    """``n`` distinct made-up place names of 2–3 syllables."""
+    names, seen = [], set(taken)
+    while len(names) < n:
+        name = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.choice([2, 2, 3]))).capitalize()
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def add_noise(rnd, template, place, kind):
+    """One display name variant of a ranked name (``template`` filled with ``place``)."""
+    name = template.format(place)
+    if kind == 'language_variant' and template in UNIVERSITY_VARIANTS:
+        return rnd.choice([t for t in UNIVERSITY_VARIANTS if t != template]).format(place)
+    if kind == 'reordered' and template in REORDERED:
+        return REORDERED[template].format(place)
+    if kind == 'accents':
+        if any(ch in PLAIN for ch in name):
+            return ''.join(PLAIN.get(ch, ch) for ch in name)
+        positions = [i for i, ch in enumerate(name) if ch in ACCENTED]
+        for i in rnd.sample(positions, min(2, len(positions))):
+            name = name[:i] + rnd.choice(ACCENTED[name[i]]) + name[i + 1:]
+        return name
+    if kind == 'punctuation':
+        words = name.split(' ')
+        i = rnd.randrange(1, len(words)) if len(words) > 1 else 1
+        return ' '.join(words[:i]) + rnd.choice(SEPARATORS) + ' '.join(words[i:]) + rnd.choice(['', '.', ','])
+    if kind == 'parenthetical':
+        return f'{name} {rnd.choice(PARENTHETICALS)}'
+    if kind == 'department':
+        return f'{rnd.choice(DEPARTMENTS)}, {name}'
+    if kind == 'typo' and len(name) > 4:
+        i = rnd.randrange(1, len(name) - 1)
+        if rnd.random() < 0.5:
+            return name[:i] + name[i + 1:]
+        return name[:i - 1] + name[i] + name[i - 1] + name[i + 1:]
+    # 'case' and the kinds that do not apply to this template
+    return rnd.choice([name.upper(), name.lower(), name.title()])
+
+
+def ranked_names(rnd, n_ranked):
+    """Distinct ranked institutions as (template, place) pairs."""
+    templates = rnd.choices(list(RANKED_TEMPLATES), weights=list(RANKED_TEMPLATES.values()), k=n_ranked)
+    return list(zip(templates, place_names(rnd, n_ranked)))
+
+
+def name_pool(rnd, ranked, size):
+    """
+    Distinct display names: the ranked names as is, followed by ``size``
+    noisy variants and unranked institutions in the NOISE shares.
+    Returns the pool and the number of ranked names at its start.
+    """
+    pool = dict.fromkeys(template.format(place) for template, place in ranked)
+    n_exact = len(pool)
+    kinds = [kind for kind in NOISE if kind != 'exact']
+    weights = [NOISE[kind] for kind in kinds]
+    unranked_places = iter(place_names(rnd, size, taken=[place for _, place in ranked]))
+    attempts = 0
+    while len(pool) < n_exact + size and attempts < 20 * size:
+        attempts += 1
+        kind = rnd.choices(kinds, weights=weights)[0]
+        if kind == 'unranked':
+            pool[rnd.choice(UNRANKED_TEMPLATES).format(next(unranked_places))] = None
+        else:
+            template, place = rnd.choice(ranked)
+            pool[add_noise(rnd, template, place, kind)] = None
+    return np.array(list(pool), dtype=object), n_exact
+
+
+def synthetic_names(n_choices, n_queries, seed=0):
+    """
+    Synthetic choices and noisy queries for the matchers, both normalized:
+    choices are template x place names, queries are noisy variants of
+    choices and institutions that are not among them, without the names that
+    match a choice exactly. Returns the choices, the queries and the labels
+    {query: choice it is a variant of}.
+    """
+    rnd = random.Random(seed)
+    templates = list(dict.fromkeys(list(RANKED_TEMPLATES) + UNRANKED_TEMPLATES))
+    places = place_names(rnd, max(1, n_choices // 4))
+    pairs = [(templates[i % len(templates)], places[i // len(templates)])
+             for i in rnd.sample(range(len(templates) * len(places)), n_choices)]
+
+    kinds = [kind for kind in NOISE if kind != 'exact']
+    weights = [NOISE[kind] for kind in kinds]
+    unranked = iter(place_names(rnd, n_queries, taken=places))
+    normalizer = InstitutionNameNormalizer()
+    labels = {}
+    for _ in range(n_queries):
+        kind = rnd.choices(kinds, weights=weights)[0]
+        if kind == 'unranked':
+            labels.setdefault(normalizer(rnd.choice(UNRANKED_TEMPLATES).format(next(unranked))), None)
+        else:
+            template, place = rnd.choice(pairs)
+            labels.setdefault(normalizer(add_noise(rnd, template, place, kind)),
+                              normalizer(template.format(place)))
+
+    choices = list(dict.fromkeys(normalizer(template.format(place)) for template, place in pairs))
+    exact = set(choices)
+    queries = [q for q in labels if q not in exact]
+    return choices, queries, {q: labels[q] for q in queries}
+
+
+# === Tables ===
+def ranking_table(rnd, ranked):
+    """Raw ranking table of the ranked names, in rank order."""
+    n = len(ranked)
+    labels = []
+    for i in range(n):
+        position = i + 1
+        if position <= 200:
+            labels.append(f'={position}' if rnd.random() < 0.15 else str(position))
+        elif position <= 400:
+            low = (position - 1) // 50 * 50 + 1
+            labels.append(f'{low}–{low + 49}')
+        elif position <= 1000:
+            low = (position - 1) // 100 * 100 + 1
+            labels.append(f'{low}–{low + 99}' if position <= 600 else
+                          ('601–800' if position <= 800 else '801–1000'))
+        else:
+            labels.append('1001+')
+    return pd.DataFrame({
+        'Unnamed: 0': range(n),
+        'Rank': labels,
+        'Name': [template.format(place) for template, place in ranked],
+        'Stats Number Students': [f'{rnd.randint(800, 80000):,}' for _ in range(n)],
+        'Stats PC Intl Students': [rnd.choice([f'{rnd.randint(0, 45)}%', '', ' 12% ']) for _ in range(n)],
+        'Stats Female Male Ratio': [
+            rnd.choice([f'{f} : {100 - f}' for f in (35, 42, 50, 55, 61)] + ['n/a', None])
+            for _ in range(n)
+        ],
+    })
+
+
+def publication_table(rng, n):
+    """Raw Altmetric publication rows."""
+    suffixes = rng.integers(0, 10 ** 9, n)
+    prefixes = rng.integers(1000, 9999, n)
+    doi = np.array([f'10.{p}/J.{s:09d}.{i}' for i, (p, s) in enumerate(zip(prefixes, suffixes))],
+                   dtype=object)
+    # A few DOIs with stray whitespace and mixed case, as in the export
+    messy = rng.random(n) < 0.02
+    doi[messy] = [' ' + d.upper() for d in doi[messy]]
+
+    days = rng.integers(0, 365, n)
+    pubdate = (np.datetime64('2019-01-01') + days).astype(str).astype(object)
+    pubdate[rng.random(n) < 0.002] = None
+
+    data = {
+        'altmetric_id': np.arange(n) + 10 ** 7,
+        'doi': doi,
+        'pubdate': pubdate,
+        'code': rng.choice(np.array(['A', 'B', 'C', None], dtype=object), n, p=[0.4, 0.3, 0.2, 0.1]),
+        'pub_year': 2019,
+    }
+    citations = rng.negative_binomial(0.8, 0.05, n)
+    data['all_citaitons'] = citations
+    data['cit_log'] = np.log1p(citations)
+    data['female'] = rng.poisson(1.2, n)
+    data['male'] = rng.poisson(1.8, n)
+    data['unisex'] = rng.poisson(0.2, n)
+    data['ethnicity_majority'] = rng.choice(np.array(ETHNICITIES, dtype=object), n, p=[0.5, 0.3, 0.12, 0.08])
+
+    # Heavy-tailed mention counts, most platforms are mostly zero (NaN = no mention)
+    platforms = [col for col in ALTMETRIC_COLS if not col.startswith('stot')]
+    means = {'twitter': 8.0, 'facebook': 0.6, 'news': 0.5, 'blogs': 0.3, 'wikipedia': 0.1, 'reddit': 0.1}
+    stot = np.zeros(n)
+    for col in platforms:
+        mean = means.get(col, 0.02)
+        counts = rng.negative_binomial(0.3, 0.3 / (0.3 + mean), n).astype(float)
+        stot += counts
+        counts[(counts == 0) & (rng.random(n) < 0.6)] = np.nan
+        data[col] = counts
+    data['stot'] = stot
+    data['stot_log'] = np.log(stot + 1)
+    data['stot_log_stand'] = (data['stot_log'] - data['stot_log'].mean()) / data['stot_log'].std()
+    data['stot_log_jb_stand'] = data['stot_log_stand']
+    return pd.DataFrame(data)
+
+
+def author_table(rng, n):
+    """Raw OpenAlex author rows (a few authors are duplicated)."""
+    authors = np.array([f'https://openalex.org/A{i}' for i in range(n)], dtype=object)
+    duplicated = rng.choice(n, max(1, n // 200), replace=False)
+    authors = np.concatenate([authors, authors[duplicated]])
+    return pd.DataFrame({
+        'author': authors,
+        'last_known_institution': np.nan,
+        'works_count': rng.negative_binomial(1, 0.02, len(authors)) + 1,
+        'cited_by_count': rng.negative_binomial(0.7, 0.0005, len(authors)),
+    })
+
+
+def _zipf_choice(rng, n_items, size):
+    """``size`` draws from ``n_items`` items with Zipf-like popularity (random item order)."""
+    popularity = 1 / np.arange(1, n_items + 1) ** 0.9
+    order = rng.permutation(n_items)
+    return order[rng.choice(n_items, size, p=popularity / popularity.sum())]
+
+
+def institution_table(rng, n, publications, authors, pool, n_exact):
+    """
+    Raw author–institution affiliation rows of the publications; a NOISE['exact']
+    share of the rows carries a ranked name as is.
+    """
+    n_pub = len(publications)
+    parent_id = np.sort(rng.integers(0, n_pub, n))
+    doi = ('https://doi.org/' + publications['doi'].str.strip().str.lower()).to_numpy()[parent_id]
+    # Affiliations of publications from other years
+    other = rng.random(n) < 0.02
+    doi[other] = [f'https://doi.org/10.9999/other.{i}' for i in np.flatnonzero(other)]
+
+    exact = rng.random(n) < NOISE['exact']
+    name_index = np.where(
+        exact,
+        _zipf_choice(rng, n_exact, n),
+        n_exact + _zipf_choice(rng, len(pool) - n_exact, n)
+    )
+
+    df = pd.DataFrame({
+        'parent_id': parent_id,
+        'doi': doi,
+        'author': authors[rng.integers(0, len(authors), n)],
+        'author_position': 0,
+        'institutions': np.char.add('https://openalex.org/I', name_index.astype(str)).astype(object),
+        'ror': np.where(rng.random(n) < 0.7,
+                        np.char.add('https://ror.org/0', name_index.astype(str)), None),
+        'display_name': pool[name_index],
+        'country_code': rng.choice(np.array(COUNTRIES, dtype=object), n),
+        'type': rng.choice(np.array(INSTITUTION_TYPES, dtype=object), n,
+                           p=[0.6, 0.15, 0.08, 0.07, 0.04, 0.04, 0.02]),
+        'homepage_url': None,
+        'raw_affiliation_string': np.nan,
+    })
+    df['author_position'] = df.groupby('parent_id').cumcount()
+
+    unnamed = rng.random(n) < 0.001
+    df.loc[unnamed, ['institutions', 'display_name', 'country_code']] = [UNNAMED_INSTITUTION, None, None]
+
+    # A few exact duplicate rows, as in the merged export
+    duplicates = df.sample(frac=0.002, random_state=int(rng.integers(2 ** 31)))
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+def synthetic_dataset(rows, seed=0, n_ranked=1500, names_per_row=0.05, max_names=200_000):
+    """The four raw tables for ``rows`` affiliation rows: {'data', 'author', 'ranking', 'institution'}."""
+    rnd = random.Random(seed)
+    rng = np.random.default_rng(seed)
+
+    ranked = ranked_names(rnd, n_ranked)
+    pool, n_exact = name_pool(rnd, ranked, max(n_ranked, min(int(rows * names_per_row), max_names)))
+    publications = publication_table(rng, max(1, rows // 2))
+    authors = author_table(rng, max(1, rows // 3))
+    return {
+        'data': publications,
+        'author': authors,
+        'ranking': ranking_table(rnd, ranked),
+        'institution': institution_table(
+            rng, rows, publications, authors['author'].to_numpy(), pool, n_exact
+        ),
+    }
+
+
+def write_dataset(tables, root):
+    """Write the tables as the raw input files of 00 / 01 under ``root``."""
+    for folder in ['data', 'cleaned_data', 'manual_review']:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    tables['data'].to_csv(os.path.join(root, 'data', 'data_2019.csv'), index=False)
+    tables['author'].to_csv(os.path.join(root, 'data', 'merged_author_data.csv'), index=False)
+    tables['ranking'].to_csv(os.path.join(root, 'data', '2019_rankings.csv'), index=False)
+    tables['institution'].to_csv(os.path.join(root, 'data', 'merged_institutions_data.csv'), index=False)
+
+    # Empty manual review files, so 01 runs without a review round
+    reviews = {
+        'fuzzy_manual_checked.xlsx': ['display_name_clean', 'fuzzy_matched_name', 'fuzzy_rank', 'keep'],
+        'unmatched_ranked_paired.xlsx': ['display_name_clean', 'manual_rank'],
+    }
+    for name, columns in reviews.items():
+        path = os.path.join(root, 'manual_review', name)
+        if not os.path.exists(path):
+            pd.DataFrame(columns=columns).to_excel(path, index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic raw dataset.')
+    parser.add_argument('--rows', type=int, default=100_000, help='affiliation rows')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='synthetic')
+    args = parser.parse_args()
+
+    tables = synthetic_dataset(args.rows, args.seed)
+    write_dataset(tables, args.out)
+    for name, df in tables.items():
+        print(f'{name}: {len(df)} rows')
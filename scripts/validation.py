@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Declared checks of the cleaned tables, run as vectorized column operations.
+
+Every table has
+- the dtypes of its schema in storage.py, checked by kind (integer, numeric,
+  label = string / categorical, datetime), so the frames can be checked
+  before and after ``write_table``,
+- the checks of ``RULES``: non-null columns, unique keys (None: whole rows),
+  DOI format, value ranges (missing values are not checked) and columns
+  that must sum to a total (rows where one of them is missing are skipped).
+
+``validate`` runs all checks of one frame and returns one row per check:
+the number of rows that fail it and the first failing value. Nothing is
+printed; ``check_tables`` collects the reports of several frames and raises
+if ``strict``.
+
+Usage (from the repository root):
+    python scripts/validation.py --strict
+checks the tables in cleaned_data/ and writes the report to
+results/validation/.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from analytic_table import ANALYTIC_PATH, RANKED_PATH
+from storage import ALTMETRIC_COUNT_COLS, SCHEMAS, read_table
+
+RESULT_DIR = os.path.join('results', 'validation')
+
+DOI_PATTERN = r'10\.\d{4,9}/\S+'
+
+REPORT_COLUMNS = ['table', 'check', 'columns', 'rule', 'rows', 'failed', 'example', 'ok']
+
+RULES = {
+    'author_clean': {
+        'not_null': ['author'],
+        'range': {'works_count': (0, None), 'cited_by_count': (0, None), 'author_key': (0, None)},
+    },
+    'data_2019_clean': {
+        # Essential columns of every publication
+        'not_null': ['altmetric_id', 'doi', 'pubdate', 'code'],
+        'unique': [['altmetric_id']],
+        'pattern': {'doi': DOI_PATTERN},
+        'range': {**{col: (0, None) for col in ALTMETRIC_COUNT_COLS}, 'doi_key': (0, None)},
+    },
+    'institution_2019_clean': {
+        'not_null': ['doi', 'author', 'institutions'],
+        'unique': [None],
+        'pattern': {'doi': DOI_PATTERN},
+    },
+    'ranking_clean': {
+        'not_null': ['name', 'rank'],
+        'range': {
+            'rank_clean': (1, None), 'stats_number_students': (0, None),
+            'stats_pc_intl_students': (0, 100), 'female_pct': (0, 100), 'male_pct': (0, 100),
+        },
+        'sum': [(['female_pct', 'male_pct'], 100)],
+    },
+    # Rows of 01 before the analytic merge: one per affiliation of an author
+    # (position) on a publication
+    'ranked_institution': {
+        'unique': [['doi', 'author', 'author_position', 'institutions']],
+        'pattern': {'doi': DOI_PATTERN},
+        'range': {'rank_flag': (0, 1)},
+    },
+    # df_merged_all of the 02 notebook. The merges are many-to-many by design
+    # (a DOI / author can have several publication / author rows), so it has
+    # no key: uniqueness is checked on ranked_institution
+    'analytic_table': {
+        'not_null': ['pubdate'],
+        'range': {'final_rank_numeric': (1, None), 'stot_log1p': (0, None)},
+    },
+}
+
+
+# === Checks ===
+def dtype_kind(dtype):
+    """Kind of a schema dtype: 'integer', 'numeric', 'label' or 'datetime'."""
+    if dtype in ('string', 'category'):
+        return 'label'
+    if dtype.startswith('datetime'):
+        return 'datetime'
+    if dtype.lower().startswith('int'):   # numpy or nullable (Int64)
+        return 'integer'
+    return 'numeric'
+
+
+def has_kind(dtype, kind):
+    """Whether a column dtype is of the given kind."""
+    if kind == 'label':
+        return (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+                or isinstance(dtype, pd.CategoricalDtype))
+    if kind == 'datetime':
+        return pd.api.types.is_datetime64_any_dtype(dtype)
+    if pd.api.types.is_bool_dtype(dtype):
+        return False
+    if kind == 'integer':
+        return pd.api.types.is_integer_dtype(dtype)
+    return pd.api.types.is_numeric_dtype(dtype)
+
+
+def _result(check, columns, rule, rows, failed, example=None):
+    return {
+        'check': check, 'columns': ', '.join(columns) if columns else '*', 'rule': rule,
+        'rows': rows, 'failed': int(failed), 'example': example,
+    }
+
+
+def _mask_result(check, columns, rule, df, mask):
+    """Result of a row mask of failures, with the first failing value."""
+    mask = np.asarray(mask, dtype=bool)
+    example = None
+    if mask.any():
+        values = df[columns].iloc[int(mask.argmax())].tolist()
+        example = repr(values[0] if len(columns) == 1 else tuple(values))
+    return _result(check, columns, rule, len(df), mask.sum(), example)
+
+
+def validate(df, table, rules=None):
+    """
+    Run the dtype checks and ``rules`` (RULES[table] by default) on ``df``.
+    Returns one row per check (REPORT_COLUMNS); ``ok`` is False where rows
+    fail or a column is missing.
+    """
+    rules = RULES.get(table, {}) if rules is None else rules
+    n = len(df)
+    results = []
+
+    # Dtypes of the storage schema
+    for column, dtype in SCHEMAS.get(table, {}).items():
+        kind = dtype_kind(dtype)
+        if column in df.columns:
+            ok = has_kind(df[column].dtype, kind)
+            results.append(_result('dtype', [column], kind, n, 0 if ok else n,
+                                   None if ok else str(df[column].dtype)))
+
+    # (check, columns, rule, failure mask function, arguments)
+    checks = []
+    for column in rules.get('not_null', []):
+        checks.append(('not_null', [column], 'no missing values', _null, (column,)))
+    for columns in rules.get('unique', []):
+        checks.append(('unique', columns, 'no duplicates', _duplicated, (columns,)))
+    for column, pattern in rules.get('pattern', {}).items():
+        checks.append(('pattern', [column], pattern, _no_match, (column, pattern)))
+    for column, (low, high) in rules.get('range', {}).items():
+        rule = f"[{'-inf' if low is None else low}, {'inf' if high is None else high}]"
+        checks.append(('range', [column], rule, _out_of_range, (column, low, high)))
+    for columns, total in rules.get('sum', []):
+        checks.append(('sum', columns, f'= {total}', _wrong_sum, (columns, total)))
+
+    for check, columns, rule, failures, args in checks:
+        missing = [c for c in columns or [] if c not in df.columns]
+        if missing:
+            results.append(_result('column', missing, 'present', n, n))
+        else:
+            results.append(_mask_result(check, columns or list(df.columns), rule, df, failures(df, *args)))
+
+    report = pd.DataFrame(results, columns=REPORT_COLUMNS[1:-1])
+    report.insert(0, 'table', table)
+    report['ok'] = report['failed'] == 0
+    return report
+
+
+def _null(df, column):
+    return df[column].isna().to_numpy()
+
+
+def _duplicated(df, columns):
+    return df.duplicated(subset=columns, keep='first').to_numpy()
+
+
+def _no_match(df, column, pattern):
+    # Missing values are left to the not_null checks
+    return (~df[column].astype('string').str.fullmatch(pattern)).fillna(False).to_numpy(dtype=bool)
+
+
+def _out_of_range(df, column, low, high):
+    values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+    fails = np.zeros(len(values), dtype=bool)
+    if low is not None:
+        fails |= values < low
+    if high is not None:
+        fails |= values > high
+    return fails
+
+
+def _wrong_sum(df, columns, total, tolerance=1e-6):
+    values = df[columns].to_numpy(dtype=float)
+    complete = ~np.isnan(values).any(axis=1)
+    return complete & (np.abs(values.sum(axis=1) - total) > tolerance)
+
+
+def check_tables(frames, strict=False):
+    """
+    Validate every {table: frame} and return the combined report.
+    With ``strict``, raise ValueError listing the failed checks.
+    """
+    report = pd.concat([validate(df, table) for table, df in frames.items()], ignore_index=True)
+    failed = report[~report['ok']]
+    if strict and len(failed):
+        raise ValueError(f"{len(failed)} validation checks failed:\n{failed.to_string(index=False)}")
+    return report
+
+
+def summary(report):
+    """Failed checks as a table, or a one-line all clear."""
+    failed = report[~report['ok']]
+    if failed.empty:
+        return f"All {len(report)} validation checks passed"
+    return f"{len(failed)} of {len(report)} validation checks failed:\n" \
+           f"{failed.drop(columns='ok').to_string(index=False)}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--directory', default='cleaned_data')
+    parser.add_argument('--ranked', default=RANKED_PATH)
+    parser.add_argument('--analytic', default=ANALYTIC_PATH)
+    parser.add_argument('--output-dir', default=RESULT_DIR)
+    parser.add_argument('--strict', action='store_true', help='Exit with an error if a check fails')
+    args = parser.parse_args()
+
+    frames = {
+        table: read_table(table, directory=args.directory)
+        for table in ['author_clean', 'data_2019_clean', 'institution_2019_clean', 'ranking_clean']
+    }
+    if os.path.exists(args.ranked):
+        frames['ranked_institution'] = pd.read_csv(args.ranked, sep='|', dtype={'final_rank': str})
+    if os.path.exists(args.analytic):
+        frames['analytic_table'] = pd.read_parquet(args.analytic)
+    report = check_tables(frames)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    report.to_csv(os.path.join(args.output_dir, 'cleaned_tables.csv'), index=False)
+    print(summary(report))
+    if args.strict and not report['ok'].all():
+        raise SystemExit(1)